@@ -0,0 +1,7 @@
+##
+# @file bench/__init__.py
+# @brief Mess- und Lastskripte für das Chatprogramm.
+#
+# Aufruf jeweils aus dem Projektverzeichnis, z. B.:
+# python3 -m bench.discovery
+##
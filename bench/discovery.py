@@ -0,0 +1,130 @@
+##
+# @file bench/discovery.py
+# @brief Vergleich der Discovery-Engines (Thread pro Datagramm vs. asyncio).
+#
+# Simuliert einen JOIN/WHO-Sturm von N Clients auf 127.0.0.1 und misst
+# Bearbeitungsdauer, Spitzenanzahl an Threads und empfangene Antworten.
+#
+# Aufruf: python3 -m bench.discovery [--clients 200] [--engine thread asyncio]
+##
+
+import argparse
+import contextlib
+import os
+import socket
+import threading
+import time
+
+from discovery import DiscoveryService, ENGINES
+
+##
+# @class CountingDiscoveryService
+# @brief DiscoveryService, der die Anzahl verarbeiteter Anfragen mitzählt.
+class CountingDiscoveryService(DiscoveryService):
+    def __init__(self, port=0):
+        super().__init__(port)
+        self.handled = 0
+        self.count_lock = threading.Lock()
+
+    def create_socket(self):
+        sock = super().create_socket()
+        # Großer Empfangspuffer, damit der Sturm nicht schon im Kernel verworfen wird
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        return sock
+
+    def handle_request(self, data, addr):
+        super().handle_request(data, addr)
+        with self.count_lock:
+            self.handled += 1
+
+##
+# @brief Zählt alle Datagramme, die auf dem Empfangs-Socket ankommen.
+# @param sock Gebundener UDP-Socket
+# @param counter Liste [Anzahl Datagramme, Anzahl Bytes]
+def drain(sock, counter):
+    while True:
+        try:
+            data, _ = sock.recvfrom(65535)
+        except OSError:
+            return
+        counter[0] += 1
+        counter[1] += len(data)
+
+##
+# @brief Führt einen JOIN/WHO-Sturm gegen eine Engine aus.
+# @param engine "thread" oder "asyncio"
+# @param clients Anzahl simulierter Clients
+# @param timeout Maximale Wartezeit in Sekunden
+# @param delta True: Clients melden im JOIN Delta-Fähigkeit an
+# @return Dictionary mit Messwerten
+def run_storm(engine, clients, timeout=30.0, delta=False):
+    service = CountingDiscoveryService(0)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server = threading.Thread(target=service.run, args=(engine,), daemon=True)
+        server.start()
+        while service.sock is None or (engine == "asyncio" and service.transport is None):
+            time.sleep(0.01)
+
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        receiver.bind(("127.0.0.1", 0))
+        recv_port = receiver.getsockname()[1]
+        received = [0, 0]
+        threading.Thread(target=drain, args=(receiver, received), daemon=True).start()
+
+        peak_threads = [threading.active_count()]
+        sampling = [True]
+
+        def sample():
+            while sampling[0]:
+                peak_threads[0] = max(peak_threads[0], threading.active_count())
+                time.sleep(0.001)
+        threading.Thread(target=sample, daemon=True).start()
+
+        target = ("127.0.0.1", service.port)
+        caps = " delta" if delta else ""
+        start = time.perf_counter()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            for i in range(clients):
+                sender.sendto(f"JOIN user{i} {6000 + i} {recv_port}{caps}".encode(), target)
+                receiver.sendto(b"WHO", target)
+        deadline = start + timeout
+        while service.handled < 2 * clients and time.perf_counter() < deadline:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        time.sleep(0.5)  # Nachzügler-Antworten abwarten
+        sampling[0] = False
+
+        service.stop()
+        server.join(timeout=2)
+        receiver.close()
+
+    return {
+        "engine": engine,
+        "clients": clients,
+        "handled": service.handled,
+        "seconds": elapsed,
+        "requests_per_s": service.handled / elapsed if elapsed else 0.0,
+        "peak_threads": peak_threads[0],
+        "replies": received[0],
+        "reply_bytes": received[1],
+    }
+
+##
+# @brief Einstiegspunkt: misst alle gewählten Engines und gibt eine Tabelle aus.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200, help="Anzahl simulierter Clients")
+    parser.add_argument("--engine", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--delta", action="store_true", help="Clients fordern JOINED/LEFT-Deltas an")
+    args = parser.parse_args()
+
+    print(f"{'Engine':<8} {'Anfragen':>9} {'Dauer [s]':>10} {'Anfr./s':>9} {'Threads':>8} "
+          f"{'Antworten':>10} {'Bytes':>10}")
+    for engine in args.engine:
+        r = run_storm(engine, args.clients, delta=args.delta)
+        print(f"{r['engine']:<8} {r['handled']:>9} {r['seconds']:>10.3f} "
+              f"{r['requests_per_s']:>9.0f} {r['peak_threads']:>8} {r['replies']:>10} {r['reply_bytes']:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+##
+# @file bench/imagestore.py
+# @brief Misst den Bildspeicher (imagestore.py) mit vielen Bildern.
+#
+# Legt N kleine Bilder (Zufallsdaten mit PNG-Signatur, ein Teil doppelt) in
+# einem temporären Verzeichnis ab und misst:
+#   add      Ablegen inkl. Hash und Journal (pro Bild)
+#   open     Öffnen des Speichers (Journal einlesen)
+#   get      Suche nach Hash (pro Abfrage)
+#   recent   die 50 zuletzt benutzten Bilder
+# Zum Vergleich "flat": dieselbe Auswahl in einem flachen Ordner per listdir + stat.
+#
+# Aufruf: python3 -m bench.imagestore [--images 20000] [--size 2048]
+##
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from imagestore import ImageStore
+
+PNG = b"\x89PNG\r\n\x1a\n"
+
+##
+# @brief Einstiegspunkt: misst alle Schritte und gibt eine Tabelle aus.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=20000, help="Anzahl Bilder")
+    parser.add_argument("--size", type=int, default=2048, help="Bytes pro Bild")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Anteil doppelt empfangener Bilder")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="imagestore-")
+    try:
+        blobs = [PNG + os.urandom(args.size) for _ in range(args.images)]
+        blobs += random.sample(blobs, int(args.images * args.duplicates))
+
+        store = ImageStore(os.path.join(root, "store"), max_bytes=0)
+        start = time.perf_counter()
+        for blob in blobs:
+            store.add(blob)
+        add = (time.perf_counter() - start) / len(blobs)
+        store.close()
+        print(f"{len(blobs)} Bilder empfangen, {len(store)} gespeichert "
+              f"({store.total / 2**20:.1f} MiB, Duplikate nicht doppelt)")
+
+        start = time.perf_counter()
+        store = ImageStore(os.path.join(root, "store"), max_bytes=0)
+        opened = time.perf_counter() - start
+
+        digests = random.sample(list(store.entries), min(1000, len(store)))
+        start = time.perf_counter()
+        for digest in digests:
+            store.get(digest)
+        get = (time.perf_counter() - start) / len(digests)
+
+        start = time.perf_counter()
+        store.recent(50)
+        recent = time.perf_counter() - start
+        store.close()
+
+        # Vergleich: flacher Ordner wie bisher (img_<Zeit>.png)
+        flat = os.path.join(root, "flat")
+        os.makedirs(flat)
+        for i, blob in enumerate(blobs):
+            with open(os.path.join(flat, f"img_{i}.png"), "wb") as f:
+                f.write(blob)
+        start = time.perf_counter()
+        names = os.listdir(flat)
+        sorted(names, key=lambda name: os.stat(os.path.join(flat, name)).st_mtime)[-50:]
+        flat_recent = time.perf_counter() - start
+
+        print(f"{'add':<8} {add * 1e6:>10.1f} µs/Bild")
+        print(f"{'open':<8} {opened * 1e3:>10.1f} ms")
+        print(f"{'get':<8} {get * 1e6:>10.2f} µs")
+        print(f"{'recent':<8} {recent * 1e3:>10.1f} ms   (flat: listdir + stat {flat_recent * 1e3:.1f} ms)")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    main()
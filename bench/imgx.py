@@ -0,0 +1,155 @@
+##
+# @file bench/imgx.py
+# @brief Misst, was eine Bildübertragung per IMGX auf der Leitung kostet.
+#
+# Ein Empfänger mit eigenem Bildspeicher (temporäres Verzeichnis) läuft im
+# selben Prozess. Übertragen wird ein Bild aus Zufallsdaten:
+#   neu           erste Übertragung
+#   wiederholt    dasselbe Bild noch einmal (Empfänger antwortet HAVE)
+#   abgebrochen   Verbindung reißt nach --cut der Daten ab, zweiter Versuch setzt fort
+#   beschädigt    ein Block kommt verfälscht an, zweiter Versuch setzt ab diesem Block fort
+# Zum Vergleich "IMG (alt)": das alte Verfahren sendet jedes Mal und nach einem
+# Abbruch alles erneut (erster Versuch wie gemessen + komplettes Bild).
+#
+# Danach geht ein Bild (als Datei) an --recipients Empfänger: nacheinander, wie
+# bisher von Hand, gegen distribute() mit einmal gelesenem PreparedImage.
+#
+# Aufruf: python3 -m bench.imgx [--size-mb 20] [--cut 0.6] [--recipients 8]
+##
+
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import imagetransfer
+from imagestore import ImageStore
+from imagetransfer import distribute, receive_chunked, send_chunked, PreparedImage
+from network import recv_line
+
+##
+# @class FaultySocket
+# @brief Socket-Hülle für den Empfänger, die nach limit Bytes abbricht oder ein Byte verfälscht.
+#
+# Merkt sich außerdem den Offset aus der RESUME-Antwort des Empfängers.
+class FaultySocket:
+    def __init__(self, sock, resumes, limit=None, corrupt=False):
+        self.sock = sock
+        self.resumes = resumes
+        self.limit = limit
+        self.corrupt = corrupt
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def recv_into(self, view):
+        count = self.sock.recv_into(view)
+        if self.limit is not None and count >= self.limit:
+            if not self.corrupt:
+                raise ConnectionResetError("Verbindung abgebrochen (simuliert)")
+            view[self.limit] ^= 0xFF
+            self.limit = None
+        elif self.limit is not None:
+            self.limit -= count
+        return count
+
+    def sendall(self, data):
+        if data.startswith(b"RESUME"):
+            self.resumes.append(int(data.split()[1]))
+        self.sock.sendall(data)
+
+##
+# @brief Startet den Empfänger.
+# @param store Bildspeicher
+# @param faults Liste von (limit, corrupt) für die nächsten Verbindungen
+# @param resumes Liste, an die jeder RESUME-Offset angehängt wird
+# @return Port
+def start_receiver(store, faults, resumes):
+    server = socket.socket()
+    # Kleines Empfangsfenster wie auf einer echten Leitung; sonst nimmt Loopback das ganze Bild auf einmal an
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, imagetransfer.CHUNK_SIZE)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+
+    def handle(conn):
+        with conn:
+            try:
+                header, rest = recv_line(conn, conn.recv(1024))
+                sock = FaultySocket(conn, resumes, *(faults.pop(0) if faults else ()))
+                receive_chunked(sock, header, rest, store)
+            except (OSError, ValueError):
+                pass  # Abbruch bzw. fehlerhafter Block: Sender versucht es erneut
+
+    def accept_loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server.getsockname()[1]
+
+##
+# @brief Einstiegspunkt: misst alle Fälle und gibt eine Tabelle aus.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=20, help="Bildgröße in MiB")
+    parser.add_argument("--cut", type=float, default=0.6, help="Anteil, nach dem die Verbindung abreißt")
+    parser.add_argument("--recipients", type=int, default=8, help="Empfänger beim Senden an alle")
+    args = parser.parse_args()
+    imagetransfer.RETRY_DELAY = 0  # Wartezeit vor dem zweiten Versuch nicht mitmessen
+
+    root = tempfile.mkdtemp(prefix="imgx-")
+    try:
+        size = int(args.size_mb * 2**20)
+        faults, resumes = [], []
+        store = ImageStore(root, max_bytes=0)
+        port = start_receiver(store, faults, resumes)
+        cut = int(size * args.cut)
+        image = None
+
+        print(f"Bild: {size / 2**20:.1f} MiB\n")
+        print(f"{'Fall':<12} {'Ergebnis':<8} {'Leitung [MiB]':>14} {'IMG alt [MiB]':>14} {'Zeit [ms]':>10}")
+        for case, fault in (("neu", None), ("wiederholt", None), ("abgebrochen", (cut, False)),
+                            ("beschädigt", (cut, True))):
+            image = os.urandom(size) if case in ("neu", "abgebrochen", "beschädigt") else image
+            if fault:
+                faults.append(fault)
+            del resumes[:]
+            start = time.perf_counter()
+            result, sent = send_chunked("127.0.0.1", port, "bench", image, "bild.png")
+            elapsed = time.perf_counter() - start
+            # Bytes des letzten Versuchs ab dem RESUME-Offset; alles davor ging im ersten Versuch raus
+            first = sent - (size - resumes[-1]) if len(resumes) > 1 else 0
+            print(f"{case:<12} {result:<8} {sent / 2**20:>14.2f} {(first + size) / 2**20:>14.2f} "
+                  f"{elapsed * 1000:>10.1f}")
+        store.close()
+
+        # An alle: jeder Empfänger mit eigenem Bildspeicher, einmal nacheinander, einmal verteilt
+        path = os.path.join(root, "bild.png")
+        timings = []
+        for mode in ("nacheinander", "distribute"):
+            with open(path, "wb") as f:
+                f.write(os.urandom(size))
+            targets = {}
+            for i in range(args.recipients):
+                receiver = ImageStore(os.path.join(root, f"{mode}-{i}"), max_bytes=0)
+                targets[f"peer{i}"] = ("127.0.0.1", start_receiver(receiver, [], []))
+            start = time.perf_counter()
+            if mode == "nacheinander":
+                for ip, port in targets.values():
+                    send_chunked(ip, port, "bench", path, "bild.png")
+            else:
+                with PreparedImage(path) as image:
+                    results, failures = distribute(
+                        targets, lambda name, address: send_chunked(*address, "bench", image, "bild.png")[0])
+                assert not failures and len(results) == len(targets), failures
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"\nAn {args.recipients} Empfänger: nacheinander {timings[0]:.1f} ms, distribute {timings[1]:.1f} ms")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+##
+# @file bench/loadgen.py
+# @brief Lastgenerator für Discovery und Peer-Nachrichten auf 127.0.0.1.
+#
+# Startet einen DiscoveryService in einem eigenen Prozess und N simulierte
+# Clients ohne Oberfläche, verteilt auf mehrere Prozesse (je ein asyncio-Loop).
+# Jeder Client meldet sich per JOIN (delta) an, führt seine Nutzerliste mit
+# roster.Roster und erzeugt mit einstellbaren Raten (Poisson-verteilt):
+# - WHO-Anfragen (Latenz bis KNOWNUSERS)
+# - Churn: LEAVE und erneutes JOIN (Latenz bis vollständigem SNAPSHOT)
+# - MSG an zufällige Peers über eine gerahmte, wiederverwendete TCP-Verbindung
+# - IMG an zufällige Peers über eine neue TCP-Verbindung
+#
+# Ausgabe ist ein JSON-Dokument mit Durchsatz, Latenzen (p50/p95/p99),
+# Verlust (Datagramme ohne Bearbeitung, Anfragen ohne Antwort, verlorene
+# Nachrichten) und CPU-Zeit/Speicher je Prozess, damit Läufe vor und nach
+# einer Änderung verglichen werden können.
+#
+# Aufruf: python3 -m bench.loadgen [--clients 50] [--duration 10] [--output lauf.json]
+##
+
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import threading
+import time
+
+import protocol
+from bench.discovery import CountingDiscoveryService
+from discovery import ENGINES
+from network import FRAME_HEADER
+from roster import Roster, DELTA_CAPABILITY
+from protocol import PROTOCOL_V2_CAPABILITY
+
+##
+# @var REPLY_TIMEOUT
+# @brief Sekunden, nach denen eine Discovery-Anfrage ohne Antwort als verloren gilt.
+REPLY_TIMEOUT = 1.0
+
+##
+# @var SETTLE_TIME
+# @brief Sekunden nach dem Lastende, in denen noch Antworten und Nachrichten eingesammelt werden.
+SETTLE_TIME = 1.0
+
+##
+# @brief Verdichtet Latenzen zu Kennzahlen.
+# @param samples Latenzen in Sekunden
+# @return Dictionary mit count, p50, p95, p99, max (Millisekunden)
+def summarize(samples):
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {"count": len(ordered), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99),
+            "max": round(ordered[-1] * 1000, 3)}
+
+##
+# @brief CPU-Zeit und Spitzenspeicher des aktuellen Prozesses.
+# @param name Bezeichnung des Prozesses
+# @param wall Laufzeit des Prozesses in Sekunden
+# @return Dictionary für die JSON-Ausgabe
+def process_usage(name, wall):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = usage.ru_utime + usage.ru_stime
+    return {"name": name, "pid": os.getpid(), "cpu_user_s": round(usage.ru_utime, 3),
+            "cpu_system_s": round(usage.ru_stime, 3), "cpu_percent": round(100 * cpu / wall, 1) if wall else None,
+            "max_rss_kb": usage.ru_maxrss}
+
+##
+# @brief Prozess: betreibt den Discovery-Service bis zum Stoppsignal.
+# @param engine "thread" oder "asyncio"
+# @param ready Queue, über die der gebundene Port gemeldet wird
+# @param stop Event zum Beenden
+# @param results Queue für die Messwerte
+def discovery_process(engine, ready, stop, results):
+    started = time.monotonic()
+    service = CountingDiscoveryService(0)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server = threading.Thread(target=service.run, args=(engine,), daemon=True)
+        server.start()
+        while service.sock is None or (engine == "asyncio" and service.transport is None):
+            time.sleep(0.01)
+        ready.put(service.port)
+        stop.wait()
+        service.stop()
+        server.join(timeout=2)
+    results.put(("discovery", {"handled": service.handled,
+                               "usage": process_usage("discovery", time.monotonic() - started)}))
+
+##
+# @class ClientStats
+# @brief Zähler und Latenzen aller Clients eines Prozesses.
+class ClientStats:
+    def __init__(self):
+        self.udp_sent = 0
+        self.join_latency = []
+        self.who_latency = []
+        self.replies_lost = 0
+        self.msg_sent = 0
+        self.msg_failed = 0
+        self.msg_received = 0
+        self.msg_latency = []
+        self.img_sent = 0
+        self.img_failed = 0
+        self.img_received = 0
+        self.img_bytes = 0
+        self.img_latency = []
+
+    ##
+    # @brief Wandelt die Werte in ein picklebares Dictionary um.
+    def as_dict(self):
+        return dict(vars(self))
+
+##
+# @class ClientProtocol
+# @brief asyncio-Datagramm-Protokoll eines simulierten Clients.
+class ClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client.handle_datagram(data)
+
+##
+# @class LoadClient
+# @brief Simulierter Client ohne Oberfläche.
+#
+# Spricht dasselbe Protokoll wie CLI und GUI (JOIN mit Fähigkeiten, Roster,
+# gerahmte MSG, IMG mit Kopfzeile) und misst dabei alle Latenzen.
+class LoadClient:
+    ##
+    # @brief Konstruktor.
+    # @param handle Name des Clients
+    # @param discovery (IP, Port) des Discovery-Service
+    # @param options Dictionary der Kommandozeilenoptionen
+    # @param stats Gemeinsame ClientStats des Prozesses
+    # @param image Nutzdaten für IMG
+    def __init__(self, handle, discovery, options, stats, image):
+        self.handle = handle
+        self.discovery = discovery
+        self.options = options
+        self.stats = stats
+        self.image = image
+        self.caps = [DELTA_CAPABILITY] + ([PROTOCOL_V2_CAPABILITY] if options["v2"] else [])
+        self.roster = Roster(handle, {}, {})
+        self.pending = {}  # "join"/"who" → Sendezeitpunkt
+        self.connections = {}  # Port → StreamWriter (gerahmte MSG-Verbindung)
+        self.seq = 0
+        self.transport = None
+        self.server = None
+        self.tcp_port = None
+
+    ##
+    # @brief Öffnet TCP-Server und UDP-Socket und meldet den Client an.
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.on_connection, "127.0.0.1", 0)
+        self.tcp_port = self.server.sockets[0].getsockname()[1]
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: ClientProtocol(self), local_addr=("127.0.0.1", 0))
+        self.join()
+
+    ##
+    # @brief Schickt eine Anfrage an den Discovery-Service.
+    # @param message Textnachricht
+    def send_udp(self, message):
+        self.transport.sendto(message.encode(), self.discovery)
+        self.stats.udp_sent += 1
+
+    ##
+    # @brief Merkt sich eine ausstehende Antwort; eine zu alte zählt als verloren.
+    # @param kind "join" oder "who"
+    def expect(self, kind):
+        sent = self.pending.get(kind)
+        if sent is not None and time.monotonic() - sent > REPLY_TIMEOUT:
+            self.stats.replies_lost += 1
+        self.pending[kind] = time.monotonic()
+
+    ##
+    # @brief Vermerkt eine Antwort und deren Latenz.
+    # @param kind "join" oder "who"
+    # @param samples Liste, an die die Latenz angehängt wird
+    def answered(self, kind, samples):
+        sent = self.pending.pop(kind, None)
+        if sent is not None:
+            samples.append(time.monotonic() - sent)
+
+    def join(self):
+        udp_port = self.transport.get_extra_info("sockname")[1]
+        self.expect("join")
+        self.send_udp(f"JOIN {self.handle} {self.tcp_port} {udp_port} {' '.join(self.caps)}")
+
+    ##
+    # @brief Wertet eine Discovery-Antwort aus.
+    # @param data Empfangenes Datagramm
+    def handle_datagram(self, data):
+        message = protocol.parse(data)
+        if message is None:
+            return
+        if message[0] == "KNOWNUSERS":
+            # Delta-Clients bekommen KNOWNUSERS nur als Antwort auf WHO
+            self.answered("who", self.stats.who_latency)
+            return
+        result = self.roster.handle_message(message)
+        if result is None:
+            return
+        event = result[0]
+        if event == "snapshot":
+            self.answered("join", self.stats.join_latency)
+        elif event == "gap":
+            self.send_udp("SYNC")
+        elif event == "rejoin":
+            self.join()
+
+    ##
+    # @brief Wartet eine Poisson-verteilte Zeit für die angegebene Rate.
+    # @param rate Ereignisse pro Sekunde
+    # @param deadline Lastende (time.monotonic())
+    # @return False, wenn das Lastende erreicht ist
+    async def pause(self, rate, deadline):
+        delay = random.expovariate(rate)
+        if time.monotonic() + delay >= deadline:
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+    async def who_loop(self, deadline):
+        while await self.pause(self.options["who_rate"], deadline):
+            self.expect("who")
+            self.send_udp("WHO")
+
+    async def churn_loop(self, deadline):
+        while await self.pause(self.options["churn_rate"], deadline):
+            self.send_udp(f"LEAVE {self.handle}")
+            await asyncio.sleep(0.05)
+            self.join()
+
+    ##
+    # @brief Wählt einen zufälligen anderen Teilnehmer aus der eigenen Nutzerliste.
+    # @return (Name, Port) oder None
+    def random_peer(self):
+        users = self.roster.users
+        if not users:
+            return None
+        name = random.choice(list(users))
+        return name, users[name][1]
+
+    async def msg_loop(self, deadline):
+        while await self.pause(self.options["msg_rate"], deadline):
+            peer = self.random_peer()
+            if peer is None:
+                continue
+            name, port = peer
+            self.seq += 1
+            text = f"{self.seq} {time.monotonic_ns()}"
+            payload = protocol.encode_msg(self.handle, text, self.roster.supports(name, PROTOCOL_V2_CAPABILITY))
+            try:
+                writer = self.connections.get(port)
+                if writer is None or writer.is_closing():
+                    _, writer = await asyncio.open_connection("127.0.0.1", port)
+                    self.connections[port] = writer
+                writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+                await writer.drain()
+                self.stats.msg_sent += 1
+            except OSError:
+                self.connections.pop(port, None)
+                self.stats.msg_failed += 1
+
+    async def img_loop(self, deadline):
+        while await self.pause(self.options["img_rate"], deadline):
+            peer = self.random_peer()
+            if peer is None:
+                continue
+            header = f"IMG {self.handle} {len(self.image)} lg-{time.monotonic_ns()}.bin\n".encode()
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", peer[1])
+                writer.write(header)
+                writer.write(self.image)
+                await writer.drain()
+                writer.close()
+                self.stats.img_sent += 1
+            except OSError:
+                self.stats.img_failed += 1
+
+    ##
+    # @brief Nimmt eine TCP-Verbindung an: gerahmte MSG-Frames oder ein IMG.
+    async def on_connection(self, reader, writer):
+        try:
+            first = await reader.readexactly(1)
+            if first == b"\x00":
+                header = first + await reader.readexactly(FRAME_HEADER.size - 1)
+                while True:
+                    (length,) = FRAME_HEADER.unpack(header)
+                    message = protocol.parse(await reader.readexactly(length))
+                    if message is not None and message[0] == "MSG":
+                        sent_ns = int(message[2].split()[1])
+                        self.stats.msg_received += 1
+                        self.stats.msg_latency.append((time.monotonic_ns() - sent_ns) / 1e9)
+                    header = await reader.readexactly(FRAME_HEADER.size)
+            line = first + await reader.readline()
+            _, _, size, name = line.decode().split()
+            await reader.readexactly(int(size))
+            sent_ns = int(name[3:].split(".")[0])
+            self.stats.img_received += 1
+            self.stats.img_bytes += int(size)
+            self.stats.img_latency.append((time.monotonic_ns() - sent_ns) / 1e9)
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, OSError, ValueError):
+            pass  # Gegenseite hat geschlossen oder der Lauf endet
+        finally:
+            writer.close()
+
+    ##
+    # @brief Führt alle Lastschleifen bis zum Lastende aus.
+    # @param deadline Lastende (time.monotonic())
+    async def run(self, deadline):
+        loops = [(self.who_loop, "who_rate"), (self.churn_loop, "churn_rate"),
+                 (self.msg_loop, "msg_rate"), (self.img_loop, "img_rate")]
+        await asyncio.gather(*(loop(deadline) for loop, rate in loops if self.options[rate] > 0))
+
+    ##
+    # @brief Meldet den Client ab und schließt alle Verbindungen.
+    def close(self):
+        self.send_udp(f"LEAVE {self.handle}")
+        for writer in self.connections.values():
+            writer.close()
+        self.server.close()
+        self.transport.close()
+
+##
+# @brief Betreibt alle Clients eines Prozesses.
+async def run_clients(index, count, discovery_port, options):
+    stats = ClientStats()
+    image = os.urandom(options["img_size"])
+    clients = [LoadClient(f"lg{index}x{i}", ("127.0.0.1", discovery_port), options, stats, image)
+               for i in range(count)]
+    for client in clients:
+        await client.start()
+    deadline = time.monotonic() + options["duration"]
+    await asyncio.gather(*(client.run(deadline) for client in clients))
+    await asyncio.sleep(SETTLE_TIME)
+    for client in clients:
+        stats.replies_lost += len(client.pending)
+        client.close()
+    # Empfänger sehen das Verbindungsende und beenden ihre Leseschleifen
+    await asyncio.sleep(0.2)
+    return stats
+
+##
+# @brief Prozess: betreibt count simulierte Clients.
+# @param index Nummer des Prozesses
+# @param count Anzahl der Clients in diesem Prozess
+# @param discovery_port Port des Discovery-Service
+# @param options Dictionary der Kommandozeilenoptionen
+# @param results Queue für die Messwerte
+def client_process(index, count, discovery_port, options, results):
+    started = time.monotonic()
+    stats = asyncio.run(run_clients(index, count, discovery_port, options))
+    results.put(("clients", {"stats": stats.as_dict(),
+                             "usage": process_usage(f"clients-{index}", time.monotonic() - started)}))
+
+##
+# @brief Führt einen kompletten Lastlauf aus.
+# @param options Dictionary der Kommandozeilenoptionen
+# @return Ergebnis als Dictionary (JSON-fähig)
+def run_load(options):
+    ready, results, stop = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Event()
+    discovery = multiprocessing.Process(target=discovery_process, args=(options["engine"], ready, stop, results))
+    discovery.start()
+    port = ready.get(timeout=10)
+
+    procs = max(1, min(options["procs"], options["clients"]))
+    share = [options["clients"] // procs + (1 if i < options["clients"] % procs else 0) for i in range(procs)]
+    clients = [multiprocessing.Process(target=client_process, args=(i, n, port, options, results))
+               for i, n in enumerate(share)]
+    started = time.monotonic()
+    for process in clients:
+        process.start()
+
+    merged, usage = ClientStats().as_dict(), []
+    for _ in clients:
+        _, result = results.get()
+        usage.append(result["usage"])
+        for key, value in result["stats"].items():
+            merged[key] += value
+    elapsed = time.monotonic() - started
+    for process in clients:
+        process.join()
+    stop.set()
+    _, result = results.get(timeout=10)
+    usage.insert(0, result["usage"])
+    discovery.join()
+
+    handled = result["handled"]
+    duration = options["duration"]
+    delivered = merged["msg_received"]
+    return {
+        "config": options,
+        "wall_s": round(elapsed, 3),
+        "discovery": {
+            "datagrams_sent": merged["udp_sent"],
+            "datagrams_handled": handled,
+            "datagram_loss": round(1 - handled / merged["udp_sent"], 4) if merged["udp_sent"] else 0.0,
+            "requests_per_s": round(handled / duration, 1),
+            "replies_lost": merged["replies_lost"],
+            "join_latency_ms": summarize(merged["join_latency"]),
+            "who_latency_ms": summarize(merged["who_latency"]),
+        },
+        "messages": {
+            "sent": merged["msg_sent"],
+            "failed": merged["msg_failed"],
+            "received": delivered,
+            "loss": round(1 - delivered / merged["msg_sent"], 4) if merged["msg_sent"] else 0.0,
+            "per_s": round(delivered / duration, 1),
+            "latency_ms": summarize(merged["msg_latency"]),
+        },
+        "images": {
+            "sent": merged["img_sent"],
+            "failed": merged["img_failed"],
+            "received": merged["img_received"],
+            "loss": round(1 - merged["img_received"] / merged["img_sent"], 4) if merged["img_sent"] else 0.0,
+            "mbytes_per_s": round(merged["img_bytes"] / duration / 1e6, 3),
+            "latency_ms": summarize(merged["img_latency"]),
+        },
+        "processes": usage,
+    }
+
+##
+# @brief Einstiegspunkt: führt einen Lastlauf aus und gibt das Ergebnis als JSON aus.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50, help="Anzahl simulierter Clients")
+    parser.add_argument("--procs", type=int, default=2, help="Anzahl Client-Prozesse")
+    parser.add_argument("--duration", type=float, default=10.0, help="Lastdauer in Sekunden")
+    parser.add_argument("--engine", choices=ENGINES, default="asyncio", help="Engine des Discovery-Service")
+    parser.add_argument("--who-rate", type=float, default=0.5, help="WHO pro Client und Sekunde")
+    parser.add_argument("--churn-rate", type=float, default=0.05, help="LEAVE/JOIN pro Client und Sekunde")
+    parser.add_argument("--msg-rate", type=float, default=2.0, help="MSG pro Client und Sekunde")
+    parser.add_argument("--img-rate", type=float, default=0.1, help="IMG pro Client und Sekunde")
+    parser.add_argument("--img-size", type=int, default=64 * 1024, help="Bildgröße in Bytes")
+    parser.add_argument("--v2", action="store_true", help="Clients melden SLCP v2 an")
+    parser.add_argument("--output", help="JSON zusätzlich in diese Datei schreiben")
+    args = parser.parse_args()
+
+    result = run_load(vars(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    sys.stdout.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
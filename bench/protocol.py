@@ -0,0 +1,116 @@
+##
+# @file bench/protocol.py
+# @brief Micro-Benchmarks des SLCP-Codecs für jeden Nachrichtentyp.
+#
+# Misst pro Nachrichtentyp die Zerlegung als Text (SLCP v1) und binär (SLCP v2)
+# mit protocol.parse() sowie zum Vergleich das frühere Vorgehen
+# "ganze Nachricht dekodieren und mit split() zerlegen". Listeneinträge werden
+# vollständig durchlaufen, damit der Generator mitgemessen wird.
+#
+# Aufruf: python3 -m bench.protocol [--entries 40] [--number 20000]
+##
+
+import argparse
+import timeit
+
+import protocol
+
+##
+# @brief Früheres Zerlegen (discovery.parse_text_request, Roster.handle_message):
+#        ganze Nachricht dekodieren, mit split() zerlegen, Einträge als Liste.
+# @param data Textnachricht (Bytes)
+# @return Tupel (Befehl, Felder ...)
+def legacy_parse(data):
+    message = data.decode().strip()
+    parts = message.split()
+    command = parts[0]
+    if command == "JOIN":
+        return command, parts[1], int(parts[2]), int(parts[3]), parts[4:]
+    if command == "SYNC":
+        return command, int(parts[1]), [int(p) for p in parts[2].split(",") if p]
+    if command in ("WHO", "REJOIN"):
+        return (command,)
+    if command in ("ALIVE", "LEAVE"):
+        return command, parts[1]
+    if command == "KNOWNUSERS":
+        return command, legacy_entries(parts[1:])
+    if command == "SNAPSHOT":
+        page, total = (int(x) for x in parts[2].split("/"))
+        return command, int(parts[1]), page, total, legacy_entries(parts[3:])
+    if command == "JOINED":
+        return command, int(parts[1]), (parts[2], parts[3], int(parts[4]))
+    if command == "LEFT":
+        return command, int(parts[1]), parts[2]
+    return tuple(message.split(maxsplit=2))
+
+def legacy_entries(parts):
+    entries = []
+    for i in range(0, len(parts), 3):
+        if i + 2 < len(parts):
+            entries.append((parts[i], parts[i + 1], int(parts[i + 2])))
+    return entries
+
+##
+# @brief Zerlegt eine Nachricht und durchläuft alle Listeneinträge.
+# @param data Nachricht (Text oder v2)
+def parse_all(data):
+    message = protocol.parse(data)
+    if message[0] in ENTRY_FIELD:
+        for _ in message[ENTRY_FIELD[message[0]]]:
+            pass
+    return message
+
+##
+# @var ENTRY_FIELD
+# @brief Position des Eintrags-Generators im Ergebnis von protocol.parse().
+ENTRY_FIELD = {"KNOWNUSERS": 1, "SNAPSHOT": 4}
+
+##
+# @brief Erzeugt Beispielnachrichten aller Typen in beiden Formaten.
+# @param entries Anzahl der Einträge in KNOWNUSERS/SNAPSHOT
+# @return Liste von (Typ, Text-Bytes, v2-Bytes)
+def sample_messages(entries):
+    records = [(f"user{i}", f"192.168.1.{i % 250 + 1}", 6000 + i, 3) for i in range(entries)]
+    text = "Hallo, wie geht's? " * 4
+    return [
+        ("JOIN", b"JOIN alice 5000 40000 delta v2",
+         protocol.encode_join("alice", 5000, 40000, ["delta", "v2"])),
+        ("ALIVE", b"ALIVE alice", protocol.encode_handle(protocol.ALIVE, "alice")),
+        ("WHO", b"WHO", protocol.encode_empty(protocol.WHO)),
+        ("SYNC", b"SYNC 42 2,3", protocol.encode_sync(42, [2, 3])),
+        ("JOINED", protocol.encode_joined(42, "bob", "192.168.1.7", 5001, 3, binary=False),
+         protocol.encode_joined(42, "bob", "192.168.1.7", 5001, 3)),
+        ("LEFT", protocol.encode_left(43, "bob", binary=False), protocol.encode_left(43, "bob")),
+        ("KNOWNUSERS", protocol.encode_pages(protocol.KNOWNUSERS, records, 65000, binary=False)[0],
+         protocol.encode_pages(protocol.KNOWNUSERS, records, 65000)[0]),
+        ("SNAPSHOT", protocol.encode_pages(protocol.SNAPSHOT, records, 65000, 42, binary=False)[0],
+         protocol.encode_pages(protocol.SNAPSHOT, records, 65000, 42)[0]),
+        ("MSG", protocol.encode_msg("alice", text, binary=False), protocol.encode_msg("alice", text)),
+    ]
+
+##
+# @brief Misst die mittlere Dauer eines Aufrufs.
+# @param func Funktion mit einem Argument
+# @param data Argument
+# @param number Anzahl Wiederholungen
+# @return Mikrosekunden pro Aufruf
+def measure(func, data, number):
+    return min(timeit.repeat(lambda: func(data), number=number, repeat=3)) / number * 1e6
+
+##
+# @brief Einstiegspunkt: misst alle Nachrichtentypen und gibt eine Tabelle aus.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=40, help="Einträge in KNOWNUSERS/SNAPSHOT")
+    parser.add_argument("--number", type=int, default=20000, help="Wiederholungen pro Messung")
+    args = parser.parse_args()
+
+    print(f"{'Typ':<11} {'Text B':>7} {'v2 B':>6} {'alt [µs]':>9} {'Text [µs]':>10} {'v2 [µs]':>8}")
+    for kind, text, binary in sample_messages(args.entries):
+        legacy = measure(legacy_parse, text, args.number)
+        parsed_text = measure(parse_all, text, args.number)
+        parsed_v2 = measure(parse_all, binary, args.number)
+        print(f"{kind:<11} {len(text):>7} {len(binary):>6} {legacy:>9.2f} {parsed_text:>10.2f} {parsed_v2:>8.2f}")
+
+if __name__ == "__main__":
+    main()
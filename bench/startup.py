@@ -0,0 +1,120 @@
+##
+# @file bench/startup.py
+# @brief Misst die Kaltstart-Zeit der Einstiegspunkte mit "python -X importtime".
+#
+# Für jeden Modus wird ein frischer Interpreter gestartet, der genau das
+# importiert, was der jeweilige Start bis zur ersten Ausgabe braucht:
+#   main       main.py bis zur Auswahl CLI/GUI (inkl. Lesen der Konfiguration)
+#   cli        main.py + CLI
+#   gui        main.py + GUI (tkinter; PIL erst beim ersten Bild)
+#   discovery  Discovery-Dienst
+# Ausgegeben werden die Gesamtzeit des Interpreters (Median), die Summe der
+# Importzeiten und die teuersten Module (kumuliert, aus -X importtime).
+# Ab dem zweiten Lauf liest "main" die zwischengespeicherte Konfiguration
+# (siehe settings.py), der Median zeigt also den üblichen Start.
+#
+# Aufruf: python3 -m bench.startup [--runs 5] [--top 8] [--modes main cli]
+##
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+##
+# @var MODES
+# @brief Python-Code, den jeder Modus im frischen Interpreter ausführt.
+MODES = {
+    "main": "import os, main; main.load_config('config.toml' if os.path.exists('config.toml') else 'config.example.toml')",
+    "cli": "import main, cli",
+    "gui": "import main, chat_gui_client_verbessert",
+    "discovery": "import discovery",
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+##
+# @brief Wertet die stderr-Ausgabe von -X importtime aus.
+# @param output Text der Form "import time: self | cumulative | name"
+# @return Dictionary Modulname → (kumuliert in µs, Tiefe) und Summe aller Eigenzeiten in µs
+def parse_importtime(output):
+    modules = {}
+    total_self = 0
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|", 2)
+        total_self += int(self_us)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(cumulative), depth)
+    return modules, total_self
+
+##
+# @brief Startet einen Interpreter und misst Wandzeit und Importzeiten.
+# @param code Auszuführender Python-Code
+# @return (Sekunden, Module, Summe der Importzeiten in µs)
+def run_once(code):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    modules, total = parse_importtime(result.stderr)
+    return elapsed, modules, total
+
+##
+# @brief Misst einen Modus mehrfach.
+# @param code Auszuführender Python-Code
+# @param runs Anzahl Starts
+# @return (Median Wandzeit in ms, Median Importzeit in ms, Module des letzten Laufs)
+def measure(code, runs):
+    walls, imports = [], []
+    modules = {}
+    for _ in range(runs):
+        elapsed, modules, total = run_once(code)
+        walls.append(elapsed * 1000)
+        imports.append(total / 1000)
+    return statistics.median(walls), statistics.median(imports), modules
+
+##
+# @brief Die teuersten Importe eines Modus ohne die Module des leeren Interpreters.
+# @param modules Ergebnis von parse_importtime()
+# @param baseline Module des leeren Interpreters
+# @param top Anzahl
+# @return Liste (kumuliert in µs, Tiefe, Name), absteigend
+def heaviest(modules, baseline, top):
+    ranked = [(cumulative, depth, name) for name, (cumulative, depth) in modules.items() if name not in baseline]
+    return sorted(ranked, reverse=True)[:top]
+
+##
+# @brief Einstiegspunkt: misst alle gewählten Modi und gibt eine Tabelle aus.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="Starts pro Modus")
+    parser.add_argument("--top", type=int, default=8, help="Anzahl der teuersten Module pro Modus")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    baseline, _, baseline_modules = measure("pass", args.runs)
+    print(f"Leerer Interpreter: {baseline:.1f} ms\n")
+    print(f"{'Modus':<10} {'Start [ms]':>11} {'Importe [ms]':>13}")
+    details = []
+    for mode in args.modes:
+        try:
+            wall, imported, modules = measure(MODES[mode], args.runs)
+        except RuntimeError as e:
+            print(f"{mode:<10} nicht messbar: {e}")
+            continue
+        print(f"{mode:<10} {wall:>11.1f} {imported:>13.1f}")
+        details.append((mode, heaviest(modules, baseline_modules, args.top)))
+
+    for mode, modules in details:
+        print(f"\n{mode}: teuerste Importe (kumuliert, eingerückt nach Tiefe)")
+        for cumulative, depth, name in modules:
+            print(f"  {cumulative / 1000:>7.1f} ms  {'  ' * depth}{name}")
+
+if __name__ == "__main__":
+    main()
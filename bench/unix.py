@@ -0,0 +1,147 @@
+##
+# @file bench/unix.py
+# @brief Vergleicht TCP-Loopback und Unix-Domain-Sockets für Nachrichten zwischen lokalen Clients.
+#
+# Gemessen wird pro Nachricht (Frame wie im ConnectionPool):
+#   rtt        Round-Trip auf einer bestehenden Verbindung (Frame hin, Frame zurück)
+#   connect    Verbindungsaufbau + Frame + Antwort + Schließen (Einmal-Verbindung)
+#   pool       connection_pool.send() an einen Empfänger, bis alle Frames angekommen sind
+# jeweils für TCP über 127.0.0.1 und für den Unix-Domain-Socket aus network.unix_server().
+#
+# Aufruf: python3 -m bench.unix [--messages 5000] [--size 200]
+##
+
+import argparse
+import socket
+import statistics
+import threading
+import time
+
+from network import ConnectionPool, open_connection, recv_frames, send_frame, unix_server
+
+##
+# @brief Antwortet auf jeden empfangenen Frame mit einem leeren Frame.
+# @param conn Angenommene Verbindung
+def echo(conn, addr=None):
+    with conn:
+        try:
+            for _ in recv_frames(conn):
+                send_frame(conn, b"")
+        except OSError:
+            pass
+
+##
+# @brief Startet einen TCP-Empfänger auf einem freien Port von 127.0.0.1.
+# @param handler Funktion(conn, addr) je Verbindung
+# @return Port
+def tcp_server(handler):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen()
+
+    def accept_loop():
+        while True:
+            conn, addr = sock.accept()
+            threading.Thread(target=handler, args=(conn, addr), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return sock.getsockname()[1]
+
+##
+# @brief Baut eine Verbindung zum Empfänger auf.
+# @param port TCP-Port des Empfängers
+# @param unix True: Unix-Domain-Socket, False: TCP
+def connect(port, unix):
+    if unix:
+        return open_connection("127.0.0.1", port, 2.0)
+    sock = socket.create_connection(("127.0.0.1", port), timeout=2.0)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+##
+# @brief Round-Trip-Zeiten auf einer bestehenden Verbindung.
+# @return Liste in Mikrosekunden
+def measure_rtt(port, unix, messages, payload):
+    samples = []
+    with connect(port, unix) as sock:
+        frames = recv_frames(sock)
+        for _ in range(messages):
+            start = time.perf_counter()
+            send_frame(sock, payload)
+            next(frames)
+            samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+##
+# @brief Zeiten für Verbindungsaufbau, eine Nachricht mit Antwort und Schließen.
+# @return Liste in Mikrosekunden
+def measure_connect(port, unix, messages, payload):
+    samples = []
+    for _ in range(messages):
+        start = time.perf_counter()
+        with connect(port, unix) as sock:
+            send_frame(sock, payload)
+            next(recv_frames(sock))
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+##
+# @brief Durchsatz über den ConnectionPool (ohne Antwort, wie beim Chatten).
+# @param unix True: Empfänger lauscht zusätzlich auf seinem Unix-Domain-Socket
+# @return Mikrosekunden pro Nachricht, bis der Empfänger alle Frames gelesen hat
+def measure_pool(unix, messages, payload):
+    received = threading.Semaphore(0)
+
+    def count(conn, addr=None):
+        with conn:
+            for _ in recv_frames(conn):
+                received.release()
+
+    port = tcp_server(count)
+    if unix:
+        unix_server(port, count)
+    pool = ConnectionPool()
+    start = time.perf_counter()
+    for _ in range(messages):
+        pool.send("127.0.0.1", port, payload)
+    for _ in range(messages):
+        received.acquire()
+    elapsed = time.perf_counter() - start
+    pool.close_all()
+    return elapsed / messages * 1e6
+
+##
+# @brief Fasst Messwerte zusammen.
+# @return (Median, p99) in Mikrosekunden
+def summarize(samples):
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+##
+# @brief Einstiegspunkt: misst TCP und Unix-Domain-Socket und gibt eine Tabelle aus.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000, help="Nachrichten pro Messung")
+    parser.add_argument("--size", type=int, default=200, help="Nutzlast pro Nachricht in Bytes")
+    args = parser.parse_args()
+    payload = b"x" * args.size
+
+    # Echo-Empfänger: nur TCP bzw. TCP + Unix-Domain-Socket unter demselben Port
+    tcp_port = tcp_server(echo)
+    unix_port = tcp_server(echo)
+    if unix_server(unix_port, echo) is None:
+        raise SystemExit("Unix-Domain-Sockets werden hier nicht unterstützt")
+
+    print(f"{'Messung':<10} {'TCP p50':>9} {'TCP p99':>9} {'UDS p50':>9} {'UDS p99':>9} {'Faktor':>7}  [µs]")
+    for name, measure in (("rtt", measure_rtt), ("connect", measure_connect)):
+        tcp = summarize(measure(tcp_port, False, args.messages, payload))
+        uds = summarize(measure(unix_port, True, args.messages, payload))
+        print(f"{name:<10} {tcp[0]:>9.1f} {tcp[1]:>9.1f} {uds[0]:>9.1f} {uds[1]:>9.1f} {tcp[0] / uds[0]:>6.2f}x")
+
+    # Pool: ConnectionPool wählt den Weg selbst (open_connection)
+    tcp = measure_pool(False, args.messages, payload)
+    uds = measure_pool(True, args.messages, payload)
+    print(f"{'pool':<10} {tcp:>9.1f} {'':>9} {uds:>9.1f} {'':>9} {tcp / uds:>6.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -15,9 +15,21 @@ import socket
 import os
 import sys
 import time
-import queue
-from network import load_config
-from PIL import Image, ImageTk
+import itertools
+from collections import deque, OrderedDict
+from network import (connection_pool, is_framed, recv_frames, recv_line, recv_to_file, send_data,
+                     compress_image, unix_server, FanoutDispatcher, InflatingWriter, MulticastChannel,
+                     CONNECTION_IDLE_TIMEOUT, MULTICAST_GROUP, MULTICAST_PORT, UNIX_SOCKET_CAPABILITY,
+                     IMAGE_SCALED_CAPABILITY, IMAGE_ZLIB_CAPABILITY)
+from roster import Roster, JoinHandshake, DELTA_CAPABILITY, HEARTBEAT_INTERVAL, PAGE_TIMEOUT, RECV_BUFSIZE
+import metrics
+import protocol
+from protocol import PROTOCOL_V2_CAPABILITY
+from history import (open_history, HISTORY_DIR, FSYNC_INTERVAL, DIRECTION_IN, DIRECTION_OUT,
+                     KIND_TEXT, KIND_IMAGE, BROADCAST_PEER)
+from thumbnails import ThumbnailCache, shrink_image
+from imagestore import ImageStore, STORE_MAX_BYTES
+from imagetransfer import distribute, receive_chunked, send_chunked, PreparedImage, IMAGE_TRANSFER_CAPABILITY
 from io import BytesIO
 
 BG_COLOR = "#f0f0f0"
@@ -25,6 +37,98 @@ TEXT_BG = "#ffffff"
 BUTTON_COLOR = "#4a90e2"
 FONT = ("Helvetica", 10)
 MAX_MSG_LENGTH = 512
+HISTORY_PRELOAD = 50  # Anzahl Nachrichten aus dem Verlauf, die beim Start angezeigt werden
+HISTORY_PAGE = 50  # Nachrichten, die beim Zurückblättern auf einmal nachgeladen werden
+DISPLAY_WINDOW = 200  # Einträge, die beim Mitlesen im Chatfenster gehalten werden
+SCROLLBACK_LIMIT = 1000  # Obergrenze der Einträge im Chatfenster beim Zurückblättern
+IMAGE_CACHE_SIZE = 32  # Vorschaubilder, die zusätzlich im LRU-Cache bleiben
+THUMBNAIL_DIR = ".thumbnails"  # Platten-Cache der Vorschaubilder (unterhalb von imagepath)
+UI_QUEUE_LIMIT = 1000  # Maximale Anzahl wartender Chatmeldungen, danach wird die älteste verworfen
+FALLBACK_POLL_MS = 1000  # Sicherheitsabfrage der Ereignis-Queue (Wecken erfolgt sonst sofort)
+IMAGE_QUALITY = 85  # JPEG-Qualität beim Verkleinern gesendeter Bilder
+
+##
+# @brief Wandelt ein PIL-Bild in ein Tk-PhotoImage um.
+# @param img PIL-Bild
+# @return ImageTk.PhotoImage
+#
+# PIL wird erst beim ersten Bild geladen, damit das Fenster schneller erscheint.
+def photo_image(img):
+    from PIL import ImageTk
+    return ImageTk.PhotoImage(img)
+
+##
+# @class GuiEventDispatcher
+# @brief Übergibt Ereignisse aus Netzwerk-Threads ereignisgesteuert an den Tk-Hauptthread.
+#
+# post() legt ein Ereignis in eine Warteschlange und weckt Tk über das virtuelle
+# Ereignis <<ChatEvent>> sofort auf, statt alle 100 ms nachzusehen. Solange Tk
+# das Wecken noch nicht verarbeitet hat, lösen weitere post()-Aufrufe kein
+# zusätzliches Ereignis aus; der Handler erhält alles Angesammelte als einen Stapel.
+#
+# Überlast: Chatmeldungen ("chat") sind auf limit begrenzt. Ist die Warteschlange
+# voll, wird die älteste Meldung verworfen und mitgezählt. Nutzerlisten-Änderungen
+# ("roster") werden zusammengefasst und können nicht überlaufen.
+#
+class GuiEventDispatcher:
+    EVENT = "<<ChatEvent>>"
+    BOUNDED = ("chat",)
+    COALESCED = ("roster",)
+
+    ##
+    # @brief Konstruktor.
+    # @param master Tk-Hauptfenster
+    # @param handler Funktion(Ereignisse, verworfen) im Tk-Thread; Ereignisse ist ein
+    #        Dictionary Art → Liste der Einträge in Eingangsreihenfolge
+    # @param limit Maximale Anzahl wartender Chatmeldungen
+    def __init__(self, master, handler, limit=UI_QUEUE_LIMIT):
+        self.master = master
+        self.handler = handler
+        self.limit = limit
+        self.pending = {}
+        self.dropped = 0
+        self.wakeup_pending = False
+        self.lock = threading.Lock()
+        master.bind(self.EVENT, self.drain)
+        # Rückfallebene, falls Tk aus einem anderen Thread nicht geweckt werden kann
+        master.after(FALLBACK_POLL_MS, self.poll)
+
+    ##
+    # @brief Reicht ein Ereignis an den Tk-Thread weiter (aus jedem Thread aufrufbar).
+    # @param kind "chat", "thumbnail" oder "roster"
+    # @param item Daten des Ereignisses
+    def post(self, kind, item=None):
+        with self.lock:
+            items = self.pending.setdefault(kind, deque())
+            if kind in self.COALESCED:
+                items.clear()
+            elif kind in self.BOUNDED and len(items) >= self.limit:
+                items.popleft()
+                self.dropped += 1
+            items.append(item)
+            wake = not self.wakeup_pending
+            self.wakeup_pending = True
+        if wake:
+            try:
+                self.master.event_generate(self.EVENT, when="tail")
+            except (tk.TclError, RuntimeError):
+                pass  # Fenster geschlossen oder Mainloop läuft noch nicht: poll() übernimmt
+
+    ##
+    # @brief Übergibt alle angesammelten Ereignisse an den Handler (Tk-Thread).
+    def drain(self, event=None):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            dropped, self.dropped = self.dropped, 0
+            self.wakeup_pending = False
+        if pending or dropped:
+            self.handler(pending, dropped)
+
+    ##
+    # @brief Seltene Sicherheitsabfrage für Ereignisse, deren Wecken fehlgeschlagen ist.
+    def poll(self):
+        self.drain()
+        self.master.after(FALLBACK_POLL_MS, self.poll)
 
 ##
 # @class ChatGUI
@@ -49,18 +153,54 @@ class ChatGUI:
         self.udp_port = config["port"][0]    # (Wird nicht direkt genutzt)
         self.tcp_port = config["port"][1]
         self.whoisport = config["whoisport"]
+        # Per PING gewählte Discovery-Instanz (main.py), sonst Broadcast
+        self.discovery_ip = config.get("discovery_ip", "255.255.255.255")
         self.imagepath = config.get("imagepath", "./received_images")
         self.autoreply = config.get("autoreply", "Ich bin nicht verfügbar")
+        self.heartbeat_interval = config.get("heartbeat_interval", HEARTBEAT_INTERVAL)
+        # Gesendete Bilder für Empfänger, die es anmelden, verkleinern (0 = nie) bzw. komprimieren
+        self.image_max_size = config.get("image_max_size", 0)
+        self.image_quality = config.get("image_quality", IMAGE_QUALITY)
+        self.image_compression = config.get("image_compression", True)
 
-        # Dictionaries für bekannte Nutzer, Autoreplies und Queue für Thread-sicheres Updaten der GUI
+        # Dictionaries für bekannte Nutzer und Autoreplies
         self.known_users = {}
-        self.chat_queue = queue.Queue()
         self.last_autoreply = {}
-        self.chat_display_refs = []
+        # Virtualisierte Chat-Anzeige: nur ein Fenster von Einträgen lebt im Widget
+        self.view_entries = deque()
+        self.view_counter = itertools.count()
+        self.view_detached = False
+        self.missed_updates = deque(maxlen=DISPLAY_WINDOW)
+        self.loading_older = False
+        self.image_cache = OrderedDict()
+        # Vorschaubilder entstehen im Hintergrund; fertige Bilder kommen als "thumbnail"-Ereignis zurück
+        self.thumbnails = ThumbnailCache(os.path.join(self.imagepath, THUMBNAIL_DIR))
+        self.pending_images = {}
+        self.listed_users = []
+        self.listed_recipients = []
+        self.user_caps = {}
+        self.roster = Roster(self.handle, self.known_users, self.user_caps)
+        self.dispatcher = FanoutDispatcher()
+        self.multicast = None
+        self.history = None
+        if config.get("history_path"):
+            self.history = open_history(config["history_path"], self.handle,
+                                        config.get("history_fsync_interval", FSYNC_INTERVAL))
 
         os.makedirs(self.imagepath, exist_ok=True)
+        # Empfangene Bilder liegen nach Inhalt abgelegt unter imagepath (siehe imagestore.py)
+        max_mb = config.get("image_store_max_mb", STORE_MAX_BYTES // 2**20)
+        try:
+            self.images = ImageStore(self.imagepath, int(max_mb * 2**20))
+        except BlockingIOError:
+            # Weiterer Client im selben Verzeichnis: eigener Speicher, damit sich Index und Bereinigung nicht stören
+            self.images = ImageStore(os.path.join(self.imagepath, self.handle), int(max_mb * 2**20))
 
         self.setup_gui()
+        # Ereignisse der Netzwerk-Threads gelangen über den Dispatcher in den Tk-Thread
+        self.events = GuiEventDispatcher(self.master, self.handle_events)
+        self.update_user_list()
+        self.load_history()
 
         # UDP-Socket: Bind auf zufälligem Port (eigener Listener für Discovery, keine Kollision!)
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -69,11 +209,10 @@ class ChatGUI:
         self.my_udp_port = self.udp_socket.getsockname()[1]
 
         self.start_network()
-        self.send_join()
-        time.sleep(0.2)
-        self.send_who()
-
-        self.master.after(100, self.process_queue)
+        if config.get("multicast"):
+            self.multicast = MulticastChannel(config.get("multicast_group", MULTICAST_GROUP),
+                                              config.get("multicast_port", MULTICAST_PORT),
+                                              self.handle, self.handle_multicast)
 
     ##
     # @brief Initialisiert alle grafischen Komponenten (Fenster, Buttons, Listen etc.).
@@ -96,7 +235,7 @@ class ChatGUI:
         # Chat-Anzeige
         self.chat_display = scrolledtext.ScrolledText(main_frame, width=60, height=20, wrap=tk.WORD, bg=TEXT_BG, font=FONT)
         self.chat_display.grid(row=0, column=0, columnspan=2, padx=5, pady=5, sticky="nsew")
-        self.chat_display.config(state=tk.DISABLED)
+        self.chat_display.config(state=tk.DISABLED, yscrollcommand=self.on_chat_scroll)
 
         # Nutzerliste
         self.user_listbox = tk.Listbox(main_frame, height=20, width=20, bg=TEXT_BG, font=FONT)
@@ -160,6 +299,17 @@ class ChatGUI:
             self.tcp_port = self.tcp_socket.getsockname()[1]
             self.queue_update(f"[Info] TCP-Port automatisch gewechselt auf {self.tcp_port}")
         self.tcp_socket.listen()
+        # Schneller Weg für Peers auf demselben Rechner
+        self.unix_path = None
+        if self.config.get("unix_socket", True):
+            self.unix_path = unix_server(self.tcp_port, self.handle_tcp_connection)
+
+        # JOIN sendet der UDP-Listener und wiederholt es, bis die Nutzerliste eintrifft
+        caps = [DELTA_CAPABILITY, PROTOCOL_V2_CAPABILITY, IMAGE_ZLIB_CAPABILITY, IMAGE_SCALED_CAPABILITY,
+                IMAGE_TRANSFER_CAPABILITY]
+        if self.unix_path:
+            caps.append(UNIX_SOCKET_CAPABILITY)
+        self.join_handshake = JoinHandshake(f"JOIN {self.handle} {self.tcp_port} {self.my_udp_port} {' '.join(caps)}")
 
         threading.Thread(target=self.tcp_listener, daemon=True).start()
         threading.Thread(target=self.udp_knownusers_listener, daemon=True).start()
@@ -180,67 +330,153 @@ class ChatGUI:
     # @param conn Die Socket-Verbindung.
     # @param addr Die Absenderadresse.
     #
+    # Gerahmte Verbindungen (ConnectionPool) liefern beliebig viele MSG-Frames,
+    # alte Clients schicken genau eine MSG- oder IMG-Nachricht.
+    #
     def handle_tcp_connection(self, conn, addr):
         try:
+            conn.settimeout(CONNECTION_IDLE_TIMEOUT)
+            if is_framed(conn):
+                for frame in recv_frames(conn):
+                    if frame.startswith(b"MSG") or protocol.is_v2(frame):
+                        self.handle_text_message(frame)
+                return
             data = conn.recv(1024)
             if data.startswith(b"MSG"):
-                parts = data.decode().split(maxsplit=2)
-                if len(parts) == 3:
-                    _, sender, text = parts
-                    self.queue_update(f"{sender}: {text}")
-                    # Autoreply bei Abwesenheit
-                    if self.abwesend_var.get() and sender != self.handle:
-                        now = time.time()
-                        if now - self.last_autoreply.get(sender, 0) > 30:
-                            self.send_message_to(sender, self.autoreply)
-                            self.last_autoreply[sender] = now
+                self.handle_text_message(data)
             elif data.startswith(b"IMG"):
-                try:
-                    header, img_data = data.split(b"\n", 1)
-                    parts = header.decode().split()
-                    if len(parts) >= 3:
-                        _, sender, size = parts[:3]
-                        filename = f"img_{int(time.time())}.png"
-                        filepath = os.path.join(self.imagepath, filename)
-                        with open(filepath, "wb") as f:
-                            f.write(img_data)
-                        self.queue_update(f"{sender} hat ein Bild gesendet", filepath)
-                except Exception as e:
-                    self.queue_update(f"[Fehler] Bildempfang: {str(e)}")
+                self.receive_image(conn, data)
+        except (OSError, ValueError):
+            pass  # Verbindung abgebrochen, ungültiger Frame oder Leerlauf-Timeout
         finally:
             conn.close()
 
     ##
-    # @brief Sendet eine JOIN-Nachricht an den Discovery-Service.
+    # @brief Empfängt ein Bild: "IMG <Absender> <Größe> [Name]\n" gefolgt von genau Größe Bytes.
+    # @param conn Die Socket-Verbindung.
+    # @param data Bereits gelesener Anfang der Übertragung (bytes).
     #
-    def send_join(self):
-        message = f"JOIN {self.handle} {self.tcp_port} {self.my_udp_port}"
-        self.udp_socket.sendto(message.encode(), ("255.255.255.255", self.whoisport))
+    # Die Bilddaten werden in festen Blöcken direkt in eine temporäre Datei
+    # geschrieben und erst nach vollständigem Empfang in den Bildspeicher
+    # übernommen (bereits vorhandene Bilder werden nicht doppelt abgelegt). Absender, die
+    # IMAGE_ZLIB_CAPABILITY kennen, schicken stattdessen
+    # "IMGZ <Absender> <Größe> <entpackte Größe> [Name]\n" mit zlib-Daten, solche mit
+    # IMAGE_TRANSFER_CAPABILITY "IMGX ..." in prüfbaren Blöcken (siehe imagetransfer.py).
+    #
+    def receive_image(self, conn, data):
+        try:
+            header, rest = recv_line(conn, data)
+            parts = header.decode().split()
+            if len(parts) < 3:
+                return
+            command, sender, size = parts[:3]
+            if command == "IMGX":
+                sender, filepath, received = receive_chunked(conn, header, rest, self.images)
+                index = self.record(sender, filepath, kind=KIND_IMAGE)
+                self.queue_update(f"{sender} hat ein Bild gesendet", filepath, index)
+                return
+            size = int(size)
+            if size < 0:
+                raise ValueError(f"ungültige Größe {size}")
+            with self.images.writer() as f:
+                if command == "IMGZ":
+                    writer = InflatingWriter(f, int(parts[3]))
+                    recv_to_file(conn, writer, size, rest)
+                    writer.finish()
+                else:
+                    recv_to_file(conn, f, size, rest)
+                filepath = f.commit()
+            index = self.record(sender, filepath, kind=KIND_IMAGE)
+            self.queue_update(f"{sender} hat ein Bild gesendet", filepath, index)
+        except Exception as e:
+            self.queue_update(f"[Fehler] Bildempfang: {str(e)}")
 
     ##
-    # @brief Fordert die aktuelle Nutzerliste vom Discovery-Service an.
+    # @brief Zeigt eine empfangene MSG-Nachricht an und beantwortet sie ggf. automatisch.
+    # @param data Nachricht "MSG <Absender> <Text>" oder SLCP-v2-MSG (bytes)
     #
-    def send_who(self):
-        self.udp_socket.sendto(b"WHO", ("255.255.255.255", self.whoisport))
+    def handle_text_message(self, data):
+        parts = protocol.parse(data)
+        metrics.inc("client.messages_received")
+        if parts is not None and parts[0] == "MSG":
+            _, sender, text = parts
+            index = self.record(sender, text)
+            self.queue_update(f"{sender}: {text}", index=index)
+            # Autoreply bei Abwesenheit
+            if self.abwesend_var.get() and sender != self.handle:
+                now = time.time()
+                if now - self.last_autoreply.get(sender, 0) > 30:
+                    self.send_message_to(sender, self.autoreply)
+                    self.last_autoreply[sender] = now
 
     ##
     # @brief Sammelt Eingabetext und verschickt ihn an den/die Empfänger.
     #
     def send_message(self, event=None):
         text = self.message_entry.get().strip()
+        if text == "/stats":
+            self.message_entry.delete(0, tk.END)
+            self.show_stats()
+            return
         if not text or len(text.encode("utf-8")) > MAX_MSG_LENGTH:
             self.queue_update("[Fehler] Nachricht zu lang oder leer.")
             return
         recipient = self.recipient_var.get()
         self.message_entry.delete(0, tk.END)
+        def payload(name):
+            return self.encode_message(name, text)
+        # Versand läuft parallel im Hintergrund, damit tote Peers die GUI nicht blockieren
         if recipient == "(Broadcast)":
-            for user, (ip, port) in self.known_users.items():
-                if user != self.handle:
-                    self.send_message_to(user, text)
-            self.queue_update(f"(An alle) {self.handle}: {text}")
+            if self.multicast:
+                # Ein Datagramm an die Multicast-Gruppe statt N TCP-Verbindungen
+                self.multicast.send(text)
+            else:
+                targets = {user: addr for user, addr in list(self.known_users.items()) if user != self.handle}
+                self.dispatcher.submit(targets, payload, on_done=self.report_send_failures)
+            index = self.record(BROADCAST_PEER, text, DIRECTION_OUT)
+            self.queue_update(f"(An alle) {self.handle}: {text}", index=index)
         else:
-            self.send_message_to(recipient, text)
-            self.queue_update(f"(An {recipient}) {self.handle}: {text}")
+            if recipient in self.known_users:
+                self.dispatcher.submit({recipient: self.known_users[recipient]}, payload,
+                                       on_done=self.report_send_failures)
+            index = self.record(recipient, text, DIRECTION_OUT)
+            self.queue_update(f"(An {recipient}) {self.handle}: {text}", index=index)
+
+    ##
+    # @brief Zeigt eine über die Multicast-Gruppe empfangene Nachricht an.
+    # @param sender Absender-Handle.
+    # @param text Die Nachricht.
+    #
+    def handle_multicast(self, sender, text):
+        index = self.record(sender, text)
+        self.queue_update(f"(An alle) {sender}: {text}", index=index)
+
+    ##
+    # @brief Meldet fehlgeschlagene Empfänger eines Versands im Chatfenster.
+    # @param failures Dictionary Empfänger → Fehlertext
+    #
+    def report_send_failures(self, failures):
+        for recipient, error in sorted(failures.items()):
+            self.queue_update(f"[Fehler] Nachricht an {recipient} fehlgeschlagen ({error})")
+
+    ##
+    # @brief Zeigt die Kennzahlen (Eingabe "/stats") im Chatfenster an.
+    #
+    def show_stats(self):
+        if not metrics.enabled:
+            self.queue_update("[System] Kennzahlen sind ausgeschaltet (Start mit --metrics)")
+            return
+        for line in metrics.format_text().splitlines():
+            self.queue_update(f"[Stats] {line}")
+
+    ##
+    # @brief Kodiert eine Chatnachricht passend zum Empfänger.
+    # @param recipient Empfänger-Name.
+    # @param text Die Nachricht.
+    # @return SLCP-v2-MSG, falls der Empfänger v2 angemeldet hat, sonst "MSG <Handle> <Text>"
+    #
+    def encode_message(self, recipient, text):
+        return protocol.encode_msg(self.handle, text, self.roster.supports(recipient, PROTOCOL_V2_CAPABILITY))
 
     ##
     # @brief Versendet eine Textnachricht via TCP an einen Nutzer.
@@ -251,10 +487,9 @@ class ChatGUI:
         if recipient in self.known_users:
             ip, port = self.known_users[recipient]
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(2)
-                    s.connect((ip, port))
-                    s.sendall(f"MSG {self.handle} {text}".encode())
+                # Wiederverwendete Verbindung aus dem gemeinsamen Pool
+                connection_pool.send(ip, port, self.encode_message(recipient, text))
+                self.record(recipient, text, DIRECTION_OUT)
             except:
                 self.queue_update(f"[Fehler] Nachricht an {recipient} fehlgeschlagen")
 
@@ -267,105 +502,489 @@ class ChatGUI:
             return
         recipient = self.recipient_var.get()
         if recipient == "(Broadcast)":
-            messagebox.showerror("Fehler", "Bilder können nicht an alle gesendet werden")
-            return
-        if recipient not in self.known_users:
+            # Nur an Clients, die Bilder annehmen; die CLI würde die Bilddaten als Text lesen
+            others = [user for user in list(self.known_users) if user != self.handle]
+            targets = {user: self.known_users[user] for user in others if self.accepts_images(user)}
+            skipped = sorted(set(others) - set(targets))
+            if skipped:
+                self.queue_update(f"[System] Ohne Bildempfang, ausgelassen: {', '.join(skipped)}")
+            if not targets:
+                messagebox.showerror("Fehler", "Keine Empfänger bekannt, die Bilder annehmen")
+                return
+        elif recipient in self.known_users:
+            targets = {recipient: self.known_users[recipient]}
+        else:
             messagebox.showerror("Fehler", "Empfänger nicht gefunden")
             return
+        # Verkleinern, Hashen und Senden dauern bei großen Fotos spürbar: nicht im Tk-Thread
+        threading.Thread(target=self.send_image, args=(targets, filepath, recipient == "(Broadcast)"),
+                         daemon=True).start()
+
+    ##
+    # @brief Prüft, ob ein Nutzer Bilder annimmt (eine der Bild-Fähigkeiten angemeldet hat).
+    # @param user Nutzer
+    # @return True, falls IMGX, IMGZ oder verkleinerte Bilder angemeldet sind
+    def accepts_images(self, user):
+        return any(self.roster.supports(user, cap)
+                   for cap in (IMAGE_TRANSFER_CAPABILITY, IMAGE_ZLIB_CAPABILITY, IMAGE_SCALED_CAPABILITY))
+
+    ##
+    # @brief Sendet ein Bild an einen oder mehrere Nutzer (läuft im Hintergrund).
+    # @param targets Dictionary Empfänger → (IP, Port)
+    # @param filepath Pfad des Bildes
+    # @param broadcast True, wenn an alle gesendet wird (ein Verlaufseintrag für alle)
+    #
+    # Die Datei wird nur einmal gelesen und gehasht (PreparedImage), eine
+    # verkleinerte Fassung nur einmal erzeugt; die Übertragungen laufen mit
+    # begrenzter Parallelität (imagetransfer.distribute()).
+    #
+    # Meldet ein Empfänger IMAGE_SCALED_CAPABILITY an, geht bei gesetztem
+    # image_max_size die verkleinerte Fassung an ihn; mit IMAGE_ZLIB_CAPABILITY
+    # werden die Daten zusätzlich verlustfrei komprimiert, sofern das lohnt.
+    # Mit IMAGE_TRANSFER_CAPABILITY läuft die Übertragung per IMGX: Hat der
+    # Empfänger das Bild schon, wird nichts gesendet, nach einem Abbruch nur
+    # der fehlende Rest. Alte Clients erhalten unverändert die Originaldatei als IMG.
+    #
+    def send_image(self, targets, filepath, broadcast=False):
+        name = os.path.basename(filepath)
+        scaled = {user: bool(self.image_max_size) and self.roster.supports(user, IMAGE_SCALED_CAPABILITY)
+                  for user in targets}
+        images = {}
+        packed = {}
         try:
-            with open(filepath, "rb") as f:
-                img_data = f.read()
-            ip, port = self.known_users[recipient]
-            header = f"IMG {self.handle} {len(img_data)} {os.path.basename(filepath)}"
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(2)
-                s.connect((ip, port))
-                s.sendall(header.encode() + b"\n" + img_data)
-            self.queue_update(f"Bild an {recipient} gesendet: {os.path.basename(filepath)}")
+            images[False] = PreparedImage(filepath)
+            if any(scaled.values()):
+                data = shrink_image(filepath, self.image_max_size, self.image_quality)
+                images[True] = PreparedImage(data) if data is not None else images[False]
         except Exception as e:
             self.queue_update(f"[Fehler] Bildsendung: {str(e)}")
+            return
+
+        def deliver(user, address):
+            image = images[scaled[user]]
+            compress = self.image_compression and self.roster.supports(user, IMAGE_ZLIB_CAPABILITY)
+            if self.roster.supports(user, IMAGE_TRANSFER_CAPABILITY):
+                return send_chunked(address[0], address[1], self.handle, image, name, compress)[0]
+            if compress and scaled[user] not in packed:
+                packed[scaled[user]] = compress_image(image.data)
+            data = packed.get(scaled[user]) if compress else None
+            if data is not None:
+                send_data(address[0], address[1], f"IMGZ {self.handle} {len(data)} {image.size} {name}", data)
+            else:
+                send_data(address[0], address[1], f"IMG {self.handle} {image.size} {name}", image.data)
+            return "sent"
+
+        try:
+            results, failures = distribute(targets, deliver)
+        finally:
+            for image in set(images.values()):
+                image.close()
+        for user, error in sorted(failures.items()):
+            self.queue_update(f"[Fehler] Bild an {user} fehlgeschlagen ({error})")
+        if not results:
+            return
+        present = sum(1 for result in results.values() if result == "have")
+        note = f", {present} hatten es bereits" if present else ""
+        if broadcast:
+            index = self.record(BROADCAST_PEER, filepath, DIRECTION_OUT, KIND_IMAGE)
+            self.queue_update(f"Bild an alle gesendet: {name} ({len(results)} Empfänger{note})", index=index)
+        else:
+            (user, result), = results.items()
+            index = self.record(user, filepath, DIRECTION_OUT, KIND_IMAGE)
+            note = " (lag dort bereits vor)" if result == "have" else ""
+            self.queue_update(f"Bild an {user} gesendet: {name}{note}", index=index)
+
+    ##
+    # @brief Speichert eine Nachricht im persistenten Verlauf (falls aktiviert).
+    # @param peer Absender bzw. Empfänger (BROADCAST_PEER für alle)
+    # @param text Nachrichtentext bzw. Bildpfad
+    # @param direction DIRECTION_IN oder DIRECTION_OUT
+    # @param kind KIND_TEXT oder KIND_IMAGE
+    #
+    # @return Laufende Nummer im Verlauf (None, falls kein Verlauf geöffnet ist)
+    #
+    def record(self, peer, text, direction=DIRECTION_IN, kind=KIND_TEXT):
+        if self.history:
+            return self.history.append(peer, text, direction, kind)
+        return None
+
+    ##
+    # @brief Zeigt die letzten HISTORY_PRELOAD Nachrichten aus dem Verlauf an.
+    #
+    def load_history(self):
+        if not self.history:
+            return
+        entries = self.history.last(HISTORY_PRELOAD)
+        for entry in entries:
+            self.queue_update(*self.format_history_entry(entry), index=entry.index)
+        if entries:
+            self.queue_update(f"[Info] {len(entries)} Nachrichten aus dem Verlauf geladen")
+
+    ##
+    # @brief Bringt einen Verlaufseintrag in dieselbe Form wie die Live-Anzeige.
+    # @param entry HistoryEntry
+    # @return (Nachricht, Bildpfad oder None)
+    #
+    def format_history_entry(self, entry):
+        if entry.kind == KIND_IMAGE:
+            if entry.direction == DIRECTION_OUT:
+                target = "alle" if entry.peer == BROADCAST_PEER else entry.peer
+                return f"Bild an {target} gesendet: {os.path.basename(entry.text)}", None
+            return f"{entry.peer} hat ein Bild gesendet", entry.text
+        if entry.direction == DIRECTION_OUT:
+            target = "alle" if entry.peer == BROADCAST_PEER else entry.peer
+            return f"(An {target}) {self.handle}: {entry.text}", None
+        return f"{entry.peer}: {entry.text}", None
 
     ##
     # @brief Fügt eine neue Nachricht (und optional ein Bild) in die Anzeige-Queue ein.
+    # @param message Anzuzeigender Text.
+    # @param image_path Optionaler Pfad eines Bildes.
+    # @param index Laufende Nummer im Verlauf (None = nicht gespeicherte Meldung).
     #
-    def queue_update(self, message, image_path=None):
-        self.chat_queue.put((message, image_path))
+    def queue_update(self, message, image_path=None, index=None):
+        self.events.post("chat", (message, image_path, index))
 
     ##
-    # @brief Holt Nachrichten/Bilder aus der Queue und zeigt sie im Chat an.
+    # @brief Verarbeitet einen Stapel von Ereignissen im Tk-Thread (siehe GuiEventDispatcher).
+    # @param events Dictionary Art → Liste der Einträge
+    # @param dropped Anzahl wegen Überlast verworfener Chatmeldungen
     #
-    def process_queue(self):
-        try:
-            while True:
-                message, image_path = self.chat_queue.get_nowait()
-                self.update_chat_display(message, image_path)
-                self.update_user_list()
-        except queue.Empty:
-            pass
-        self.master.after(100, self.process_queue)
+    def handle_events(self, events, dropped):
+        start = metrics.now()
+        metrics.inc("gui.events_dropped", dropped)
+        updates = list(events.get("chat", ()))
+        if dropped:
+            updates.insert(0, (f"[Info] {dropped} Meldungen wegen Überlast nicht angezeigt "
+                               f"(Nachrichten bleiben im Verlauf)", None, None))
+        if updates:
+            self.update_chat_display(updates)
+        for result in events.get("thumbnail", ()):
+            self.show_thumbnail(*result)
+        if "roster" in events:
+            self.update_user_list()
+        metrics.since("gui.update_seconds", start)
 
     ##
-    # @brief Fügt eine Nachricht und ggf. ein Bild in die Chat-Anzeige ein.
+    # @brief Fügt Nachrichten und ggf. Bilder am Ende der Chat-Anzeige ein.
+    # @param updates Liste von (Nachricht, Bildpfad oder None, Verlaufsnummer oder None).
+    #
+    # Aufeinanderfolgende Textzeilen gehen mit einem einzigen insert() ins Widget.
+    # Liest der Nutzer unten mit, bleiben nur die letzten DISPLAY_WINDOW Einträge im
+    # Widget; ältere werden samt Bild entfernt und bei Bedarf aus dem Verlauf nachgeladen.
+    # Ist die Anzeige vom Ende abgekoppelt (weit zurückgeblättert), landen neue
+    # Nachrichten nur im Verlauf und erscheinen beim Zurückkehren ans Ende.
     #
-    def update_chat_display(self, message, image_path=None):
+    def update_chat_display(self, updates):
+        if self.view_detached:
+            for message, image_path, index in updates:
+                if index is None or not self.history:
+                    self.missed_updates.append((message, image_path))
+            return
+        following = self.chat_display.yview()[1] >= 1.0
         self.chat_display.config(state=tk.NORMAL)
-        self.chat_display.insert(tk.END, message + "\n")
+        text_run = []
+        for message, image_path, index in updates:
+            if image_path:
+                self.insert_text_entries(text_run)
+                text_run = []
+                self.view_entries.append(self.render_entry(message, image_path, index))
+            else:
+                text_run.append((message, index))
+        self.insert_text_entries(text_run)
+        limit = DISPLAY_WINDOW if following else SCROLLBACK_LIMIT
+        while len(self.view_entries) > limit:
+            self.drop_entry(self.view_entries.popleft())
+        self.chat_display.config(state=tk.DISABLED)
+        if following:
+            self.chat_display.see(tk.END)
+
+    ##
+    # @brief Hängt mehrere reine Texteinträge mit einem einzigen insert() an.
+    # @param entries Liste von (Nachricht, Verlaufsnummer oder None).
+    #
+    def insert_text_entries(self, entries):
+        if not entries:
+            return
+        args = []
+        for message, index in entries:
+            entry = {"tag": f"entry{next(self.view_counter)}", "index": index, "photo": None}
+            args += [message + "\n", entry["tag"]]
+            self.view_entries.append(entry)
+        self.chat_display.insert(tk.END, *args)
+
+    ##
+    # @brief Schreibt einen Eintrag in das Widget und markiert ihn mit einem eigenen Tag.
+    # @param message Anzuzeigender Text.
+    # @param image_path Optionaler Pfad eines Bildes.
+    # @param index Laufende Nummer im Verlauf (oder None).
+    # @param at_top True: an der Marke "view_top" (vor dem bisher ersten Eintrag) einfügen.
+    # @return Dictionary mit Tag, Verlaufsnummer und PhotoImage des Eintrags
+    #
+    # Liegt das Vorschaubild noch nicht vor, steht zunächst ein Platzhalter im
+    # Widget; das Bild wird im Hintergrund erzeugt (siehe show_thumbnail()).
+    #
+    def render_entry(self, message, image_path, index, at_top=False):
+        where = "view_top" if at_top else tk.END
+        start = self.chat_display.index("view_top" if at_top else "end-1c")
+        entry = {"tag": f"entry{next(self.view_counter)}", "index": index, "photo": None}
+        self.chat_display.insert(where, message + "\n")
         if image_path:
-            try:
-                img = Image.open(image_path)
-                img.thumbnail((300, 300))
-                photo = ImageTk.PhotoImage(img)
-                self.chat_display.image_create(tk.END, image=photo)
-                self.chat_display.insert(tk.END, "\n")
-                self.chat_display_refs.append(photo)  # Verhindert das Bild-Garbage-Collecting
-            except Exception as e:
-                self.chat_display.insert(tk.END, f"[Fehler beim Bildanzeigen: {str(e)}]\n")
+            self.images.touch(image_path)
+            photo = self.cached_photo(image_path)
+            if photo is not None:
+                entry["photo"] = photo
+                self.chat_display.image_create(where, image=photo)
+                self.chat_display.insert(where, "\n")
+            else:
+                self.chat_display.insert(where, "[Bild wird geladen …]\n", entry["tag"] + "_image")
+                waiting = self.pending_images.setdefault(image_path, [])
+                waiting.append(entry)
+                if len(waiting) == 1:
+                    self.thumbnails.request(image_path, self.thumbnail_ready)
+        self.chat_display.tag_add(entry["tag"], start, "view_top" if at_top else "end-1c")
+        return entry
+
+    ##
+    # @brief Entfernt einen Eintrag aus dem Widget und gibt sein Bild frei.
+    # @param entry Eintrag aus render_entry().
+    #
+    def drop_entry(self, entry):
+        ranges = self.chat_display.tag_ranges(entry["tag"])
+        if ranges:
+            self.chat_display.delete(ranges[0], ranges[1])
+        self.chat_display.tag_delete(entry["tag"], entry["tag"] + "_image")
+        entry["photo"] = None
+
+    ##
+    # @brief Liefert ein bereits vorhandenes Vorschaubild ohne zu dekodieren.
+    # @param image_path Pfad des Bildes.
+    # @return ImageTk.PhotoImage oder None
+    #
+    # Angezeigte Einträge halten ihr PhotoImage selbst; image_cache hält zusätzlich
+    # die zuletzt benutzten IMAGE_CACHE_SIZE Bilder (LRU). Fehlt das PhotoImage,
+    # aber liegt das verkleinerte Bild im Speicher-Cache des ThumbnailCache, wird
+    # nur das PhotoImage neu erzeugt.
+    #
+    def cached_photo(self, image_path):
+        photo = self.image_cache.get(image_path)
+        if photo is not None:
+            self.image_cache.move_to_end(image_path)
+            return photo
+        img = self.thumbnails.cached(image_path)
+        if img is None:
+            return None
+        return self.remember_photo(image_path, photo_image(img))
+
+    ##
+    # @brief Legt ein PhotoImage im LRU-Cache ab und verdrängt das älteste.
+    # @param image_path Pfad des Bildes.
+    # @param photo ImageTk.PhotoImage
+    # @return photo
+    #
+    def remember_photo(self, image_path, photo):
+        self.image_cache[image_path] = photo
+        while len(self.image_cache) > IMAGE_CACHE_SIZE:
+            self.image_cache.popitem(last=False)
+        return photo
+
+    ##
+    # @brief Rückmeldung des ThumbnailCache (Worker-Thread): Ergebnis an den Tk-Thread übergeben.
+    #
+    def thumbnail_ready(self, image_path, img, error):
+        self.events.post("thumbnail", (image_path, img, error))
+
+    ##
+    # @brief Ersetzt die Platzhalter aller Einträge, die auf dieses Bild warten.
+    # @param image_path Pfad des Bildes.
+    # @param img Verkleinertes PIL-Bild (None bei Fehler).
+    # @param error Ausnahme beim Dekodieren (oder None).
+    #
+    def show_thumbnail(self, image_path, img, error):
+        waiting = self.pending_images.pop(image_path, [])
+        photo = self.remember_photo(image_path, photo_image(img)) if img is not None else None
+        following = self.chat_display.yview()[1] >= 1.0
+        self.chat_display.config(state=tk.NORMAL)
+        for entry in waiting:
+            ranges = self.chat_display.tag_ranges(entry["tag"] + "_image")
+            if not ranges:
+                continue  # Eintrag wurde inzwischen aus der Anzeige entfernt
+            start = self.chat_display.index(ranges[0])
+            self.chat_display.delete(ranges[0], ranges[1])
+            if photo is not None:
+                entry["photo"] = photo
+                self.chat_display.image_create(start, image=photo)
+                self.chat_display.insert(f"{start}+1c", "\n")
+                self.chat_display.tag_add(entry["tag"], start, f"{start}+2c")
+            else:
+                text = f"[Fehler beim Bildanzeigen: {str(error)}]\n"
+                self.chat_display.insert(start, text, entry["tag"])
+        self.chat_display.config(state=tk.DISABLED)
+        if following:
+            self.chat_display.see(tk.END)
+
+    ##
+    # @brief yscrollcommand der Chat-Anzeige: Scrollbalken setzen und bei Bedarf nachladen.
+    # @param first Anteil oberhalb des sichtbaren Bereichs (String von Tk).
+    # @param last Ende des sichtbaren Bereichs (String von Tk).
+    #
+    def on_chat_scroll(self, first, last):
+        self.chat_display.vbar.set(first, last)
+        if float(first) <= 0.0 and float(last) < 1.0 and not self.loading_older:
+            self.loading_older = True
+            self.master.after_idle(self.load_older)
+        elif float(last) >= 1.0 and self.view_detached:
+            self.master.after_idle(self.reload_latest)
+
+    ##
+    # @brief Lädt beim Zurückblättern die vorherige Seite aus dem Verlauf.
+    #
+    # Die Einträge werden vor dem ersten angezeigten eingefügt; die Ansicht bleibt
+    # an der bisherigen Stelle. Überschreitet die Anzeige SCROLLBACK_LIMIT, werden die
+    # neuesten Einträge entfernt und die Anzeige vom Ende abgekoppelt.
+    #
+    def load_older(self):
+        try:
+            if not self.history or not self.view_entries:
+                return
+            before = next((e["index"] for e in self.view_entries if e["index"] is not None), len(self.history))
+            entries = self.history.last(HISTORY_PAGE, before=before)
+            if not entries:
+                return
+            anchor = self.view_entries[0]["tag"]
+            self.chat_display.config(state=tk.NORMAL)
+            self.chat_display.mark_set("view_top", "1.0")
+            self.chat_display.mark_gravity("view_top", tk.RIGHT)
+            older = [self.render_entry(*self.format_history_entry(e), e.index, at_top=True) for e in entries]
+            self.view_entries.extendleft(reversed(older))
+            while len(self.view_entries) > SCROLLBACK_LIMIT:
+                self.drop_entry(self.view_entries.pop())
+                self.view_detached = True
+            self.chat_display.config(state=tk.DISABLED)
+            self.chat_display.yview(self.chat_display.tag_ranges(anchor)[0])
+        finally:
+            self.loading_older = False
+
+    ##
+    # @brief Kehrt ans Ende zurück: zeigt wieder die neuesten Nachrichten aus dem Verlauf.
+    #
+    def reload_latest(self):
+        if not self.view_detached:
+            return
+        self.view_detached = False
+        self.chat_display.config(state=tk.NORMAL)
+        for entry in self.view_entries:
+            self.chat_display.tag_delete(entry["tag"])
+        self.view_entries.clear()
+        self.chat_display.delete("1.0", tk.END)
+        for entry in self.history.last(DISPLAY_WINDOW):
+            message, image_path = self.format_history_entry(entry)
+            self.view_entries.append(self.render_entry(message, image_path, entry.index))
+        while self.missed_updates:
+            message, image_path = self.missed_updates.popleft()
+            self.view_entries.append(self.render_entry(message, image_path, None))
+        while len(self.view_entries) > DISPLAY_WINDOW:
+            self.drop_entry(self.view_entries.popleft())
         self.chat_display.config(state=tk.DISABLED)
         self.chat_display.see(tk.END)
 
     ##
-    # @brief Wartet auf UDP-Nachrichten (KNOWNUSERS/Discovery-Info und JOIN).
+    # @brief Wartet auf UDP-Nachrichten (KNOWNUSERS/SNAPSHOT, JOINED/LEFT-Deltas, REJOIN und JOIN)
+    # und sendet regelmäßig ALIVE an den Discovery-Service.
+    #
+    # Meldet sich selbst per JOIN an und wiederholt es mit wachsender Wartezeit,
+    # bis die Nutzerliste als Bestätigung eintrifft (siehe JoinHandshake).
     #
     def udp_knownusers_listener(self):
+        discovery_addr = (self.discovery_ip, self.whoisport)
+        next_alive = time.monotonic() + self.heartbeat_interval
         while self.running:
             try:
-                data, addr = self.udp_socket.recvfrom(1024)
-                message = data.decode().strip()
-                if message.startswith("KNOWNUSERS"):
-                    users_raw = message[len("KNOWNUSERS "):].strip()
-                    parts = users_raw.split()
-                    for i in range(0, len(parts), 3):
-                        if i + 2 < len(parts):
-                            handle, ip, port = parts[i], parts[i + 1], int(parts[i + 2])
-                            if handle != self.handle:
-                                self.known_users[handle] = (ip, port)
-                    self.queue_update("[System] Nutzerliste aktualisiert")
-                elif message.startswith("JOIN"):
-                    parts = message.split()
-                    if len(parts) >= 3:
-                        handle, port = parts[1], int(parts[2])
-                        if handle != self.handle:
-                            self.known_users[handle] = (addr[0], port)
-                            self.queue_update(f"[System] {handle} ist dem Chat beigetreten")
+                # JOIN senden bzw. wiederholen, solange die Nutzerliste aussteht
+                join = self.join_handshake.due()
+                if join:
+                    self.udp_socket.sendto(join.encode(), discovery_addr)
+                self.udp_socket.settimeout(self.join_handshake.wait_time(PAGE_TIMEOUT))
+                # Fehlende Seiten eines großen Snapshots gezielt nachfordern
+                request = self.roster.poll()
+                if request:
+                    self.udp_socket.sendto(request.encode(), discovery_addr)
+                connection_pool.sweep()  # unbenutzte TCP-Verbindungen schließen
+                # Lebenszeichen, damit der Discovery-Service uns nicht als abgelaufen entfernt
+                if self.heartbeat_interval and time.monotonic() >= next_alive:
+                    self.udp_socket.sendto(f"ALIVE {self.handle}".encode(), discovery_addr)
+                    next_alive = time.monotonic() + self.heartbeat_interval
+                try:
+                    data, addr = self.udp_socket.recvfrom(RECV_BUFSIZE)
+                except socket.timeout:
+                    continue
+                # Discovery-Antworten als Text oder SLCP v2
+                start = metrics.now()
+                message = protocol.parse(data)
+                result = self.roster.handle_message(message)
+                metrics.since("client.roster_seconds", start)
+                metrics.inc("client.datagrams_received")
+                if result is not None:
+                    event, names = result
+                    discovery_addr = (addr[0], self.whoisport)
+                    elapsed = self.join_handshake.acknowledge(event)
+                    if elapsed is not None:
+                        self.queue_update(f"[System] Angemeldet nach {elapsed * 1000:.0f} ms "
+                                          f"({self.join_handshake.attempts} JOIN)")
+                    if event == "rejoin":
+                        # Discovery-Service kennt uns nicht mehr (z. B. nach Neustart oder Ablauf)
+                        self.join_handshake.restart()
+                    elif event == "gap":
+                        # Versionslücke: vollständige Liste beim Discovery-Service anfordern
+                        self.udp_socket.sendto(b"SYNC", discovery_addr)
+                    elif event == "joined":
+                        self.queue_update(f"[System] {names[0]} ist dem Chat beigetreten")
+                        self.events.post("roster")
+                    elif event == "left":
+                        self.queue_update(f"[System] {names[0]} hat den Chat verlassen")
+                        self.events.post("roster")
+                    elif event in ("knownusers", "snapshot"):
+                        self.queue_update("[System] Nutzerliste aktualisiert")
+                        self.events.post("roster")
+                elif message is not None and message[0] == "JOIN":
+                    handle, port = message[1], message[2]
+                    if handle != self.handle:
+                        self.known_users[handle] = (addr[0], port)
+                        self.queue_update(f"[System] {handle} ist dem Chat beigetreten")
+                        self.events.post("roster")
             except Exception as e:
                 self.queue_update(f"[Fehler] UDP Listener: {e}")
 
     ##
     # @brief Aktualisiert die Nutzerliste und die Auswahlbox für Empfänger.
     #
+    # Die sortierte alte und neue Liste werden gemeinsam durchlaufen; nur
+    # weggefallene bzw. neue Zeilen der Listbox werden gelöscht bzw. eingefügt.
+    # Die Auswahlbox wird nur bei einer Änderung neu gesetzt.
+    #
     def update_user_list(self):
-        current_users = sorted(self.known_users.keys())
-        if self.handle not in current_users:
+        if self.handle not in self.known_users:
             self.known_users[self.handle] = ("127.0.0.1", self.tcp_port)
-            current_users.append(self.handle)
-        current_recipients = ["(Broadcast)"] + [u for u in current_users if u != self.handle]
-        self.user_listbox.delete(0, tk.END)
+        current_users = sorted(list(self.known_users))
+        old, row, i = self.listed_users, 0, 0
         for user in current_users:
-            self.user_listbox.insert(tk.END, user)
-        current_selection = self.recipient_var.get()
-        self.recipient_menu["values"] = current_recipients
-        if current_selection not in current_recipients:
-            self.recipient_var.set("(Broadcast)")
+            while i < len(old) and old[i] < user:
+                self.user_listbox.delete(row)
+                i += 1
+            if i < len(old) and old[i] == user:
+                i += 1
+            else:
+                self.user_listbox.insert(row, user)
+            row += 1
+        if i < len(old):
+            self.user_listbox.delete(row, tk.END)
+        self.listed_users = current_users
+        current_recipients = ["(Broadcast)"] + [u for u in current_users if u != self.handle]
+        if current_recipients != self.listed_recipients:
+            self.listed_recipients = current_recipients
+            self.recipient_menu["values"] = current_recipients
+            if self.recipient_var.get() not in current_recipients:
+                self.recipient_var.set("(Broadcast)")
 
     ##
     # @brief Schaltet zwischen Dark- und Light-Mode um.
@@ -389,11 +1008,36 @@ class ChatGUI:
     def on_close(self):
         if self.running:
             self.running = False
-            self.udp_socket.sendto(f"LEAVE {self.handle}".encode(), ("255.255.255.255", self.whoisport))
+            self.udp_socket.sendto(f"LEAVE {self.handle}".encode(), (self.discovery_ip, self.whoisport))
             self.udp_socket.close()
             self.tcp_socket.close()
+            self.dispatcher.shutdown()
+            self.thumbnails.shutdown()
+            if self.multicast:
+                self.multicast.close()
+            connection_pool.close_all()
+            if self.history:
+                self.history.close()
+            self.images.close()
             self.master.destroy()
 
+##
+# @brief Startet die GUI im laufenden Prozess und kehrt erst nach dem Schließen zurück.
+# @param config Konfiguration wie aus config.toml (handle, port, whoisport, ...)
+# @param metrics_enabled Kennzahlen erfassen (Anzeige mit /stats)
+# @param history_path Verzeichnis für den Chatverlauf ("" = aus, None = history_path aus config)
+#
+# main.py ruft diese Funktion direkt auf, statt einen zweiten Interpreter zu
+# starten, der alle Module erneut importiert und die Konfiguration neu liest.
+def start_gui(config, metrics_enabled=False, history_path=None):
+    if metrics_enabled:
+        metrics.enable()
+    if history_path is not None:
+        config = dict(config, history_path=history_path)
+    root = tk.Tk()
+    ChatGUI(root, config)
+    root.mainloop()
+
 ##
 # @brief Startpunkt des Programms: verarbeitet Kommandozeilenargumente und startet die GUI.
 #
@@ -403,6 +1047,13 @@ if __name__ == "__main__":
     parser.add_argument("--handle", required=True, help="Dein Benutzername (Handle)")
     parser.add_argument("--port", nargs=2, type=int, required=True, help="UDP- und TCP-Ports (Discovery-Port kann ignoriert werden)")
     parser.add_argument("--whoisport", type=int, required=True, help="Discovery-Dienst-Port")
+    parser.add_argument("--multicast", action="store_true", help="Nachrichten an alle per Multicast senden")
+    parser.add_argument("--multicast-group", default=MULTICAST_GROUP, help="Multicast-Gruppe")
+    parser.add_argument("--multicast-port", type=int, default=MULTICAST_PORT, help="Port der Multicast-Gruppe")
+    parser.add_argument("--history", default=HISTORY_DIR, help="Verzeichnis für den Chatverlauf (leer = aus)")
+    parser.add_argument("--history-fsync", type=float, default=FSYNC_INTERVAL,
+                        help="Sekunden zwischen zwei fsync-Aufrufen des Verlaufs")
+    parser.add_argument("--metrics", action="store_true", help="Kennzahlen erfassen (Anzeige mit /stats)")
     args = parser.parse_args()
 
     config = {
@@ -410,9 +1061,11 @@ if __name__ == "__main__":
         "port": args.port,
         "whoisport": args.whoisport,
         "imagepath": "./received_images",
-        "autoreply": "Ich bin nicht verfügbar"
+        "autoreply": "Ich bin nicht verfügbar",
+        "multicast": args.multicast,
+        "multicast_group": args.multicast_group,
+        "multicast_port": args.multicast_port,
+        "history_path": args.history,
+        "history_fsync_interval": args.history_fsync
     }
-
-    root = tk.Tk()
-    ChatGUI(root, config)
-    root.mainloop()
\ No newline at end of file
+    start_gui(config, args.metrics)
@@ -13,6 +13,14 @@ import time
 import re
 import sys
 from datetime import datetime
+from network import (connection_pool, read_messages, unix_server, FanoutDispatcher, MulticastChannel,
+                     UNIX_SOCKET_CAPABILITY)
+from roster import Roster, JoinHandshake, DELTA_CAPABILITY, HEARTBEAT_INTERVAL, PAGE_TIMEOUT, RECV_BUFSIZE
+from history import open_history, HISTORY_DIR, FSYNC_INTERVAL, DIRECTION_OUT, BROADCAST_PEER
+import metrics
+import protocol
+from protocol import PROTOCOL_V2_CAPABILITY
+from settings import load_config
 
 ##
 # @class colors
@@ -29,16 +37,33 @@ class colors:
 # @brief Standard-Broadcast-Adresse für UDP-Kommunikation.
 IP_BROADCAST = "255.255.255.255"
 
+##
+# @var discovery_adresse
+# @brief Ziel für Anfragen an den Discovery-Service (Broadcast an whoisport oder die per PING gewählte Instanz).
+#
+# Wird in start_cli() gesetzt.
+discovery_adresse = None
+
 ##
 # @var chat_verlauf
-# @brief Liste zur Speicherung aller Chat-Nachrichten (lokal).
-chat_verlauf = []
+# @brief Persistenter Chatverlauf (HistoryStore), None solange kein Verlauf geöffnet ist.
+chat_verlauf = None
+
+##
+# @var VERLAUF_ANZAHL
+# @brief Standardanzahl der Nachrichten, die /verlauf anzeigt.
+VERLAUF_ANZAHL = 20
 
 ##
 # @var bekannte_nutzer
 # @brief Dictionary der bekannten Nutzer im Netzwerk (Name → (IP, Port)).
 bekannte_nutzer = {}
 
+##
+# @var nutzer_faehigkeiten
+# @brief Fähigkeiten-Bits der bekannten Nutzer (Name → Bits, aus SLCP-v2-Listen).
+nutzer_faehigkeiten = {}
+
 ##
 # @brief Erzeugt einen Zeitstempel-String für Ausgaben.
 # @return Zeitstempel als formatierter String
@@ -58,6 +83,54 @@ def print_system(msg):
 def print_message(sender, msg):
     print(f"\n{format_timestamp()} {colors.GREEN} {sender}: {msg}{colors.END}")
 
+##
+# @brief Gibt eine empfangene Chatnachricht aus und speichert sie im Verlauf.
+# @param sender Absendername oder IP
+# @param msg Nachrichtentext
+def empfange_nachricht(sender, msg):
+    print_message(sender, msg)
+    if chat_verlauf is not None:
+        chat_verlauf.append(sender, msg)
+
+##
+# @brief Speichert eine gesendete Nachricht im Verlauf.
+# @param ziel Empfänger (BROADCAST_PEER für alle)
+# @param msg Nachrichtentext
+def speichere_gesendet(ziel, msg):
+    if chat_verlauf is not None:
+        chat_verlauf.append(ziel, msg, DIRECTION_OUT)
+
+##
+# @brief Gibt gespeicherte Nachrichten aus dem Verlauf aus.
+# @param anzahl Maximale Anzahl Nachrichten
+# @param peer Nur Nachrichten von/an diesen Nutzer (None = alle)
+def zeige_verlauf(anzahl, peer=None):
+    if chat_verlauf is None:
+        print_error("Kein Verlauf geöffnet")
+        return
+    eintraege = chat_verlauf.last(anzahl, peer)
+    if not eintraege:
+        print_system("Verlauf ist leer")
+    for e in eintraege:
+        zeit = datetime.fromtimestamp(e.timestamp).strftime('%d.%m. %H:%M:%S')
+        if e.direction == DIRECTION_OUT:
+            ziel = "alle" if e.peer == BROADCAST_PEER else e.peer
+            print(f"[{zeit}] (an {ziel}) {e.text}")
+        else:
+            print(f"[{zeit}] {e.peer}: {e.text}")
+
+##
+# @brief Kodiert eine Chatnachricht passend zum Empfänger.
+# @param ziel Empfänger
+# @param handle Eigenes Handle
+# @param text Nachrichtentext
+# @return SLCP-v2-MSG, falls der Empfänger v2 angemeldet hat, sonst "MSG <Handle> <Text>"
+#
+# Die Textform verstehen alle Clients (die GUI nimmt nur MSG- bzw. v2-Frames an).
+def kodiere_nachricht(ziel, handle, text):
+    binary = bool(nutzer_faehigkeiten.get(ziel, 0) & protocol.CAPABILITY_FLAGS[PROTOCOL_V2_CAPABILITY])
+    return protocol.encode_msg(handle, text, binary=binary)
+
 ##
 # @brief Gibt Fehlermeldungen farbig in der Konsole aus.
 # @param msg Fehlermeldung
@@ -75,7 +148,8 @@ def print_success(msg):
 # @param port TCP-Port, auf dem gehört wird
 #
 # Diese Funktion läuft in einem eigenen Thread und nimmt eingehende
-# Verbindungen entgegen. Jede Nachricht wird direkt in der Konsole ausgegeben.
+# Verbindungen entgegen. Jede Verbindung wird in einem eigenen Thread gelesen,
+# jede Nachricht (Frame) wird direkt in der Konsole ausgegeben.
 def empfange_tcp(port):
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -84,9 +158,26 @@ def empfange_tcp(port):
     print_system(f"TCP-Server gestartet auf Port {port}")
     while True:
         conn, addr = sock.accept()
-        data = conn.recv(1024).decode()
-        print_message(addr[0], data)
-        conn.close()
+        threading.Thread(target=lese_verbindung, args=(conn, addr), daemon=True).start()
+
+##
+# @brief Liest alle Nachrichten einer eingehenden TCP-Verbindung.
+# @param conn Angenommene Verbindung
+# @param addr Absenderadresse (IP, Port)
+def lese_verbindung(conn, addr):
+    with conn:
+        try:
+            for data in read_messages(conn):
+                nachricht = protocol.parse(data)
+                metrics.inc("client.messages_received")
+                if nachricht is not None and nachricht[0] == "MSG":
+                    _, sender, text = nachricht
+                    empfange_nachricht(sender, text)
+                else:
+                    # CLI-Textformat "<Absender>: <Text>"
+                    empfange_nachricht(addr[0], data.decode())
+        except (OSError, ValueError) as e:
+            print_error(f"TCP Fehler: {e}")
 
 ##
 # @brief Startet den UDP-Empfänger für KNOWNUSERS-Nachrichten.
@@ -94,8 +185,16 @@ def empfange_tcp(port):
 # @param handle Eigenes Handle (Name)
 #
 # Diese Funktion läuft in einem Thread und verarbeitet eintreffende UDP-Nachrichten.
-# KNOWNUSERS-Antworten werden ausgewertet und die Nutzerliste aktualisiert.
-def udp_empfaenger(my_udp_port, handle):
+# KNOWNUSERS-/SNAPSHOT-Antworten und JOINED-/LEFT-Deltas werden ausgewertet
+# und die Nutzerliste aktualisiert; bei einer Versionslücke wird SYNC gesendet.
+# Die Anmeldung (join_msg) sendet dieser Thread selbst, sobald der Port gebunden
+# ist, und wiederholt sie, bis die Nutzerliste als Bestätigung eintrifft (JoinHandshake).
+# Alle heartbeat_interval Sekunden geht ein ALIVE an den Discovery-Service;
+# antwortet dieser mit REJOIN (Eintrag abgelaufen), beginnt die Anmeldung neu.
+#
+# @param join_msg JOIN-Nachricht für die Anmeldung
+# @param heartbeat_interval Sekunden zwischen zwei ALIVE-Nachrichten (0 = aus)
+def udp_empfaenger(my_udp_port, handle, join_msg=None, heartbeat_interval=HEARTBEAT_INTERVAL):
     global bekannte_nutzer
     print_system(f"UDP-Empfänger gestartet auf Port {my_udp_port} (handle={handle})")
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -107,22 +206,59 @@ def udp_empfaenger(my_udp_port, handle):
         print_error(f"UDP-Port {my_udp_port} belegt – Wähle anderen UDP-Port für diesen Nutzer!")
         sys.exit(1)
 
+    roster = Roster(handle, bekannte_nutzer, nutzer_faehigkeiten)
+    anmeldung = JoinHandshake(join_msg) if join_msg else None
+    discovery_addr = discovery_adresse
+    naechstes_alive = time.monotonic() + heartbeat_interval
     while True:
         try:
-            data, addr = sock.recvfrom(4096)
-            msg = data.decode().strip()
-            # Erwartetes Format: KNOWNUSERS <Handle> <IP> <Port> ...
-            if msg.startswith("KNOWNUSERS"):
-                neue_nutzer = {}
-                teile = msg.split()[1:]
-                for i in range(0, len(teile), 3):
-                    if i + 2 < len(teile):
-                        name, ip, port = teile[i], teile[i + 1], int(teile[i + 2])
-                        if name != handle:
-                            neue_nutzer[name] = (ip, port)
-                bekannte_nutzer.update(neue_nutzer)
-                if neue_nutzer:
-                    print_system(f"Nutzerliste aktualisiert: {', '.join(neue_nutzer.keys())}")
+            # JOIN senden bzw. wiederholen, solange die Nutzerliste aussteht
+            if anmeldung:
+                nachricht = anmeldung.due()
+                if nachricht:
+                    sock.sendto(nachricht.encode(), discovery_addr)
+                sock.settimeout(anmeldung.wait_time(PAGE_TIMEOUT))
+            else:
+                sock.settimeout(PAGE_TIMEOUT)
+            # Fehlende Seiten eines großen Snapshots gezielt nachfordern
+            anfrage = roster.poll()
+            if anfrage:
+                sock.sendto(anfrage.encode(), discovery_addr)
+            connection_pool.sweep()  # unbenutzte TCP-Verbindungen schließen
+            if heartbeat_interval and time.monotonic() >= naechstes_alive:
+                sock.sendto(f"ALIVE {handle}".encode(), discovery_addr)
+                naechstes_alive = time.monotonic() + heartbeat_interval
+            try:
+                data, addr = sock.recvfrom(RECV_BUFSIZE)
+            except socket.timeout:
+                continue
+            # KNOWNUSERS/SNAPSHOT (volle Liste) oder JOINED/LEFT (Delta), als Text oder SLCP v2
+            start = metrics.now()
+            result = roster.handle_datagram(data)
+            metrics.since("client.roster_seconds", start)
+            metrics.inc("client.datagrams_received")
+            if result is None:
+                continue
+            event, namen = result
+            discovery_addr = (addr[0], discovery_adresse[1])
+            if anmeldung:
+                dauer = anmeldung.acknowledge(event)
+                if dauer is not None:
+                    print_system(f"Angemeldet nach {dauer * 1000:.0f} ms ({anmeldung.attempts} JOIN)")
+            if event == "rejoin":
+                # Discovery-Service kennt uns nicht mehr (z. B. nach Neustart oder Ablauf)
+                if anmeldung:
+                    anmeldung.restart()
+            elif event == "gap":
+                # Versionslücke: vollständige Liste beim Discovery-Service anfordern
+                sock.sendto(b"SYNC", discovery_addr)
+            elif event == "joined":
+                print_system(f"{namen[0]} ist dem Chat beigetreten")
+            elif event == "left":
+                print_system(f"{namen[0]} hat den Chat verlassen")
+            elif event in ("knownusers", "snapshot"):
+                if namen:
+                    print_system(f"Nutzerliste aktualisiert: {', '.join(namen)}")
                 else:
                     print_system("Keine neuen Nutzer empfangen.")
         except Exception as e:
@@ -133,32 +269,52 @@ def udp_empfaenger(my_udp_port, handle):
 # @param handle Eigenes Handle (Name)
 # @param tcp_port Port für TCP-Empfang (Nachrichten)
 # @param my_udp_port Port für eigenen UDP-Empfänger (KNOWNUSERS)
+# @param multicast Optional (Gruppe, Port) für Nachrichten an alle per Multicast
+# @param heartbeat_interval Sekunden zwischen zwei ALIVE-Nachrichten an den Discovery-Service
+# @param history_dir Verzeichnis für den persistenten Chatverlauf (None = kein Verlauf)
+# @param history_fsync_interval Sekunden zwischen zwei fsync-Aufrufen des Verlaufs
+# @param metrics_enabled Kennzahlen für /stats erfassen
+# @param discovery (IP, Port) des Discovery-Service, z. B. die schnellste Instanz aus probe.probe()
+#        (None = Broadcast an whoisport aus config.toml)
+# @param unix_socket Zusätzlich über einen Unix-Domain-Socket erreichbar sein (Peers auf demselben Rechner)
 #
-# Stellt alle CLI-Befehle bereit: /hilfe, /nutzer, /msg, /exit.
-def start_cli(handle, tcp_port, my_udp_port):
-    # TCP- und UDP-Empfänger starten
+# Stellt alle CLI-Befehle bereit: /hilfe, /nutzer, /msg, /alle, /verlauf, /stats, /exit.
+def start_cli(handle, tcp_port, my_udp_port, multicast=None, heartbeat_interval=HEARTBEAT_INTERVAL,
+              history_dir=HISTORY_DIR, history_fsync_interval=FSYNC_INTERVAL, metrics_enabled=False,
+              discovery=None, unix_socket=True):
+    global chat_verlauf, discovery_adresse
+    if discovery:
+        discovery_adresse = tuple(discovery)
+    else:
+        discovery_adresse = (IP_BROADCAST, load_config()["whoisport"])
+    if metrics_enabled:
+        metrics.enable()
+    if history_dir:
+        chat_verlauf = open_history(history_dir, handle, history_fsync_interval)
+    # TCP- und UDP-Empfänger starten, lokal zusätzlich per Unix-Domain-Socket
     threading.Thread(target=empfange_tcp, args=(tcp_port,), daemon=True).start()
-    threading.Thread(target=udp_empfaenger, args=(my_udp_port, handle), daemon=True).start()
-
-    # JOIN-Nachricht senden (entweder an 4000 oder wie im Protokoll konfiguriert)
-    join_msg = f"JOIN {handle} {tcp_port} {my_udp_port}"
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        sock.sendto(join_msg.encode(), (IP_BROADCAST, 4000))
-    print_system(f"JOIN Nachricht gesendet")
+    faehigkeiten = [DELTA_CAPABILITY, PROTOCOL_V2_CAPABILITY]
+    if unix_socket and unix_server(tcp_port, lese_verbindung):
+        faehigkeiten.append(UNIX_SOCKET_CAPABILITY)
+    join_msg = f"JOIN {handle} {tcp_port} {my_udp_port} {' '.join(faehigkeiten)}"
+    threading.Thread(target=udp_empfaenger, args=(my_udp_port, handle, join_msg, heartbeat_interval),
+                     daemon=True).start()
+    verteiler = FanoutDispatcher()
+    kanal = None
+    if multicast:
+        kanal = MulticastChannel(multicast[0], multicast[1], handle, empfange_nachricht)
 
-    # WHO-Anfrage senden, um aktuelle Nutzer zu erhalten
-    time.sleep(0.5)
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        sock.sendto(b"WHO", (IP_BROADCAST, 4000))
+    # JOIN sendet der UDP-Empfänger, bis die Nutzerliste eintrifft (kein WHO nötig)
 
     # Benutzerbefehlsschleife
     try:
         while True:
             cmd = input(f"{handle}> ").strip()
             if cmd == "/hilfe":
-                print("Befehle:\n/nutzer - Liste aller Nutzer\n/msg <Name> \"Text\" - Nachricht senden\n/exit - Beenden")
+                print("Befehle:\n/nutzer - Liste aller Nutzer\n/msg <Name> \"Text\" - Nachricht senden\n"
+                      "/alle \"Text\" - Nachricht an alle\n"
+                      "/verlauf [Anzahl] [Name] - Letzte Nachrichten anzeigen\n"
+                      "/stats - Kennzahlen (Senden, Empfangen, Latenzen)\n/exit - Beenden")
             elif cmd == "/nutzer":
                 print("🟢 Aktive Nutzer:")
                 found = False
@@ -176,28 +332,60 @@ def start_cli(handle, tcp_port, my_udp_port):
                     if ziel in bekannte_nutzer:
                         ip, port = bekannte_nutzer[ziel]
                         try:
-                            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                                s.settimeout(2.0)
-                                s.connect((ip, port))
-                                s.sendall(f"{handle}: {text}".encode())
-                                print_success(f"Nachricht an {ziel} gesendet")
+                            # Wiederverwendete Verbindung aus dem gemeinsamen Pool
+                            connection_pool.send(ip, port, kodiere_nachricht(ziel, handle, text))
+                            speichere_gesendet(ziel, text)
+                            print_success(f"Nachricht an {ziel} gesendet")
                         except ConnectionRefusedError:
                             print_error(f"{ziel} ist nicht erreichbar (Port {port} geschlossen)")
                         except Exception as e:
                             print_error(f"Fehler: {e}")
                     else:
                         print_error(f"Nutzer '{ziel}' nicht gefunden")
+            elif cmd.startswith("/alle "):
+                # Format: /alle "Text"
+                match = re.match(r'/alle "(.+)"', cmd)
+                if match:
+                    text = match.group(1)
+                    if kanal:
+                        # Ein Multicast-Datagramm statt einer Verbindung pro Nutzer
+                        kanal.send(text)
+                        speichere_gesendet(BROADCAST_PEER, text)
+                        print_success("Nachricht an alle gesendet")
+                    else:
+                        ziele = {n: a for n, a in list(bekannte_nutzer.items()) if n != handle}
+                        fehler = verteiler.run(ziele, lambda name: kodiere_nachricht(name, handle, text))
+                        for name, grund in sorted(fehler.items()):
+                            print_error(f"{name} nicht erreichbar ({grund})")
+                        speichere_gesendet(BROADCAST_PEER, text)
+                        print_success(f"Nachricht an {len(ziele) - len(fehler)} Nutzer gesendet")
+            elif cmd == "/verlauf" or cmd.startswith("/verlauf "):
+                # Format: /verlauf [Anzahl] [Name]
+                args = cmd.split()[1:]
+                anzahl = VERLAUF_ANZAHL
+                if args and args[0].isdigit():
+                    anzahl = int(args.pop(0))
+                zeige_verlauf(anzahl, args[0] if args else None)
+            elif cmd == "/stats":
+                if metrics.enabled:
+                    print(metrics.format_text())
+                else:
+                    print_system("Kennzahlen sind ausgeschaltet (metrics = true in config.toml)")
             elif cmd == "/exit":
                 # LEAVE an alle Discovery-Teilnehmer
                 with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
                     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-                    sock.sendto(f"LEAVE {handle}".encode(), (IP_BROADCAST, 4000))
+                    sock.sendto(f"LEAVE {handle}".encode(), discovery_adresse)
+                connection_pool.close_all()
                 break
     except KeyboardInterrupt:
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-            sock.sendto(f"LEAVE {handle}".encode(), (IP_BROADCAST, 4000))
+            sock.sendto(f"LEAVE {handle}".encode(), discovery_adresse)
         print("\nChat beendet")
+    finally:
+        if chat_verlauf is not None:
+            chat_verlauf.close()
 
 ##
 # @brief Startpunkt für die CLI-Anwendung.
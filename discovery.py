@@ -3,12 +3,44 @@
 # @brief Discovery-Service für Teilnehmererkennung im P2P-Chat
 #
 # Dieses Modul enthält den DiscoveryService, der über UDP Anfragen von Clients
-# (JOIN, WHO, LEAVE) verarbeitet und die Teilnehmerliste verwaltet.
+# (JOIN, WHO, LEAVE, ALIVE, PING) verarbeitet und die Teilnehmerliste verwaltet.
 #
 
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
 import socket
+import sys
 import threading
+import time
+import zlib
 from datetime import datetime
+from roster import DELTA_CAPABILITY, MAX_DATAGRAM_PAYLOAD, RECV_BUFSIZE
+import metrics
+import protocol
+from protocol import PROTOCOL_V2_CAPABILITY
+
+##
+# @var ENGINES
+# @brief Verfügbare Empfangs-Engines des Discovery-Service.
+#
+# "thread": ein Thread pro empfangenem Datagramm (ursprüngliches Verhalten),
+# "asyncio": ein einziger Event-Loop mit DatagramProtocol und wiederverwendetem Socket.
+ENGINES = ("thread", "asyncio")
+
+##
+# @var PARTICIPANT_TTL
+# @brief Sekunden ohne JOIN/ALIVE, nach denen ein Teilnehmer als verschwunden gilt.
+PARTICIPANT_TTL = 30.0
+
+##
+# @var REQUEST_COUNTERS
+# @brief Zählername je Anfragetyp (vorab gebaut, damit pro Datagramm kein String entsteht).
+REQUEST_COUNTERS = {command: f"discovery.requests.{command}" for command in protocol.COMMANDS.values()}
 
 ##
 # @class DiscoveryService
@@ -17,20 +49,50 @@ from datetime import datetime
 # Der DiscoveryService nimmt JOIN-/WHO-/LEAVE-Nachrichten entgegen,
 # verteilt die aktuelle Nutzerliste und sorgt dafür,
 # dass alle Clients sich gegenseitig erkennen können.
+# Delta-fähige Clients erhalten statt der vollen Liste nur versionierte
+# JOINED-/LEFT-Meldungen und bei Bedarf (SYNC) einen SNAPSHOT.
 #
 class DiscoveryService:
+    ##
+    # @var reuse_port
+    # @brief SO_REUSEPORT setzen, damit mehrere Prozesse denselben Port binden können
+    reuse_port = False
+
+    ##
+    # @var verbose
+    # @brief Jede Anfrage protokollieren (kostet bei hoher Last spürbar Durchsatz)
+    verbose = False
+
     ##
     # @brief Konstruktor: Initialisiert Service und Datenstrukturen.
     # @param port UDP-Port für Discovery-Service (Standard: 4000)
-    def __init__(self, port=4000):
+    # @param ttl Ablaufzeit eines Teilnehmers in Sekunden (None oder 0 = nie)
+    def __init__(self, port=4000, ttl=PARTICIPANT_TTL):
         ##
         # @var port
         # @brief Port für eingehende UDP-Anfragen
         self.port = port
         ##
         # @var participants
-        # @brief Dict der angemeldeten Nutzer: Handle → Daten (IP, chat_port, udp_port)
+        # @brief Dict der angemeldeten Nutzer: Handle → Daten (IP, chat_port, udp_port, caps, last_seen)
         self.participants = {}
+        # (IP, UDP-Port) → Handle, für prefers_v2() ohne Durchlauf aller Teilnehmer
+        self._endpoints = {}
+        ##
+        # @var ttl
+        # @brief Ablaufzeit eines Teilnehmers ohne Lebenszeichen (Sekunden)
+        self.ttl = ttl
+        ##
+        # @var expiry
+        # @brief Min-Heap (Ablaufzeitpunkt, Token, Handle); genau ein gültiger Eintrag pro Teilnehmer
+        self.expiry = []
+        self._tokens = itertools.count()
+        ##
+        # @var version
+        # @brief Roster-Version, wird bei jedem JOIN und LEAVE um eins erhöht
+        self.version = 0
+        # (Art, binär) → (Version, Datagramme); wird bei jeder Versionsänderung neu gebaut
+        self._page_cache = {}
         ##
         # @var lock
         # @brief Lock für Thread-Sicherheit beim Zugriff auf participants
@@ -39,109 +101,691 @@ class DiscoveryService:
         # @var running
         # @brief Steuerung, ob der Service weiterläuft
         self.running = True
+        ##
+        # @var sock
+        # @brief Gebundener UDP-Socket (wird in start() bzw. start_async() gesetzt)
+        self.sock = None
+        ##
+        # @var transport
+        # @brief asyncio-Transport im asyncio-Modus; wird auch zum Senden wiederverwendet
+        self.transport = None
+        self._loop = None
+        self._stop_event = None
 
     ##
     # @brief Verarbeitet eine eingehende UDP-Anfrage.
     # @param data Empfangene UDP-Daten (Bytes)
     # @param addr Absenderadresse (IP, Port)
     #
-    # Erkennt JOIN, WHO und LEAVE und reagiert entsprechend.
+    # Erkennt JOIN, WHO, SYNC, ALIVE, PING und LEAVE (als Text oder binär nach SLCP v2)
+    # und reagiert entsprechend.
     def handle_request(self, data, addr):
+        start = metrics.now()
         try:
-            msg = data.decode("utf-8").strip()
-            print(f"[DISCOVERY] {datetime.now().strftime('%H:%M:%S')} - Received from {addr}: {msg}")
-
-            # JOIN <Handle> <TCP-Port> <UDP-Port>
-            if msg.startswith("JOIN"):
-                parts = msg.split()
-                if len(parts) == 4:
-                    handle = parts[1]
-                    chat_port = int(parts[2])
-                    udp_port = int(parts[3])
-                    with self.lock:
-                        self.participants[handle] = {
-                            'ip': addr[0],
-                            'chat_port': chat_port,
-                            'udp_port': udp_port
-                        }
+            binary = protocol.is_v2(data)
+            request = protocol.parse(data)
+            metrics.since("discovery.parse_seconds", start)
+            metrics.inc("discovery.bytes_received", len(data))
+            if request is None:
+                if self.verbose:
+                    print(f"[DISCOVERY] {datetime.now().strftime('%H:%M:%S')} - Unknown request from {addr}: "
+                          f"{data.hex() if binary else data.decode('utf-8', 'replace').strip()}")
+                metrics.inc("discovery.requests.unknown")
+                return
+            if self.verbose:
+                print(f"[DISCOVERY] {datetime.now().strftime('%H:%M:%S')} - Received from {addr}: "
+                      f"{' '.join(map(str, request)) if binary else data.decode('utf-8', 'replace').strip()}")
+            command = request[0]
+            metrics.inc(REQUEST_COUNTERS.get(command, "discovery.requests.unknown"))
+
+            if command == "JOIN":
+                _, handle, chat_port, udp_port, caps = request
+                if udp_port is None:
+                    return
+                if self.verbose:
                     print(f"[JOIN] {handle} @ {addr[0]}:{chat_port} (UDP-Clientport: {udp_port})")
-                    self.broadcast_participants()
+                self.add_participant(handle, addr[0], chat_port, udp_port, caps)
 
             # WHO: Schickt aktuelle Nutzerliste an anfragenden Client
-            elif msg == "WHO":
-                self.send_participants(addr)
+            elif command == "WHO":
+                self.send_participants(addr, binary or self.prefers_v2(addr))
 
-            # LEAVE <Handle>: Entfernt Nutzer aus Liste
-            elif msg.startswith("LEAVE"):
-                handle = msg.split()[1]
+            # SYNC: Delta-Client will einen SNAPSHOT
+            # (komplett oder nur die fehlenden Seiten einer bestimmten Version)
+            elif command == "SYNC":
+                _, version, pages = request
+                self.send_snapshot(addr, version, pages, binary or self.prefers_v2(addr))
+
+            # ALIVE <Handle>: Lebenszeichen; unbekannte Clients werden um ein neues JOIN gebeten
+            elif command == "ALIVE":
+                rejoin = protocol.encode_empty(protocol.REJOIN) if binary else "REJOIN"
+                if not self.touch_participant(request[1], (rejoin, addr[0], addr[1])):
+                    self.send_message(rejoin, addr[0], addr[1])
+
+            # PING <Nonce>: Erreichbarkeitsprobe, Antwort sofort und ohne Anmeldung
+            elif command == "PING":
                 with self.lock:
-                    if handle in self.participants:
-                        del self.participants[handle]
-                        print(f"[DISCOVERY] {handle} left the chat")
+                    participants, version = len(self.participants), self.version
+                self.send_message(protocol.encode_pong(request[1], participants, version, binary), addr[0], addr[1])
+
+            # LEAVE <Handle>: Entfernt Nutzer aus Liste
+            elif command == "LEAVE":
+                if self.remove_participant(request[1]) and self.verbose:
+                    print(f"[DISCOVERY] {request[1]} left the chat")
 
         except Exception as e:
+            metrics.inc("discovery.errors")
             print(f"[DISCOVERY ERROR] {e}")
+        finally:
+            metrics.since("discovery.handle_seconds", start)
+
+    ##
+    # @brief Prüft, ob ein angemeldeter Client unter dieser Adresse SLCP v2 versteht.
+    # @param addr Absenderadresse (IP, UDP-Port)
+    # @return True, falls der Client "v2" im JOIN angemeldet hat
+    #
+    # Clients senden SYNC/WHO als Text, erhalten die Antwort aber binär, wenn sie v2 können.
+    def prefers_v2(self, addr):
+        with self.lock:
+            data = self.participants.get(self._endpoints.get((addr[0], addr[1])))
+            return data is not None and PROTOCOL_V2_CAPABILITY in data['caps']
+
+    ##
+    # @brief Trägt einen Teilnehmer in participants und den Adressindex ein (Lock halten).
+    # @param handle Name des Teilnehmers
+    # @param data Teilnehmerdaten
+    def set_participant(self, handle, data):
+        self.drop_participant(handle)
+        self.participants[handle] = data
+        self._endpoints[(data['ip'], data['udp_port'])] = handle
+
+    ##
+    # @brief Entfernt einen Teilnehmer aus participants und dem Adressindex (Lock halten).
+    # @param handle Name des Teilnehmers
+    def drop_participant(self, handle):
+        data = self.participants.pop(handle, None)
+        if data is not None and self._endpoints.get((data['ip'], data['udp_port'])) == handle:
+            del self._endpoints[(data['ip'], data['udp_port'])]
+
+    ##
+    # @brief Trägt einen Teilnehmer ein und verteilt die Änderung.
+    # @param handle Name des Teilnehmers
+    # @param ip IP-Adresse des Teilnehmers
+    # @param chat_port TCP-Port für Nachrichten
+    # @param udp_port UDP-Port des Discovery-Listeners beim Client
+    # @param caps Fähigkeiten aus dem JOIN (z. B. "delta")
+    #
+    # Delta-fähige Clients erhalten nur JOINED, der neue Client selbst einen SNAPSHOT.
+    # Alte Clients bekommen wie bisher die komplette KNOWNUSERS-Liste.
+    # Die Liste an den neuen Client bestätigt zugleich sein JOIN. Wiederholt er
+    # das JOIN unverändert (Bestätigung verloren), wird nur sein Lebenszeichen
+    # erneuert und ihm die Liste noch einmal geschickt, ohne neue Version.
+    def add_participant(self, handle, ip, chat_port, udp_port, caps=()):
+        now = time.monotonic()
+        caps = set(caps)
+        with self.lock:
+            previous = self.participants.get(handle)
+            if previous is not None and (previous['ip'], previous['chat_port'], previous['udp_port'],
+                                         previous['caps']) == (ip, chat_port, udp_port, caps):
+                previous['last_seen'] = now
+                event = "ack"
+            else:
+                self.set_participant(handle, {
+                    'ip': ip,
+                    'chat_port': chat_port,
+                    'udp_port': udp_port,
+                    'caps': caps,
+                    'last_seen': now,
+                    'token': previous['token'] if previous else next(self._tokens)
+                })
+                if previous is None and self.ttl:
+                    heapq.heappush(self.expiry, (now + self.ttl, self.participants[handle]['token'], handle))
+                self.version += 1
+                event = "join"
+            version, data = self.version, self.participants[handle]
+        self.publish(event, version, handle, data)
 
     ##
-    # @brief Sendet aktuelle Teilnehmerliste an alle bekannten Nutzer (UDP).
+    # @brief Verteilt eine Roster-Änderung an die Clients.
+    # @param event "join", "leave" oder "ack" (wiederholtes JOIN, keine Änderung)
+    # @param version Roster-Version nach der Änderung
+    # @param handle Betroffener Teilnehmer
+    # @param data Teilnehmerdaten (bei "join")
     #
-    # Die Nachricht hat das Format: KNOWNUSERS <Name1> <IP1> <Port1> ...
-    def broadcast_participants(self):
+    # Standard: direkt per UDP an alle Teilnehmer, für die dieser Prozess zuständig ist
+    # (siehe owns()). Im Mehrprozessbetrieb leitet der Roster-Besitzer stattdessen weiter.
+    def publish(self, event, version, handle, data=None):
+        start = metrics.now()
         with self.lock:
-            msg = "KNOWNUSERS " + " ".join(
-                f"{h} {d['ip']} {d['chat_port']}"
-                for h, d in self.participants.items()
-            )
+            messages = self.notifications(event, version, handle, data)
+            metrics.gauge("discovery.participants", len(self.participants))
+            metrics.gauge("discovery.version", version)
         # Sende an jeden Client individuell auf seinen UDP-Listener
-        for h, d in self.participants.items():
-            self.send_message(msg, d['ip'], d['udp_port'])
+        for msg, target_ip, target_port in messages:
+            self.send_message(msg, target_ip, target_port)
+        metrics.inc("discovery.notifications", len(messages))
+        metrics.since("discovery.publish_seconds", start)
+
+    ##
+    # @brief Baut die Benachrichtigungen zu einer Änderung (Aufruf nur mit gehaltenem Lock).
+    # @return Liste von (Nachricht, IP, UDP-Port)
+    #
+    # JOIN: Delta-Clients erhalten JOINED, der neue Client einen SNAPSHOT, alte
+    # Clients die komplette KNOWNUSERS-Liste. LEAVE: Delta-Clients erhalten LEFT.
+    # ACK: nur der Client selbst erhält die Liste (SNAPSHOT bzw. KNOWNUSERS) erneut.
+    def notifications(self, event, version, handle, data=None):
+        if event == "ack":
+            if not self.owns(handle):
+                return []
+            binary = PROTOCOL_V2_CAPABILITY in data['caps']
+            pages = self.snapshot_pages(binary) if DELTA_CAPABILITY in data['caps'] else self.knownusers_pages(binary)
+            return [(page, data['ip'], data['udp_port']) for page in pages]
+        messages = []
+        targets = [(h, d) for h, d in self.participants.items() if self.owns(h)]
+        if event == "leave":
+            left = (protocol.encode_left(version, handle, binary=False), protocol.encode_left(version, handle))
+            return [(left[PROTOCOL_V2_CAPABILITY in d['caps']], d['ip'], d['udp_port'])
+                    for h, d in targets if DELTA_CAPABILITY in d['caps']]
+        flags = protocol.capability_flags(data['caps'])
+        joined = tuple(protocol.encode_joined(version, handle, data['ip'], data['chat_port'], flags, binary)
+                       for binary in (False, True))
+        for h, d in targets:
+            binary = PROTOCOL_V2_CAPABILITY in d['caps']
+            if DELTA_CAPABILITY not in d['caps']:
+                messages += [(page, d['ip'], d['udp_port']) for page in self.knownusers_pages(binary)]
+            elif h == handle:
+                messages += [(page, d['ip'], d['udp_port']) for page in self.snapshot_pages(binary)]
+            else:
+                messages.append((joined[binary], d['ip'], d['udp_port']))
+        return messages
+
+    ##
+    # @brief Gibt an, ob dieser Prozess Benachrichtigungen an einen Teilnehmer verschickt.
+    # @param handle Name des Teilnehmers
+    # @return Immer True im Einzelprozessbetrieb
+    def owns(self, handle):
+        return True
+
+    ##
+    # @brief Vermerkt ein Lebenszeichen (ALIVE) eines Teilnehmers.
+    # @param handle Name des Teilnehmers
+    # @param rejoin (Nachricht, IP, Port) des REJOIN an den Absender; nur im Mehrprozessbetrieb
+    #        benutzt, wo der DiscoveryOwner entscheidet (siehe DiscoveryWorker)
+    # @return False, falls der Teilnehmer nicht (mehr) bekannt ist (Aufrufer sendet REJOIN)
+    #
+    # O(1): Der Heap wird erst beim Ablauf des alten Eintrags nachgeführt.
+    def touch_participant(self, handle, rejoin=None):
+        with self.lock:
+            data = self.participants.get(handle)
+            if data is None:
+                return False
+            data['last_seen'] = time.monotonic()
+            return True
+
+    ##
+    # @brief Entfernt alle Teilnehmer, deren letztes Lebenszeichen älter als ttl ist.
+    # @return Sekunden bis zum nächsten möglichen Ablauf (None, wenn niemand angemeldet ist)
+    #
+    # Es werden nur abgelaufene Heap-Einträge betrachtet (O(log N) pro Eintrag).
+    # Hat sich ein Teilnehmer inzwischen gemeldet, wird sein Eintrag mit dem neuen
+    # Ablaufzeitpunkt zurückgelegt; Einträge entfernter Teilnehmer verfallen.
+    def expire_participants(self):
+        if not self.ttl:
+            return None
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.expiry and self.expiry[0][0] <= now:
+                _, token, handle = heapq.heappop(self.expiry)
+                data = self.participants.get(handle)
+                if data is None or data['token'] != token:
+                    continue
+                deadline = data['last_seen'] + self.ttl
+                if deadline <= now:
+                    expired.append((handle, data['last_seen']))
+                else:
+                    heapq.heappush(self.expiry, (deadline, token, handle))
+            delay = self.expiry[0][0] - now if self.expiry else None
+        for handle, last_seen in expired:
+            if self.remove_participant(handle, seen_before=last_seen + 1e-9):
+                metrics.inc("discovery.expired")
+                print(f"[DISCOVERY] {handle} timed out")
+        return delay
+
+    ##
+    # @brief Prüft regelmäßig auf abgelaufene Teilnehmer (Thread-Engine).
+    def expiry_loop(self):
+        while self.running:
+            delay = self.expire_participants()
+            time.sleep(min(delay if delay is not None else self.ttl, self.ttl))
+
+    ##
+    # @brief Prüft auf abgelaufene Teilnehmer und plant den nächsten Lauf (asyncio-Engine).
+    def _expire_async(self):
+        delay = self.expire_participants()
+        if self.running:
+            self._loop.call_later(delay if delay is not None else self.ttl, self._expire_async)
+
+    ##
+    # @brief Entfernt einen Teilnehmer und meldet LEFT an alle Delta-Clients.
+    # @param handle Name des Teilnehmers
+    # @param seen_before Nur entfernen, wenn das letzte Lebenszeichen davor liegt (Ablauf)
+    # @return True, falls der Teilnehmer bekannt war
+    def remove_participant(self, handle, seen_before=None):
+        with self.lock:
+            if handle not in self.participants:
+                return False
+            if seen_before is not None and self.participants[handle]['last_seen'] >= seen_before:
+                return False
+            self.drop_participant(handle)
+            self.version += 1
+            version = self.version
+        self.publish("leave", version, handle)
+        return True
+
+    ##
+    # @brief Liefert die Einträge aller Teilnehmer (Lock halten).
+    # @return Liste von (Name, IP, Port, Fähigkeiten-Bits)
+    def roster_records(self):
+        return [(h, d['ip'], d['chat_port'], protocol.capability_flags(d['caps']))
+                for h, d in self.participants.items()]
+
+    ##
+    # @brief Baut die alten KNOWNUSERS-Nachrichten (Aufruf nur mit gehaltenem Lock).
+    # @param binary True: als SLCP-v2-Datagramme
+    # @return Liste von Datagrammen "KNOWNUSERS <Name1> <IP1> <Port1> ..."
+    #
+    # Große Listen werden auf mehrere vollständige KNOWNUSERS-Datagramme verteilt;
+    # alte Clients übernehmen jede Teilliste additiv.
+    def knownusers_pages(self, binary=False):
+        cached = self._page_cache.get(("knownusers", binary))
+        if cached is None or cached[0] != self.version:
+            pages = protocol.encode_pages(protocol.KNOWNUSERS, self.roster_records(), MAX_DATAGRAM_PAYLOAD,
+                                          binary=binary)
+            cached = self._page_cache[("knownusers", binary)] = (self.version, pages)
+        return cached[1]
+
+    ##
+    # @brief Baut einen versionierten SNAPSHOT (Aufruf nur mit gehaltenem Lock).
+    # @param binary True: als SLCP-v2-Datagramme
+    # @return Liste von Datagrammen "SNAPSHOT <Version> <Seite>/<Gesamt> <Name1> <IP1> <Port1> ..."
+    def snapshot_pages(self, binary=False):
+        cached = self._page_cache.get(("snapshot", binary))
+        if cached is None or cached[0] != self.version:
+            pages = protocol.encode_pages(protocol.SNAPSHOT, self.roster_records(), MAX_DATAGRAM_PAYLOAD,
+                                          self.version, binary)
+            cached = self._page_cache[("snapshot", binary)] = (self.version, pages)
+        return cached[1]
 
     ##
     # @brief Antwortet gezielt auf eine WHO-Anfrage mit der Nutzerliste.
     # @param addr Zieladresse (IP, Port) des anfragenden Clients
-    def send_participants(self, addr):
+    # @param binary True: Antwort als SLCP v2
+    def send_participants(self, addr, binary=False):
+        with self.lock:
+            pages = self.knownusers_pages(binary)
+        for page in pages:
+            self.send_message(page, addr[0], addr[1])
+
+    ##
+    # @brief Antwortet auf SYNC mit der aktuellen Liste samt Version.
+    # @param addr Zieladresse (IP, Port) des anfragenden Clients
+    # @param version Version, zu der Seiten fehlen (None = kompletter Snapshot)
+    # @param missing Fehlende Seitennummern (1-basiert)
+    # @param binary True: Antwort als SLCP v2
+    #
+    # Ist die angefragte Version inzwischen veraltet, wird der aktuelle Snapshot
+    # vollständig gesendet.
+    def send_snapshot(self, addr, version=None, missing=None, binary=False):
         with self.lock:
-            msg = "KNOWNUSERS " + " ".join(
-                f"{h} {d['ip']} {d['chat_port']}"
-                for h, d in self.participants.items()
-            )
-        self.send_message(msg, addr[0], addr[1])
+            pages = self.snapshot_pages(binary)
+            if version == self.version and missing:
+                pages = [pages[i - 1] for i in missing if 1 <= i <= len(pages)]
+        for page in pages:
+            self.send_message(page, addr[0], addr[1])
 
     ##
     # @brief Verschickt eine UDP-Nachricht an einen Client.
-    # @param msg Nachrichtentext (String)
+    # @param msg Nachrichtentext (String) oder fertig kodierte SLCP-v2-Nachricht (Bytes)
     # @param ip Ziel-IP
     # @param port Ziel-Port
-    @staticmethod
-    def send_message(msg, ip, port):
+    #
+    # Im asyncio-Modus wird der gebundene Transport wiederverwendet,
+    # im Thread-Modus wird pro Antwort ein eigener Socket geöffnet.
+    def send_message(self, msg, ip, port):
+        payload = msg if isinstance(msg, bytes) else msg.encode("utf-8")
+        metrics.inc("discovery.datagrams_sent")
+        metrics.inc("discovery.bytes_sent", len(payload))
+        if self.transport is not None:
+            self.transport.sendto(payload, (ip, port))
+            return
         with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-            sock.sendto(msg.encode("utf-8"), (ip, port))
+            sock.sendto(payload, (ip, port))
 
     ##
-    # @brief Startet den Discovery-Service (UDP-Server), verarbeitet eingehende Nachrichten.
-    #
-    # Hauptschleife: wartet auf Daten, startet für jede Nachricht einen Thread zur Verarbeitung.
-    def start(self):
+    # @brief Erzeugt und bindet den UDP-Socket des Discovery-Service.
+    # @return Gebundener UDP-Socket
+    def create_socket(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         sock.bind(("0.0.0.0", self.port))
+        self.port = sock.getsockname()[1]
+        return sock
+
+    ##
+    # @brief Startet den Discovery-Service (UDP-Server), verarbeitet eingehende Nachrichten.
+    #
+    # Hauptschleife: wartet auf Daten, startet für jede Nachricht einen Thread zur Verarbeitung.
+    def start(self):
+        sock = self.sock = self.create_socket()
         print(f"[DISCOVERY] Service started on port {self.port}")
+        if self.ttl:
+            threading.Thread(target=self.expiry_loop, daemon=True).start()
         try:
             while self.running:
-                data, addr = sock.recvfrom(1024)
+                data, addr = sock.recvfrom(RECV_BUFSIZE)
+                if not self.running:
+                    break
                 threading.Thread(target=self.handle_request, args=(data, addr)).start()
         finally:
             sock.close()
 
+    ##
+    # @brief Startet den Discovery-Service im asyncio-Modus.
+    #
+    # Alle JOIN-/WHO-/LEAVE-Anfragen werden nacheinander auf einem Event-Loop
+    # verarbeitet; Antworten laufen über denselben Socket (Transport).
+    def start_async(self):
+        asyncio.run(self._serve_async())
+
+    async def _serve_async(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self.sock = self.create_socket()
+        transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: DiscoveryProtocol(self), sock=self.sock)
+        print(f"[DISCOVERY] Service started on port {self.port} (asyncio)")
+        if self.ttl:
+            self._loop.call_later(self.ttl, self._expire_async)
+        try:
+            if self.running:
+                await self._stop_event.wait()
+        finally:
+            transport.close()
+            self.transport = None
+
+    ##
+    # @brief Startet den Service mit der gewünschten Engine.
+    # @param engine "thread" oder "asyncio"
+    def run(self, engine="thread"):
+        if engine == "asyncio":
+            self.start_async()
+        else:
+            self.start()
+
+    ##
+    # @brief Beendet den laufenden Service (aus einem anderen Thread aufrufbar).
+    def stop(self):
+        self.running = False
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        elif self.sock is not None:
+            # Blockierendes recvfrom() mit einem leeren Datagramm aufwecken
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.sendto(b"", ("127.0.0.1", self.port))
+
+##
+# @class DiscoveryProtocol
+# @brief asyncio-Protokoll, das empfangene Datagramme an den DiscoveryService weitergibt.
+#
+# Ersetzt im asyncio-Modus den Thread pro Datagramm: jede Anfrage wird direkt
+# im Event-Loop verarbeitet, Antworten gehen über den gemeinsamen Transport.
+#
+class DiscoveryProtocol(asyncio.DatagramProtocol):
+    ##
+    # @brief Konstruktor.
+    # @param service Zugehöriger DiscoveryService
+    def __init__(self, service):
+        self.service = service
+
+    ##
+    # @brief Merkt sich den Transport im Service, damit Antworten ihn wiederverwenden.
+    # @param transport Datagramm-Transport des Event-Loops
+    def connection_made(self, transport):
+        self.service.transport = transport
+
+    ##
+    # @brief Verarbeitet ein eingehendes Datagramm direkt im Event-Loop.
+    # @param data Empfangene UDP-Daten (Bytes)
+    # @param addr Absenderadresse (IP, Port)
+    def datagram_received(self, data, addr):
+        if data:
+            self.service.handle_request(data, addr)
+
+    ##
+    # @brief Meldet Sendefehler (z. B. ICMP Port Unreachable) ohne den Loop zu beenden.
+    # @param exc Aufgetretene Ausnahme
+    def error_received(self, exc):
+        print(f"[DISCOVERY ERROR] {exc}")
+
+##
+# @class DiscoveryWorker
+# @brief Worker-Prozess im Mehrprozessbetrieb (--workers N).
+#
+# Mehrere Worker binden den Discovery-Port mit SO_REUSEPORT; der Kernel verteilt
+# die Datagramme auf sie. Worker parsen Anfragen und beantworten WHO/SYNC aus
+# einer lokalen Kopie der Teilnehmerliste. Änderungen (JOIN, ALIVE, LEAVE) gehen
+# über eine gemeinsame Queue an den DiscoveryOwner, der die Liste allein führt
+# und jede Änderung über eine Pipe an alle Worker zurückspielt. Die Benachrichtigung
+# der Clients ist auf die Worker aufgeteilt (siehe owns()).
+#
+class DiscoveryWorker(DiscoveryService):
+    reuse_port = True
+
+    ##
+    # @brief Konstruktor.
+    # @param port Gemeinsamer UDP-Port
+    # @param index Nummer dieses Workers (0 … count-1)
+    # @param count Anzahl der Worker
+    # @param commands multiprocessing.Queue zum DiscoveryOwner
+    # @param updates Empfangsende der Pipe vom DiscoveryOwner
+    def __init__(self, port, index, count, commands, updates):
+        super().__init__(port, ttl=0)
+        self.index = index
+        self.count = count
+        self.commands = commands
+        self.updates = updates
+
+    def add_participant(self, handle, ip, chat_port, udp_port, caps=()):
+        self.commands.put(("join", handle, ip, chat_port, udp_port, list(caps)))
+
+    ##
+    # @brief Leitet ein ALIVE an den DiscoveryOwner weiter; ob ein REJOIN nötig ist, entscheidet er.
+    # @return Immer True
+    #
+    # Die lokale Kopie kann einem gerade weitergeleiteten JOIN (auch über einen
+    # anderen Worker) hinterherhinken; ein REJOIN von hier wäre dann falsch.
+    def touch_participant(self, handle, rejoin=None):
+        self.commands.put(("alive", handle, rejoin))
+        return True
+
+    def remove_participant(self, handle, seen_before=None):
+        self.commands.put(("leave", handle))
+        with self.lock:
+            return handle in self.participants
+
+    ##
+    # @brief Zuständigkeit für Benachrichtigungen: fester Anteil der Handles pro Worker.
+    # @param handle Name des Teilnehmers
+    # @return True, wenn dieser Worker den Teilnehmer benachrichtigt
+    def owns(self, handle):
+        return zlib.crc32(handle.encode("utf-8")) % self.count == self.index
+
+    ##
+    # @brief Übernimmt eine Änderung des DiscoveryOwner und benachrichtigt die eigenen Clients.
+    # @param event "join", "leave", "ack" oder "rejoin" (unbekanntes ALIVE)
+    # @param version Roster-Version nach der Änderung
+    # @param handle Betroffener Teilnehmer
+    # @param data Teilnehmerdaten (bei "join"); bei "rejoin" (Nachricht, IP, Port)
+    def apply_update(self, event, version, handle, data):
+        if event == "rejoin":
+            if self.owns(handle):
+                self.send_message(*data)
+            return
+        with self.lock:
+            if event in ("join", "ack"):
+                self.set_participant(handle, data)
+            else:
+                self.drop_participant(handle)
+            self.version = version
+        self.publish(event, version, handle, data)
+
+    ##
+    # @brief Liest Änderungen aus der Pipe (eigener Thread).
+    def follow_updates(self):
+        while True:
+            try:
+                update = self.updates.recv()
+            except EOFError:
+                return
+            if self._loop is not None:
+                # asyncio-Modus: Transport nur aus dem Event-Loop benutzen
+                self._loop.call_soon_threadsafe(self.apply_update, *update)
+            else:
+                self.apply_update(*update)
+
+    def run(self, engine="thread"):
+        threading.Thread(target=self.follow_updates, daemon=True).start()
+        super().run(engine)
+
+##
+# @class DiscoveryOwner
+# @brief Führt im Mehrprozessbetrieb die einzige gültige Teilnehmerliste.
+#
+# Bindet keinen Port, sondern verarbeitet die Änderungswünsche der Worker
+# nacheinander, vergibt die Roster-Versionen, kümmert sich um den Ablauf
+# (TTL) und spielt jede Änderung an alle Worker zurück.
+#
+class DiscoveryOwner(DiscoveryService):
+    ##
+    # @brief Konstruktor.
+    # @param ttl Ablaufzeit eines Teilnehmers in Sekunden
+    # @param commands multiprocessing.Queue mit Änderungswünschen der Worker
+    # @param pipes Sendeenden der Pipes zu den Workern
+    def __init__(self, ttl, commands, pipes):
+        super().__init__(0, ttl)
+        self.commands = commands
+        self.pipes = pipes
+
+    def publish(self, event, version, handle, data=None):
+        for pipe in self.pipes:
+            pipe.send((event, version, handle, data))
+
+    ##
+    # @brief Hauptschleife: Änderungen anwenden und abgelaufene Teilnehmer entfernen.
+    def serve(self):
+        while self.running:
+            delay = self.expire_participants()
+            try:
+                command = self.commands.get(timeout=min(delay if delay is not None else 1.0, 1.0))
+            except queue.Empty:
+                continue
+            kind, handle = command[0], command[1]
+            if kind == "join":
+                self.add_participant(*command[1:])
+            elif kind == "alive":
+                if not self.touch_participant(handle) and command[2] is not None:
+                    # Nur der zuständige Worker schickt das REJOIN
+                    self.publish("rejoin", self.version, handle, command[2])
+            elif kind == "leave":
+                self.remove_participant(handle)
+
+##
+# @brief Einstiegspunkt eines Worker-Prozesses.
+def run_worker(port, index, count, engine, commands, updates, stats_port=None, verbose=False):
+    if stats_port:
+        metrics.enable()
+        metrics.serve_http(stats_port + index)
+    try:
+        worker = DiscoveryWorker(port, index, count, commands, updates)
+        worker.verbose = verbose
+        worker.run(engine)
+    except KeyboardInterrupt:
+        pass
+
+##
+# @brief Startet den Discovery-Service mit mehreren Worker-Prozessen.
+# @param port Gemeinsamer UDP-Port
+# @param count Anzahl der Worker-Prozesse
+# @param engine Engine der Worker ("thread" oder "asyncio")
+# @param ttl Ablaufzeit eines Teilnehmers in Sekunden
+# @param stats_port Erster Port der Kennzahlen-Endpunkte (Worker i: stats_port + i), None = aus
+# @param verbose Jede Anfrage protokollieren
+#
+# Der aufrufende Prozess wird zum DiscoveryOwner.
+def run_workers(port, count, engine="thread", ttl=PARTICIPANT_TTL, stats_port=None, verbose=False):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise SystemExit("[DISCOVERY ERROR] --workers benötigt SO_REUSEPORT (z. B. Linux)")
+    commands = multiprocessing.Queue()
+    pipes, processes = [], []
+    for index in range(count):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=run_worker, daemon=True,
+                                          args=(port, index, count, engine, commands, receiver,
+                                                stats_port, verbose))
+        process.start()
+        pipes.append(sender)
+        processes.append(process)
+    print(f"[DISCOVERY] Service started on port {port} ({count} workers, {engine})")
+    # Auch bei SIGTERM die Worker beenden, sonst halten sie den Port weiter belegt
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        DiscoveryOwner(ttl, commands, pipes).serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+
 ##
 # @brief Startet den Discovery-Service von der Kommandozeile aus.
+#
+# Aufruf: python3 discovery.py [port] [--engine thread|asyncio] [--workers N] [--stats-port P] [--verbose]
 def start_discovery():
-    import sys
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
-    service = DiscoveryService(port)
-    service.start()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("port", nargs="?", type=int, default=4000, help="UDP-Port des Discovery-Dienstes")
+    parser.add_argument("--engine", choices=ENGINES, default="thread",
+                        help="Verarbeitung: Thread pro Datagramm oder asyncio-Event-Loop")
+    parser.add_argument("--ttl", type=float,
+                        help="Sekunden ohne Lebenszeichen bis zum Entfernen (0 = nie; "
+                             "Standard: participant_ttl aus config.toml)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Anzahl Worker-Prozesse, die den Port per SO_REUSEPORT teilen")
+    parser.add_argument("--stats-port", type=int,
+                        help="Kennzahlen erfassen und unter http://127.0.0.1:<Port>/stats als JSON anbieten "
+                             "(mit --workers: ein Port pro Worker ab diesem)")
+    parser.add_argument("--verbose", action="store_true", help="Jede empfangene Anfrage ausgeben")
+    args = parser.parse_args()
+    ttl = args.ttl
+    if ttl is None:
+        ttl = PARTICIPANT_TTL
+        if os.path.exists("config.toml"):
+            from settings import load_config
+            ttl = float(load_config().get("participant_ttl", PARTICIPANT_TTL))
+    if args.workers > 1:
+        run_workers(args.port, args.workers, args.engine, ttl, args.stats_port, args.verbose)
+        return
+    if args.stats_port:
+        metrics.enable()
+        metrics.serve_http(args.stats_port)
+    service = DiscoveryService(args.port, ttl)
+    service.verbose = args.verbose
+    service.run(args.engine)
 
 if __name__ == "__main__":
     start_discovery()
@@ -0,0 +1,324 @@
+##
+# @file history.py
+# @brief Persistenter Chatverlauf: binäres Append-only-Log mit Offset-Index.
+#
+# Jeder Client schreibt seine Nachrichten in zwei Dateien:
+# - <Pfad>.log: Datensätze hintereinander, nur angehängt, nie überschrieben
+# - <Pfad>.idx: pro Datensatz ein Eintrag fester Länge (Offset im Log, Prüfsumme des Peers)
+#
+# Datensatz (Little Endian):
+#   CRC32 (4) | Zeitstempel double (8) | Richtung (1) | Art (1) | Peer-Länge (2) | Text-Länge (4) | Peer | Text
+#
+# Gelesen wird über mmap: "die letzten N Nachrichten" kostet nur N Indexeinträge,
+# "Nachrichten von Peer X" läuft rückwärts über den kompakten Index, ohne das Log
+# komplett zu lesen. Schreiben ist gepuffert; fsync erfolgt gesammelt im
+# Abstand fsync_interval statt einmal pro Nachricht. Nach einem Absturz
+# werden beim Öffnen unvollständige Datensätze abgeschnitten und fehlende
+# Indexeinträge aus dem Log nachgetragen.
+##
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+##
+# @var HISTORY_DIR
+# @brief Standardverzeichnis für die Verlaufsdateien (eine Datei pro Handle).
+HISTORY_DIR = "./Verlauf"
+
+##
+# @var FSYNC_INTERVAL
+# @brief Sekunden zwischen zwei fsync-Aufrufen (0 = nach jeder Nachricht).
+FSYNC_INTERVAL = 1.0
+
+##
+# @var DIRECTION_IN
+# @brief Richtung: empfangene Nachricht.
+DIRECTION_IN = 0
+
+##
+# @var DIRECTION_OUT
+# @brief Richtung: gesendete Nachricht.
+DIRECTION_OUT = 1
+
+##
+# @var KIND_TEXT
+# @brief Art: Textnachricht.
+KIND_TEXT = 0
+
+##
+# @var KIND_IMAGE
+# @brief Art: Bild (Text enthält den Dateipfad).
+KIND_IMAGE = 1
+
+##
+# @var BROADCAST_PEER
+# @brief Peer-Eintrag für Nachrichten an alle.
+BROADCAST_PEER = "*"
+
+RECORD_HEADER = struct.Struct("<IdBBHI")
+INDEX_ENTRY = struct.Struct("<QI")
+
+# Anzahl Indexeinträge, die bei der Suche nach einem Peer auf einmal entpackt werden
+SCAN_CHUNK = 4096
+
+##
+# @class HistoryEntry
+# @brief Eine gespeicherte Nachricht.
+#
+# index: laufende Nummer im Verlauf, timestamp: Unix-Zeit, direction: DIRECTION_IN/OUT,
+# kind: KIND_TEXT/KIND_IMAGE, peer: Gegenüber (oder BROADCAST_PEER), text: Inhalt.
+HistoryEntry = namedtuple("HistoryEntry", "index timestamp direction kind peer text")
+
+##
+# @brief Prüfsumme eines Peer-Namens für den Index.
+# @param peer Name des Peers
+# @return CRC32 des UTF-8-kodierten Namens
+def peer_hash(peer):
+    return zlib.crc32(peer.encode("utf-8"))
+
+##
+# @brief Liest einen Datensatz aus dem Log.
+# @param data Log-Inhalt (mmap oder bytes)
+# @param offset Beginn des Datensatzes
+# @return (timestamp, direction, kind, peer, text, Ende) oder None, falls unvollständig/beschädigt
+def parse_record(data, offset):
+    if offset + RECORD_HEADER.size > len(data):
+        return None
+    crc, timestamp, direction, kind, peer_len, text_len = RECORD_HEADER.unpack_from(data, offset)
+    start = offset + RECORD_HEADER.size
+    end = start + peer_len + text_len
+    if end > len(data):
+        return None
+    body = data[offset + 4:end]
+    if zlib.crc32(body) != crc:
+        return None
+    peer = data[start:start + peer_len].decode("utf-8", "replace")
+    text = data[start + peer_len:end].decode("utf-8", "replace")
+    return timestamp, direction, kind, peer, text, end
+
+##
+# @class HistoryStore
+# @brief Append-only-Nachrichtenlog mit Index, gepuffertem Schreiben und mmap-Lesen.
+#
+# Thread-sicher: append() darf aus beliebigen Empfangs-Threads aufgerufen werden.
+#
+class HistoryStore:
+    ##
+    # @brief Öffnet (bzw. erzeugt) einen Verlauf und repariert ihn bei Bedarf.
+    # @param path Pfad ohne Endung; verwendet <path>.log und <path>.idx
+    # @param fsync_interval Sekunden zwischen zwei fsync-Aufrufen (0 = nach jeder Nachricht)
+    def __init__(self, path, fsync_interval=FSYNC_INTERVAL):
+        self.log_path = path + ".log"
+        self.index_path = path + ".idx"
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self._recover()
+        self._log = open(self.log_path, "ab")
+        self._index = open(self.index_path, "ab")
+        self._dirty = False
+        self._closed = threading.Event()
+        if fsync_interval > 0:
+            threading.Thread(target=self._sync_loop, daemon=True).start()
+
+    ##
+    # @brief Bringt Log und Index nach einem Absturz wieder in Einklang.
+    #
+    # Indexeinträge, die über das Log hinaus zeigen oder auf einen beschädigten
+    # Datensatz verweisen, werden verworfen. Danach wird das Log ab dem letzten
+    # gültigen Datensatz gelesen, fehlende Indexeinträge werden nachgetragen und
+    # ein unvollständiger Rest am Ende abgeschnitten.
+    def _recover(self):
+        for path in (self.log_path, self.index_path):
+            if not os.path.exists(path):
+                open(path, "wb").close()
+        log_size = os.path.getsize(self.log_path)
+        count = os.path.getsize(self.index_path) // INDEX_ENTRY.size
+        with open(self.log_path, "rb") as log_file, open(self.index_path, "rb") as index_file:
+            log = mmap.mmap(log_file.fileno(), log_size, access=mmap.ACCESS_READ) if log_size else b""
+            end = 0
+            while count:
+                index_file.seek((count - 1) * INDEX_ENTRY.size)
+                offset, _ = INDEX_ENTRY.unpack(index_file.read(INDEX_ENTRY.size))
+                record = parse_record(log, offset)
+                if record is not None:
+                    end = record[-1]
+                    break
+                count -= 1
+            missing = []
+            while True:
+                record = parse_record(log, end)
+                if record is None:
+                    break
+                missing.append(INDEX_ENTRY.pack(end, peer_hash(record[3])))
+                end = record[-1]
+            if log_size:
+                log.close()
+        if end != log_size:
+            os.truncate(self.log_path, end)
+        if count * INDEX_ENTRY.size != os.path.getsize(self.index_path) or missing:
+            with open(self.index_path, "r+b") as f:
+                f.truncate(count * INDEX_ENTRY.size)
+                f.seek(0, os.SEEK_END)
+                f.write(b"".join(missing))
+        self._count = count + len(missing)
+        self._log_size = end
+
+    ##
+    # @brief Hängt eine Nachricht an den Verlauf an.
+    # @param peer Gegenüber (Absender bzw. Empfänger, BROADCAST_PEER für alle)
+    # @param text Nachrichtentext bzw. Bildpfad
+    # @param direction DIRECTION_IN oder DIRECTION_OUT
+    # @param kind KIND_TEXT oder KIND_IMAGE
+    # @param timestamp Unix-Zeit (Standard: jetzt)
+    # @return Laufende Nummer der Nachricht
+    def append(self, peer, text, direction=DIRECTION_IN, kind=KIND_TEXT, timestamp=None):
+        peer_bytes = peer.encode("utf-8")[:0xFFFF]
+        text_bytes = text.encode("utf-8")
+        if timestamp is None:
+            timestamp = time.time()
+        body = RECORD_HEADER.pack(0, timestamp, direction, kind, len(peer_bytes), len(text_bytes))[4:]
+        body += peer_bytes + text_bytes
+        record = struct.pack("<I", zlib.crc32(body)) + body
+        with self.lock:
+            offset = self._log_size
+            self._log.write(record)
+            self._index.write(INDEX_ENTRY.pack(offset, zlib.crc32(peer_bytes)))
+            self._log_size += len(record)
+            self._count += 1
+            self._dirty = True
+            if self.fsync_interval <= 0:
+                self._sync_locked()
+            return self._count - 1
+
+    ##
+    # @brief Schreibt gepufferte Daten und erzwingt fsync (Aufruf nur mit gehaltenem Lock).
+    def _sync_locked(self):
+        if not self._dirty:
+            return
+        self._log.flush()
+        self._index.flush()
+        os.fsync(self._log.fileno())
+        os.fsync(self._index.fileno())
+        self._dirty = False
+
+    ##
+    # @brief Schreibt alle gepufferten Nachrichten dauerhaft auf die Platte.
+    def sync(self):
+        with self.lock:
+            if not self._log.closed:
+                self._sync_locked()
+
+    ##
+    # @brief Hintergrund-Thread: fsync im Abstand fsync_interval.
+    def _sync_loop(self):
+        while not self._closed.wait(self.fsync_interval):
+            self.sync()
+
+    ##
+    # @return Anzahl gespeicherter Nachrichten
+    def __len__(self):
+        return self._count
+
+    ##
+    # @brief Bildet Log und Index für einen Lesevorgang in den Speicher ab.
+    # @return (log_map, index_map, Anzahl) oder None, falls der Verlauf leer ist
+    #
+    # Gepufferte Daten werden vorher an das Betriebssystem übergeben (ohne fsync),
+    # damit auch gerade erst angehängte Nachrichten sichtbar sind.
+    def _map(self):
+        with self.lock:
+            if not self._count:
+                return None
+            self._log.flush()
+            self._index.flush()
+            count, log_size = self._count, self._log_size
+        with open(self.log_path, "rb") as log_file, open(self.index_path, "rb") as index_file:
+            log_map = mmap.mmap(log_file.fileno(), log_size, access=mmap.ACCESS_READ)
+            index_map = mmap.mmap(index_file.fileno(), count * INDEX_ENTRY.size, access=mmap.ACCESS_READ)
+        return log_map, index_map, count
+
+    ##
+    # @brief Liest den Datensatz zu einer laufenden Nummer.
+    def _entry(self, log_map, index_map, number):
+        offset, _ = INDEX_ENTRY.unpack_from(index_map, number * INDEX_ENTRY.size)
+        timestamp, direction, kind, peer, text, _ = parse_record(log_map, offset)
+        return HistoryEntry(number, timestamp, direction, kind, peer, text)
+
+    ##
+    # @brief Liest einen zusammenhängenden Bereich des Verlaufs.
+    # @param start Erste laufende Nummer (inklusive)
+    # @param stop Letzte laufende Nummer (exklusive, Standard: Ende)
+    # @return Liste von HistoryEntry, älteste zuerst
+    def read(self, start, stop=None):
+        mapped = self._map()
+        if mapped is None:
+            return []
+        log_map, index_map, count = mapped
+        try:
+            stop = count if stop is None else min(stop, count)
+            return [self._entry(log_map, index_map, i) for i in range(max(start, 0), stop)]
+        finally:
+            log_map.close()
+            index_map.close()
+
+    ##
+    # @brief Liefert die letzten Nachrichten, optional nur die eines Peers.
+    # @param count Maximale Anzahl
+    # @param peer Nur Nachrichten von/an diesen Peer (None = alle)
+    # @param before Nur Nachrichten mit kleinerer laufender Nummer (zum Blättern)
+    # @return Liste von HistoryEntry, älteste zuerst
+    def last(self, count, peer=None, before=None):
+        if peer is None:
+            stop = len(self) if before is None else min(before, len(self))
+            return self.read(stop - count, stop)
+        mapped = self._map()
+        if mapped is None:
+            return []
+        log_map, index_map, total = mapped
+        wanted = peer_hash(peer)
+        result = []
+        try:
+            stop = total if before is None else min(before, total)
+            # Index rückwärts in Blöcken durchsuchen; nur Treffer der Prüfsumme lesen das Log
+            while stop > 0 and len(result) < count:
+                start = max(stop - SCAN_CHUNK, 0)
+                chunk = index_map[start * INDEX_ENTRY.size:stop * INDEX_ENTRY.size]
+                hashes = [h for _, h in INDEX_ENTRY.iter_unpack(chunk)]
+                for i in range(stop - 1, start - 1, -1):
+                    if hashes[i - start] == wanted:
+                        entry = self._entry(log_map, index_map, i)
+                        if entry.peer == peer:
+                            result.append(entry)
+                            if len(result) == count:
+                                break
+                stop = start
+        finally:
+            log_map.close()
+            index_map.close()
+        result.reverse()
+        return result
+
+    ##
+    # @brief Schreibt ausstehende Daten und schließt die Dateien.
+    def close(self):
+        self._closed.set()
+        with self.lock:
+            if not self._log.closed:
+                self._sync_locked()
+                self._log.close()
+                self._index.close()
+
+##
+# @brief Öffnet den Verlauf eines Nutzers.
+# @param directory Verzeichnis der Verlaufsdateien (wird bei Bedarf angelegt)
+# @param handle Eigenes Handle (Dateiname)
+# @param fsync_interval Sekunden zwischen zwei fsync-Aufrufen
+# @return HistoryStore
+def open_history(directory, handle, fsync_interval=FSYNC_INTERVAL):
+    os.makedirs(directory, exist_ok=True)
+    return HistoryStore(os.path.join(directory, handle), fsync_interval)
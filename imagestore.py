@@ -0,0 +1,496 @@
+##
+# @file imagestore.py
+# @brief Inhaltsadressierter Speicher für empfangene Bilder.
+#
+# Jedes Bild liegt unter seinem SHA-256: <root>/<xx>/<sha256>.<Endung>, wobei
+# <xx> die ersten zwei Hex-Zeichen sind (256 Unterverzeichnisse statt eines
+# flachen Ordners). Gleiche Bilder werden nur einmal gespeichert, gleichzeitig
+# empfangene Bilder können sich nicht mehr überschreiben.
+#
+# Der Index <root>/index.log ist ein Append-only-Journal mit einer Zeile pro
+# Änderung:
+#   + <sha256> <Endung> <Größe> <zuletzt benutzt>   neues Bild
+#   @ <sha256> <zuletzt benutzt>                      Bild angezeigt bzw. erneut empfangen
+#   - <sha256>                                        Bild entfernt
+# Beim Öffnen wird das Journal in ein Dictionary eingelesen und, wenn es
+# deutlich mehr Zeilen als Bilder enthält, kompakt neu geschrieben. Fehlt es,
+# wird es aus den Unterverzeichnissen wiederhergestellt.
+#
+# Übersteigt die Gesamtgröße max_bytes, werden die am längsten nicht benutzten
+# Bilder gelöscht, bis wieder GC_TARGET * max_bytes erreicht sind.
+#
+# Abgebrochene Übertragungen (siehe imagetransfer.py) bleiben als
+# <root>/partial/<sha256>.part liegen und werden beim nächsten Versuch
+# fortgesetzt; nach PARTIAL_MAX_AGE Sekunden werden sie verworfen.
+#
+# Index und Bereinigung gehören genau einem Prozess: <root>/lock wird
+# exklusiv gesperrt (fcntl.flock, unter Windows ohne Sperre). Ein zweiter
+# Client im selben Verzeichnis bekommt BlockingIOError und muss ein eigenes
+# Wurzelverzeichnis nehmen.
+##
+
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+##
+# @var STORE_MAX_BYTES
+# @brief Standard-Obergrenze für alle gespeicherten Bilder (Bytes, 0 = unbegrenzt).
+STORE_MAX_BYTES = 1024 * 1024 * 1024
+
+##
+# @var GC_TARGET
+# @brief Anteil von max_bytes, auf den die Speicherbereinigung zurückräumt.
+GC_TARGET = 0.9
+
+##
+# @var TOUCH_INTERVAL
+# @brief Sekunden, nach denen eine erneute Benutzung wieder ins Journal geschrieben wird.
+TOUCH_INTERVAL = 60.0
+
+##
+# @var INDEX_NAME
+# @brief Dateiname des Journals im Wurzelverzeichnis.
+INDEX_NAME = "index.log"
+
+##
+# @var PARTIAL_MAX_AGE
+# @brief Sekunden, nach denen eine unvollständige Übertragung beim Öffnen verworfen wird.
+PARTIAL_MAX_AGE = 24 * 3600
+
+##
+# @var TMP_MAX_AGE
+# @brief Sekunden ohne Schreibzugriff, nach denen eine temporäre Datei beim Öffnen als Rest gilt.
+TMP_MAX_AGE = 3600
+
+TMP_DIR = "tmp"
+LOCK_NAME = "lock"
+PARTIAL_DIR = "partial"
+HASH_CHUNK_SIZE = 64 * 1024
+COMPACT_SLACK = 1000  # zusätzliche Journalzeilen, ab denen beim Öffnen kompaktiert wird
+
+# Dateianfang → Endung (für Dateimanager und Bildbetrachter; PIL erkennt das Format selbst)
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF8", "gif"),
+    (b"BM", "bmp"),
+    (b"RIFF", "webp"),
+)
+
+##
+# @class StoredImage
+# @brief Indexeintrag: Hash, Endung, Größe in Bytes, zuletzt benutzt (Unix-Zeit).
+StoredImage = namedtuple("StoredImage", "digest ext size last_used")
+
+##
+# @brief Bestimmt die Dateiendung anhand der ersten Bytes.
+# @param head Dateianfang
+# @return Endung ohne Punkt ("bin", falls unbekannt)
+def sniff_extension(head):
+    for signature, ext in SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return "bin"
+
+##
+# @brief Prüft, ob ein String ein SHA-256 in Hex-Darstellung ist (z. B. aus einer Kopfzeile).
+# @param value String
+# @return True bei 64 Hex-Zeichen (Kleinbuchstaben)
+def is_digest(value):
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+##
+# @class PendingImage
+# @brief Dateiobjekt für ein Bild, das gerade empfangen wird.
+#
+# Schreibt in eine temporäre Datei und berechnet dabei den Hash. commit()
+# legt das Bild im Speicher ab; ohne commit() wird die Datei beim Verlassen
+# des with-Blocks verworfen.
+class PendingImage:
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+        self.file = open(path, "wb")
+        self.digest = hashlib.sha256()
+        self.head = b""
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.discard()
+
+    ##
+    # @brief Schreibt Bilddaten.
+    # @param data Bytes bzw. memoryview
+    def write(self, data):
+        if len(self.head) < 16:
+            self.head += bytes(data[:16 - len(self.head)])
+        self.file.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    ##
+    # @brief Übernimmt das Bild in den Speicher.
+    # @return Pfad des gespeicherten Bildes
+    def commit(self):
+        self.file.close()
+        return self.store.add_file(self.path, self.digest.hexdigest(), sniff_extension(self.head), self.size)
+
+    ##
+    # @brief Verwirft die temporäre Datei (nach commit() ohne Wirkung).
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+##
+# @class PartialImage
+# @brief Unvollständiges Bild mit bekanntem Hash, das fortgesetzt werden kann.
+#
+# Beim Öffnen wird die vorhandene Teildatei auf ein Vielfaches von align
+# gekürzt (ein beim Absturz halb geschriebener Block fällt weg) und ihr
+# Anfang erneut gehasht; offset ist danach die Stelle, an der es weitergeht.
+#
+# Übernimmt eine neue Verbindung dasselbe Bild (siehe ImageStore.resume()),
+# wird die alte Instanz mit abandon() stillgelegt.
+class PartialImage:
+    def __init__(self, store, digest, size, align):
+        self.store = store
+        self.digest = digest
+        self.size = size
+        self.lock = threading.Lock()
+        self.abandoned = False
+        self.path = os.path.join(store.partial_dir, digest + ".part")
+        self.file = open(self.path, "r+b" if os.path.exists(self.path) else "w+b")
+        length = os.fstat(self.file.fileno()).st_size
+        self.offset = min(length - length % align, size)
+        self.file.truncate(self.offset)
+        self.hash = hashlib.sha256()
+        for chunk in iter(lambda: self.file.read(HASH_CHUNK_SIZE), b""):
+            self.hash.update(chunk)
+        self.file.seek(0)
+        self.head = self.file.read(16)
+        self.file.seek(self.offset)
+
+    ##
+    # @brief Hängt geprüfte Daten an.
+    # @param data Bytes
+    # @throws ConnectionError falls eine neue Verbindung die Übertragung übernommen hat
+    def write(self, data):
+        with self.lock:
+            if self.abandoned:
+                raise ConnectionError("Übertragung von einer neuen Verbindung übernommen")
+            if len(self.head) < 16:
+                self.head += data[:16 - len(self.head)]
+            self.file.write(data)
+            self.hash.update(data)
+            self.offset += len(data)
+
+    ##
+    # @brief Prüft den Hash und übernimmt das Bild in den Speicher.
+    # @return Pfad des gespeicherten Bildes
+    # @throws ValueError falls Größe oder Hash nicht stimmen (die Teildatei wird dann gelöscht)
+    def complete(self):
+        with self.lock:
+            if self.abandoned:
+                raise ConnectionError("Übertragung von einer neuen Verbindung übernommen")
+            self.file.close()
+        if self.offset != self.size or self.hash.hexdigest() != self.digest:
+            os.remove(self.path)
+            raise ValueError("SHA-256 stimmt nicht mit der Ankündigung überein")
+        return self.store.add_file(self.path, self.digest, sniff_extension(self.head), self.size)
+
+    ##
+    # @brief Schließt die Teildatei (bleibt für einen späteren Versuch liegen) und gibt den Hash frei.
+    #
+    # Mehrfacher Aufruf ist unschädlich.
+    def close(self):
+        with self.lock:
+            self.file.close()
+        self.store.release(self)
+
+    ##
+    # @brief Legt die Instanz still, weil eine neue Verbindung das Bild übernimmt.
+    #
+    # Schließt die Teildatei (gepufferte Daten landen darin); weitere write()-
+    # bzw. complete()-Aufrufe der alten Verbindung schlagen fehl.
+    def abandon(self):
+        with self.lock:
+            self.abandoned = True
+            self.file.close()
+
+##
+# @class ImageStore
+# @brief Inhaltsadressierter Bildspeicher mit Index und LRU-Bereinigung.
+#
+class ImageStore:
+    ##
+    # @brief Konstruktor: öffnet bzw. legt den Speicher an.
+    # @param root Wurzelverzeichnis (z. B. imagepath aus config.toml)
+    # @param max_bytes Obergrenze der Gesamtgröße (0 = unbegrenzt)
+    # @throws BlockingIOError falls ein anderer Prozess den Speicher geöffnet hat
+    def __init__(self, root, max_bytes=STORE_MAX_BYTES):
+        os.makedirs(root, exist_ok=True)
+        self.lock_file = open(os.path.join(root, LOCK_NAME), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.lock_file.close()
+                raise BlockingIOError(f"Bildspeicher {root} wird von einem anderen Prozess benutzt") from None
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries = {}  # Hash → StoredImage
+        self.total = 0
+        self.counter = 0
+        self.receiving = {}  # Hash → PartialImage, das gerade empfangen wird
+        self.lock = threading.Lock()
+        self.resume_lock = threading.Lock()  # ein resume() zur Zeit (liest die Teildatei ohne self.lock)
+        self.tmp_dir = os.path.join(root, TMP_DIR)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        # Reste abgebrochener Übertragungen; laufende werden ständig beschrieben
+        expired = time.time() - TMP_MAX_AGE
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            if os.stat(path).st_mtime < expired:
+                os.remove(path)
+        self.partial_dir = os.path.join(root, PARTIAL_DIR)
+        os.makedirs(self.partial_dir, exist_ok=True)
+        expired = time.time() - PARTIAL_MAX_AGE
+        for name in os.listdir(self.partial_dir):
+            path = os.path.join(self.partial_dir, name)
+            if os.stat(path).st_mtime < expired:
+                os.remove(path)
+        self.index_path = os.path.join(root, INDEX_NAME)
+        if os.path.exists(self.index_path):
+            lines = self.replay()
+            if lines > 2 * len(self.entries) + COMPACT_SLACK:
+                self.compact()
+        else:
+            self.rebuild()
+        self.journal = open(self.index_path, "a", encoding="utf-8")
+
+    ##
+    # @brief Liest das Journal ein.
+    # @return Anzahl der gelesenen Zeilen
+    def replay(self):
+        entries = self.entries
+        lines = 0
+        with open(self.index_path, encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                fields = line.split()
+                try:
+                    if fields[0] == "+" and len(fields) == 5:
+                        entries[fields[1]] = StoredImage(fields[1], fields[2], int(fields[3]), float(fields[4]))
+                    elif fields[0] == "@" and fields[1] in entries:
+                        entries[fields[1]] = entries[fields[1]]._replace(last_used=float(fields[2]))
+                    elif fields[0] == "-":
+                        entries.pop(fields[1], None)
+                except (IndexError, ValueError):
+                    continue  # z. B. letzte Zeile nach einem Absturz unvollständig
+        self.total = sum(entry.size for entry in entries.values())
+        return lines
+
+    ##
+    # @brief Stellt den Index aus den Unterverzeichnissen wieder her.
+    def rebuild(self):
+        self.entries = {}
+        for shard in os.listdir(self.root):
+            directory = os.path.join(self.root, shard)
+            if len(shard) != 2 or not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                digest, _, ext = name.partition(".")
+                if len(digest) == 64 and digest.startswith(shard):
+                    stat = os.stat(os.path.join(directory, name))
+                    self.entries[digest] = StoredImage(digest, ext, stat.st_size, stat.st_mtime)
+        self.total = sum(entry.size for entry in self.entries.values())
+        self.compact()
+
+    ##
+    # @brief Schreibt das Journal mit einer Zeile pro Bild neu.
+    def compact(self):
+        part = self.index_path + ".part"
+        with open(part, "w", encoding="utf-8") as f:
+            for e in self.entries.values():
+                f.write(f"+ {e.digest} {e.ext} {e.size} {e.last_used:.0f}\n")
+        os.replace(part, self.index_path)
+
+    def _log(self, line):
+        self.journal.write(line)
+        self.journal.flush()
+
+    ##
+    # @brief Pfad eines gespeicherten Bildes.
+    # @param entry StoredImage
+    def path(self, entry):
+        return os.path.join(self.root, entry.digest[:2], f"{entry.digest}.{entry.ext}")
+
+    ##
+    # @brief Sucht ein Bild über seinen Hash.
+    # @param digest SHA-256 (hex)
+    # @return Pfad oder None
+    def get(self, digest):
+        entry = self.entries.get(digest)
+        return self.path(entry) if entry else None
+
+    ##
+    # @brief Öffnet ein neues Bild zum Schreiben (z. B. als Ziel von recv_to_file()).
+    # @return PendingImage
+    def writer(self):
+        with self.lock:
+            self.counter += 1
+            name = f"{os.getpid()}-{threading.get_ident()}-{self.counter}.part"
+        return PendingImage(self, os.path.join(self.tmp_dir, name))
+
+    ##
+    # @brief Öffnet bzw. setzt ein Bild mit bekanntem Hash fort.
+    # @param digest Angekündigter SHA-256 (hex)
+    # @param size Angekündigte Größe in Bytes
+    # @param align Blockgröße der Übertragung (Teildateien werden darauf gekürzt)
+    # @return PartialImage
+    #
+    # Wird dasselbe Bild noch über eine andere Verbindung empfangen, ist diese in
+    # aller Regel tot (der Sender versucht es nur nach einem Fehler erneut): Die
+    # neue Verbindung übernimmt, die alte wird mit PartialImage.abandon() stillgelegt.
+    def resume(self, digest, size, align=1):
+        if not is_digest(digest):
+            raise ValueError(f"ungültiger Hash {digest!r}")
+        with self.resume_lock:
+            with self.lock:
+                stale = self.receiving.pop(digest, None)
+            if stale is not None:
+                stale.abandon()
+            partial = PartialImage(self, digest, size, align)
+            with self.lock:
+                self.receiving[digest] = partial
+        return partial
+
+    ##
+    # @brief Gibt einen Hash nach resume() wieder frei.
+    # @param partial PartialImage (nach einer Übernahme gehört der Hash schon der neuen Instanz)
+    def release(self, partial):
+        with self.lock:
+            if self.receiving.get(partial.digest) is partial:
+                del self.receiving[partial.digest]
+
+    ##
+    # @brief Übernimmt eine vollständig geschriebene temporäre Datei.
+    # @param tmp_path Temporäre Datei (wird verschoben oder bei Duplikat gelöscht)
+    # @param digest SHA-256 des Inhalts
+    # @param ext Dateiendung
+    # @param size Größe in Bytes
+    # @return Pfad des gespeicherten Bildes
+    def add_file(self, tmp_path, digest, ext, size):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None and os.path.exists(self.path(entry)):
+                os.remove(tmp_path)  # schon vorhanden: nur als benutzt markieren
+                self.entries[digest] = entry._replace(last_used=now)
+                self._log(f"@ {digest} {now:.0f}\n")
+                return self.path(entry)
+            if entry is not None:
+                self.total -= entry.size  # Datei fehlt (von Hand gelöscht): neu ablegen
+            entry = StoredImage(digest, ext, size, now)
+            target = self.path(entry)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+            self.entries[digest] = entry
+            self.total += size
+            self._log(f"+ {digest} {ext} {size} {now:.0f}\n")
+            if self.max_bytes and self.total > self.max_bytes:
+                self.collect(keep=digest)
+            return target
+
+    ##
+    # @brief Legt Bilddaten aus dem Speicher ab.
+    # @param data Bytes
+    # @return Pfad des gespeicherten Bildes
+    def add(self, data):
+        with self.writer() as pending:
+            pending.write(data)
+            return pending.commit()
+
+    ##
+    # @brief Markiert ein Bild als benutzt (für die LRU-Bereinigung).
+    # @param path Pfad des Bildes (Dateiname beginnt mit dem Hash)
+    #
+    # Ins Journal geschrieben wird höchstens alle TOUCH_INTERVAL Sekunden pro Bild.
+    def touch(self, path):
+        digest = os.path.basename(path).partition(".")[0]
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None or now - entry.last_used < TOUCH_INTERVAL:
+                return
+            self.entries[digest] = entry._replace(last_used=now)
+            self._log(f"@ {digest} {now:.0f}\n")
+
+    ##
+    # @brief Entfernt ein Bild.
+    # @param digest SHA-256 (hex)
+    def remove(self, digest):
+        with self.lock:
+            self._remove(digest)
+
+    def _remove(self, digest):
+        entry = self.entries.pop(digest, None)
+        if entry is None:
+            return
+        self.total -= entry.size
+        try:
+            os.remove(self.path(entry))
+        except FileNotFoundError:
+            pass
+        self._log(f"- {digest}\n")
+
+    ##
+    # @brief Löscht die am längsten unbenutzten Bilder, bis GC_TARGET * max_bytes erreicht ist.
+    # @param keep Hash, der nicht gelöscht werden darf (gerade empfangenes Bild)
+    # @return Anzahl gelöschter Bilder
+    #
+    # Erwartet, dass der Aufrufer self.lock hält.
+    def collect(self, keep=None):
+        target = self.max_bytes * GC_TARGET
+        removed = 0
+        for entry in sorted(self.entries.values(), key=lambda e: e.last_used):
+            if self.total <= target:
+                break
+            if entry.digest != keep:
+                self._remove(entry.digest)
+                removed += 1
+        return removed
+
+    ##
+    # @brief Listet gespeicherte Bilder, zuletzt benutzte zuerst.
+    # @param limit Höchstanzahl (None = alle)
+    # @return Liste von StoredImage
+    def recent(self, limit=None):
+        with self.lock:
+            entries = sorted(self.entries.values(), key=lambda e: e.last_used, reverse=True)
+        return entries[:limit] if limit is not None else entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, digest):
+        return digest in self.entries
+
+    ##
+    # @brief Schließt das Journal und gibt die Sperre frei.
+    def close(self):
+        with self.lock:
+            self.journal.close()
+            self.lock_file.close()
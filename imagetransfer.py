@@ -0,0 +1,279 @@
+##
+# @file imagetransfer.py
+# @brief Fortsetzbare Bildübertragung in Blöcken ("IMGX").
+#
+# Ablauf über eine eigene Verbindung pro Bild (TCP oder Unix-Domain-Socket):
+#   Sender:     "IMGX <Absender> <sha256> <Größe> <Name>\n"
+#   Empfänger:  "HAVE\n"              Bild liegt schon im Bildspeicher, fertig
+#               "RESUME <Offset>\n"   ab hier senden (0 = neu)
+#   Sender:     Blöcke ab Offset, je Kopf (Flags, Länge, CRC32 der Bilddaten) + Daten
+#   Empfänger:  "OK\n" nach geprüftem SHA-256, sonst "ERR <Grund>\n"
+#
+# Der Empfänger prüft jeden Block beim Eintreffen (Länge, CRC32) und schreibt
+# erst dann. Bricht die Verbindung ab oder ist ein Block fehlerhaft, bleibt
+# der geprüfte Anfang im Bildspeicher liegen; der nächste Versuch des Senders
+# beginnt beim gemeldeten Offset. Wiederholte Übertragungen kosten nur die
+# Kopfzeile, abgebrochene nur die fehlenden Blöcke.
+#
+# Mit compress=True werden Blöcke einzeln zlib-komprimiert (Flag FLAG_ZLIB),
+# solange das lohnt; so bleibt jeder Block für sich prüf- und fortsetzbar.
+#
+# Für mehrere Empfänger wird das Bild einmal als PreparedImage gelesen und
+# gehasht; distribute() verteilt es mit begrenzter Parallelität.
+##
+
+import hashlib
+import mmap
+import os
+import select
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import metrics
+from network import open_connection, recv_exact, recv_line, IMAGE_COMPRESS_LEVEL, IMAGE_COMPRESS_MIN_SAVING
+
+##
+# @var IMAGE_TRANSFER_CAPABILITY
+# @brief Token im JOIN: Der Client nimmt Bilder per IMGX an.
+IMAGE_TRANSFER_CAPABILITY = "imgx"
+
+##
+# @var CHUNK_SIZE
+# @brief Bilddaten pro Block (Bytes); zugleich Granularität beim Fortsetzen.
+CHUNK_SIZE = 256 * 1024
+
+##
+# @var MAX_IMAGE_SIZE
+# @brief Größte angenommene Bildgröße (Bytes).
+MAX_IMAGE_SIZE = 256 * 1024 * 1024
+
+##
+# @var TRANSFER_TIMEOUT
+# @brief Timeout für Verbindungsaufbau und jeden Sende-/Empfangsschritt (Sekunden).
+TRANSFER_TIMEOUT = 5.0
+
+##
+# @var TRANSFER_ATTEMPTS
+# @brief Anzahl Versuche, bevor send_chunked() aufgibt.
+TRANSFER_ATTEMPTS = 4
+
+##
+# @var RETRY_DELAY
+# @brief Wartezeit vor dem zweiten Versuch (Sekunden), verdoppelt sich je Versuch.
+RETRY_DELAY = 0.5
+
+##
+# @var FLAG_ZLIB
+# @brief Block-Flag: Daten sind zlib-komprimiert.
+FLAG_ZLIB = 0x01
+
+##
+# @var IMAGE_FANOUT_WORKERS
+# @brief Maximale Anzahl gleichzeitiger Bildübertragungen beim Senden an mehrere Empfänger.
+#
+# Bildübertragungen teilen sich den Upload des Senders; mehr parallele Ströme
+# machen die Verteilung nicht schneller, verzögern aber jeden einzelnen.
+IMAGE_FANOUT_WORKERS = 4
+
+CHUNK_HEADER = struct.Struct("!BII")  # Flags, Länge auf der Leitung, CRC32 der Bilddaten
+
+##
+# @class PreparedImage
+# @brief Einmal gelesenes und gehashtes Bild, das an beliebig viele Empfänger gehen kann.
+#
+# Dateien werden per mmap eingeblendet statt kopiert; alle Übertragungen lesen
+# aus demselben Puffer.
+class PreparedImage:
+    ##
+    # @brief Konstruktor.
+    # @param source Pfad oder Bilddaten (bytes)
+    def __init__(self, source):
+        self.mapping = None
+        if isinstance(source, (bytes, bytearray)):
+            self.data = source
+        else:
+            with open(source, "rb") as f:
+                if os.fstat(f.fileno()).st_size:
+                    self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = self.mapping if self.mapping is not None else b""
+        self.size = len(self.data)
+        self.digest = hashlib.sha256(self.data).hexdigest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    ##
+    # @brief Gibt die Einblendung der Datei frei.
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+
+##
+# @brief Sendet die Blöcke ab der aktuellen Position.
+# @param sock Verbundener Socket
+# @param image PreparedImage
+# @param offset Erstes zu sendendes Byte
+# @param compress Blöcke komprimieren, solange es lohnt
+# @return Generator über die je Block gesendeten Bytes (Kopf und Daten)
+def send_chunks(sock, image, offset, compress):
+    while offset < image.size:
+        raw = image.data[offset:offset + CHUNK_SIZE]  # Kopie: hält keine Referenz auf die mmap
+        flags, payload = 0, raw
+        if compress:
+            packed = zlib.compress(raw, IMAGE_COMPRESS_LEVEL)
+            if len(packed) <= len(raw) * (1 - IMAGE_COMPRESS_MIN_SAVING):
+                flags, payload = FLAG_ZLIB, packed
+            else:
+                compress = False  # JPEG/PNG: weitere Versuche kosten nur Rechenzeit
+        sock.sendall(CHUNK_HEADER.pack(flags, len(payload), zlib.crc32(raw)) + payload)
+        offset += len(raw)
+        yield CHUNK_HEADER.size + len(payload)
+
+##
+# @brief Sendet ein Bild per IMGX und setzt abgebrochene Versuche fort.
+# @param ip Ziel-IP-Adresse
+# @param port Ziel-Port
+# @param sender Eigenes Handle
+# @param source Pfad, Bilddaten (bytes) oder PreparedImage (bei mehreren Empfängern)
+# @param name Dateiname (nur zur Anzeige)
+# @param compress Blöcke zlib-komprimieren (nur an Empfänger mit IMAGE_ZLIB_CAPABILITY)
+# @param timeout Timeout pro Schritt
+# @param attempts Anzahl Versuche
+# @return (Ergebnis, gesendete Bytes): Ergebnis "have" (Empfänger hatte das Bild) oder "sent"
+# @throws OSError oder ValueError, wenn auch der letzte Versuch scheitert
+def send_chunked(ip, port, sender, source, name, compress=False, timeout=TRANSFER_TIMEOUT,
+                 attempts=TRANSFER_ATTEMPTS):
+    image = source if isinstance(source, PreparedImage) else PreparedImage(source)
+    try:
+        size = image.size
+        header = f"IMGX {sender} {image.digest} {size} {name}\n".encode()
+        sent = 0
+        for attempt in range(attempts):
+            if attempt:
+                metrics.inc("imgx.retries")
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            try:
+                with open_connection(ip, port, timeout) as sock:
+                    sock.settimeout(timeout)
+                    sock.sendall(header)
+                    sent += len(header)
+                    reply = recv_line(sock)[0].decode().split()
+                    if reply == ["HAVE"]:
+                        metrics.inc("imgx.skipped")
+                        return "have", sent
+                    if len(reply) != 2 or reply[0] != "RESUME" or not 0 <= int(reply[1]) <= size:
+                        raise ValueError(f"Unerwartete Antwort: {' '.join(reply)}")
+                    offset = int(reply[1])
+                    if offset:
+                        metrics.inc("imgx.resumed")
+                    for count in send_chunks(sock, image, offset, compress):
+                        sent += count
+                        if select.select([sock], [], [], 0)[0]:
+                            break  # Antwort vor dem letzten Block: Empfänger hat abgebrochen ("ERR ...")
+                    result = recv_line(sock)[0].decode()
+                if result != "OK":
+                    raise ValueError(f"Empfänger meldet: {result}")
+                metrics.inc("imgx.sent")
+                metrics.inc("imgx.bytes_sent", sent)
+                return "sent", sent
+            except (OSError, ValueError) as e:
+                error = e  # z. B. Timeout, Abbruch, fehlerhafter Block: nächster Versuch setzt fort
+        raise error
+    finally:
+        if image is not source:
+            image.close()
+
+##
+# @brief Empfängt ein Bild per IMGX in den Bildspeicher.
+# @param conn Verbundener Socket
+# @param header Bereits gelesene Kopfzeile "IMGX ..." (bytes, ohne "\n")
+# @param rest Nach der Kopfzeile bereits gelesene Bytes (muss leer sein)
+# @param store imagestore.ImageStore
+# @return (Absender, Pfad des Bildes, empfangene Bytes; 0 bei bereits vorhandenem Bild)
+# @throws ValueError bei Protokollfehlern, ConnectionError bei Abbruch
+#
+# Setzt auf conn den Timeout TRANSFER_TIMEOUT: Eine still abgerissene
+# Verbindung soll den Hash nicht lange belegen (ein neuer Versuch des Senders
+# übernimmt ihn ohnehin, siehe ImageStore.resume()).
+def receive_chunked(conn, header, rest, store):
+    parts = header.decode().split(" ", 4)
+    if len(parts) < 4 or rest:
+        raise ValueError("Ungültige IMGX-Kopfzeile")
+    _, sender, digest, size = parts[:4]
+    size = int(size)
+    if not 0 <= size <= MAX_IMAGE_SIZE:
+        raise ValueError(f"ungültige Größe {size}")
+    path = store.get(digest)
+    if path is not None:
+        store.touch(path)
+        conn.sendall(b"HAVE\n")
+        return sender, path, 0
+    conn.settimeout(TRANSFER_TIMEOUT)
+    partial = store.resume(digest, size, CHUNK_SIZE)
+    received = 0
+    try:
+        conn.sendall(f"RESUME {partial.offset}\n".encode())
+        while partial.offset < size:
+            head = recv_exact(conn, CHUNK_HEADER.size)
+            if head is None:
+                raise ConnectionError(f"Übertragung bei {partial.offset} von {size} Bytes abgebrochen")
+            flags, length, crc = CHUNK_HEADER.unpack(head)
+            expected = min(CHUNK_SIZE, size - partial.offset)
+            if length > CHUNK_SIZE:
+                raise ValueError(f"Block zu groß ({length} Bytes)")
+            payload = recv_exact(conn, length)
+            if payload is None:
+                raise ConnectionError(f"Übertragung bei {partial.offset} von {size} Bytes abgebrochen")
+            received += CHUNK_HEADER.size + length
+            raw = payload
+            if flags & FLAG_ZLIB:
+                inflater = zlib.decompressobj()
+                raw = inflater.decompress(payload, expected + 1)
+                if not inflater.eof:
+                    raw = b""
+            if len(raw) != expected or zlib.crc32(raw) != crc:
+                metrics.inc("imgx.bad_chunks")
+                raise ValueError(f"Block bei Offset {partial.offset} fehlerhaft")
+            partial.write(raw)
+        path = partial.complete()
+        conn.sendall(b"OK\n")
+        metrics.inc("imgx.received")
+        metrics.inc("imgx.bytes_received", received)
+        return sender, path, received
+    except ValueError as e:
+        partial.close()  # vor der Antwort: der sofortige neue Versuch des Senders findet den Hash frei
+        try:
+            conn.sendall(f"ERR {e}\n".encode())
+        except OSError:
+            pass
+        raise
+    finally:
+        partial.close()
+
+##
+# @brief Sendet an mehrere Empfänger mit begrenzter Parallelität (blockierend).
+# @param targets Dictionary Name → Argument für send (z. B. (IP, Port))
+# @param send Funktion(Name, Argument) → Ergebnis, wird im Thread-Pool aufgerufen
+# @param workers Maximale Anzahl gleichzeitiger Übertragungen
+# @return (Dictionary Name → Ergebnis, Dictionary Name → Fehlertext)
+def distribute(targets, send, workers=IMAGE_FANOUT_WORKERS):
+    results, failures = {}, {}
+    if not targets:
+        return results, failures
+    start = metrics.now()
+    with ThreadPoolExecutor(max_workers=min(workers, len(targets)), thread_name_prefix="image") as executor:
+        futures = {executor.submit(send, name, target): name for name, target in targets.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            error = future.exception()
+            if error is None:
+                results[name] = future.result()
+            else:
+                failures[name] = str(error) or type(error).__name__
+    metrics.since("imgx.distribute_seconds", start)
+    metrics.inc("imgx.distribute_targets", len(targets))
+    return results, failures
@@ -5,14 +5,17 @@
 # Dieses Skript lädt die Konfiguration, verarbeitet Kommandozeilenargumente, 
 # und bietet die Wahl zwischen CLI und GUI.
 # Hinweis: Der Discovery-Service MUSS separat laufen!
+#
+# Schneller Start: Oben stehen nur die Importe, die vor der Auswahl gebraucht
+# werden. CLI bzw. GUI (mit tkinter) werden erst nach der Wahl importiert, die
+# GUI läuft im selben Prozess und bekommt die bereits gelesene Konfiguration.
+# Messen: python3 -m bench.startup
 ##
 
 import sys
-import socket
 import argparse
-import os  # Für Dateipfad-Operationen
-import time
-from network import load_config, udp_send
+from settings import load_config
+from probe import probe
 
 ##
 # @brief Verarbeitet Kommandozeilenargumente für das Chatprogramm.
@@ -25,19 +28,6 @@ def parse_args():
     parser.add_argument("--autoreply", help="Automatische Antwortnachricht")
     return parser.parse_args()
 
-##
-# @brief Prüft, ob der Discovery-Dienst bereits läuft (ob Port belegt ist).
-# @param port WHOIS-Port für Discovery
-# @return True falls Discovery läuft (Port belegt), sonst False
-def discovery_running(port):
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.bind(("", port))
-        s.close()
-        return False  # Port frei -> Discovery läuft NICHT
-    except:
-        return True   # Port belegt -> Discovery läuft
-
 ##
 # @brief Hauptfunktion: Programmstart, Konfiguration, UI-Auswahl
 def main():
@@ -57,21 +47,23 @@ def main():
 
     ##
     # @section DiscoveryCheck Discovery-Service prüfen
-    # Discovery muss als separater Prozess laufen!
-    if not discovery_running(config["whoisport"]):
-        print("❗ Discovery-Service läuft NICHT. Bitte zuerst 'python3 discovery.py' in einem anderen Terminal starten!")
+    # Discovery muss als separater Prozess laufen! PING per Broadcast findet ihn auch
+    # auf anderen Rechnern im Netz; antworten mehrere, wird der schnellste genommen.
+    instances = probe(config["whoisport"])
+    if not instances:
+        print("❗ Discovery-Service antwortet NICHT. Bitte zuerst 'python3 discovery.py' in einem anderen Terminal starten!")
         sys.exit(1)
-    else:
-        print(f"Verbinde zu Discovery-Service auf Port {config['whoisport']} ...")
+    for instance in instances:
+        print(f"Discovery-Service {instance.ip}:{instance.port} antwortet nach {instance.rtt * 1000:.1f} ms "
+              f"({instance.participants} Teilnehmer)")
+    config["discovery_ip"] = instances[0].ip
+    # Chatverlauf für CLI und GUI gleich: ohne Eintrag im Standardverzeichnis, "" = aus
+    from history import HISTORY_DIR
+    history_path = config.get("history_path", HISTORY_DIR)
+    print(f"Verbinde zu Discovery-Service {instances[0].ip}:{config['whoisport']} ...")
 
-    ##
-    # @section InitialMessages Sende JOIN und WHO automatisch (Pflicht)
-    def send_initial_messages():
-        join_msg = f"JOIN {config['handle']} {config['port'][1]}"
-        udp_send(join_msg, "255.255.255.255", config["whoisport"])
-        time.sleep(0.5)
-        udp_send("WHO", "255.255.255.255", config["whoisport"])
-    send_initial_messages()
+    # JOIN senden CLI bzw. GUI selbst, sobald ihr UDP-Port gebunden ist, und
+    # wiederholen es, bis die Nutzerliste eintrifft (roster.JoinHandshake).
 
     ##
     # @section UI Auswahl: CLI oder GUI
@@ -83,33 +75,37 @@ def main():
         if choice == "1":
             # Starte CLI
             from cli import start_cli
+            from network import MULTICAST_GROUP, MULTICAST_PORT
+            from roster import HEARTBEAT_INTERVAL
+            from history import FSYNC_INTERVAL
+            multicast = None
+            if config.get("multicast"):
+                multicast = (config.get("multicast_group", MULTICAST_GROUP), config.get("multicast_port", MULTICAST_PORT))
             start_cli(
                 handle=config["handle"],
-                port=config["port"][1],
-                whoisport=config["whoisport"]
+                tcp_port=config["port"][1],
+                my_udp_port=config["port"][0],
+                multicast=multicast,
+                heartbeat_interval=config.get("heartbeat_interval", HEARTBEAT_INTERVAL),
+                history_dir=history_path,
+                history_fsync_interval=config.get("history_fsync_interval", FSYNC_INTERVAL),
+                metrics_enabled=config.get("metrics", False),
+                discovery=(config["discovery_ip"], config["whoisport"]),
+                unix_socket=config.get("unix_socket", True)
             )
             break
             
         elif choice == "2":
-            # Starte GUI (optional)
-            gui_file = "chat_gui_client_verbessert.py"
-            if not os.path.exists(gui_file):
-                print(f"Error: GUI file '{gui_file}' not found in {os.getcwd()}!")
-                print("Please ensure the file exists or use CLI instead.")
-                continue
+            # Starte GUI (optional) im selben Prozess
             try:
-                import subprocess
-                subprocess.Popen([
-                    sys.executable,
-                    gui_file,
-                    "--handle", config["handle"],
-                    "--port", str(config["port"][0]), str(config["port"][1]),
-                    "--whoisport", str(config["whoisport"])
-                ])
-                break
-            except Exception as e:
-                print(f"Failed to start GUI: {str(e)}")
+                from chat_gui_client_verbessert import start_gui
+            except ImportError as e:
+                print(f"Error: GUI kann nicht geladen werden ({e}).")
+                print("Please ensure tkinter and pillow are installed or use CLI instead.")
                 continue
+            start_gui(config, metrics_enabled=config.get("metrics", False), history_path=history_path)
+            break
+            
         else:
             print("Invalid choice. Please enter 1 or 2.")
 
@@ -0,0 +1,224 @@
+##
+# @file metrics.py
+# @brief Leichtgewichtige Kennzahlen: Zähler, Messwerte und Latenz-Histogramme.
+#
+# Netzwerkmodul, Discovery-Service, CLI und GUI melden hier, was sie senden,
+# empfangen und wie lange Zerlegen und Verteilen dauern. Abgefragt wird über
+# "/stats" in den Clients bzw. über einen HTTP-Endpunkt des Discovery-Service.
+#
+# Solange die Erfassung ausgeschaltet ist (Standard), sind inc(), gauge(),
+# since() und now() leere Funktionen; ein Aufruf kostet nur den Aufruf selbst.
+# enable() tauscht sie gegen die erfassenden Varianten aus. Aufrufer schreiben
+# deshalb immer metrics.inc(...) und nie "from metrics import inc".
+#
+# Zeitmessung:
+#   start = metrics.now()
+#   ...
+#   metrics.since("tcp.send_seconds", start)
+##
+
+import bisect
+import threading
+import time
+
+##
+# @var BUCKETS
+# @brief Obergrenzen der Histogramm-Klassen in Sekunden (100 µs … 5 s, danach Überlauf).
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+##
+# @class Histogram
+# @brief Latenz-Histogramm mit festen Klassen.
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    ##
+    # @brief Trägt einen Messwert ein.
+    # @param value Dauer in Sekunden
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    ##
+    # @brief Schätzt ein Quantil als Obergrenze der Klasse, in die es fällt.
+    # @param q Quantil zwischen 0 und 1
+    # @return Sekunden oder None ohne Messwerte
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    ##
+    # @brief Liefert die Werte als Dictionary (Millisekunden).
+    def snapshot(self):
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self.quantile(0.50)),
+            "p95_ms": ms(self.quantile(0.95)),
+            "p99_ms": ms(self.quantile(0.99)),
+            "max_ms": ms(self.max) if self.count else None,
+            "buckets": [[ms(bound), count] for bound, count in zip(self.bounds + (None,), self.counts) if count],
+        }
+
+##
+# @class Registry
+# @brief Sammelt alle Kennzahlen eines Prozesses.
+#
+# inc() und observe() laufen ohne Lock: Unter dem GIL geht höchstens dann ein
+# Wert verloren, wenn zwei Threads genau zwischen Lesen und Schreiben desselben
+# Zählers wechseln. Für Statistik genügt das; ein Lock würde jede Erfassung
+# etwa verdoppeln. Nur snapshot() und reset() sperren gegeneinander.
+class Registry:
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    ##
+    # @brief Erhöht einen Zähler.
+    # @param name Name des Zählers
+    # @param value Betrag (Standard 1)
+    def inc(self, name, value=1):
+        counters = self.counters
+        counters[name] = counters.get(name, 0) + value
+
+    ##
+    # @brief Setzt einen Messwert (z. B. aktuelle Teilnehmerzahl).
+    # @param name Name des Messwerts
+    # @param value Aktueller Wert
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    ##
+    # @brief Trägt eine Dauer in ein Histogramm ein.
+    # @param name Name des Histogramms
+    # @param seconds Dauer in Sekunden
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    ##
+    # @brief Liefert alle Kennzahlen als Dictionary.
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "counters": dict(sorted(self.counters.copy().items())),
+                "gauges": dict(sorted(self.gauges.copy().items())),
+                "histograms": {name: h.snapshot() for name, h in sorted(self.histograms.copy().items())},
+            }
+
+    ##
+    # @brief Setzt alle Kennzahlen zurück.
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.started = time.time()
+
+##
+# @var registry
+# @brief Kennzahlen dieses Prozesses.
+registry = Registry()
+
+##
+# @var enabled
+# @brief True, solange Kennzahlen erfasst werden.
+enabled = False
+
+def _noop(*args):
+    return None
+
+inc = gauge = since = now = _noop
+
+def _since(name, start):
+    elapsed = time.perf_counter() - start
+    histogram = registry.histograms.get(name)
+    if histogram is None:
+        histogram = registry.histograms.setdefault(name, Histogram())
+    histogram.observe(elapsed)
+
+##
+# @brief Schaltet die Erfassung ein.
+def enable():
+    global enabled, inc, gauge, since, now
+    enabled = True
+    inc, gauge, since, now = registry.inc, registry.gauge, _since, time.perf_counter
+
+##
+# @brief Schaltet die Erfassung aus (bisherige Werte bleiben erhalten).
+def disable():
+    global enabled, inc, gauge, since, now
+    enabled = False
+    inc = gauge = since = now = _noop
+
+##
+# @brief Formatiert die Kennzahlen als lesbaren Text (für /stats).
+# @param snapshot Ergebnis von Registry.snapshot() (Standard: aktueller Stand)
+# @return Mehrzeiliger String
+def format_text(snapshot=None):
+    snapshot = snapshot or registry.snapshot()
+    lines = [f"Laufzeit: {snapshot['uptime_s']} s"]
+    for name, value in snapshot["counters"].items():
+        lines.append(f"{name:<32} {value:>12}")
+    for name, value in snapshot["gauges"].items():
+        lines.append(f"{name:<32} {value:>12}")
+    for name, h in snapshot["histograms"].items():
+        lines.append(f"{name:<32} n={h['count']} p50={h['p50_ms']} ms p95={h['p95_ms']} ms "
+                     f"p99={h['p99_ms']} ms max={h['max_ms']} ms")
+    return "\n".join(lines)
+
+##
+# @brief Startet den HTTP-Endpunkt für die Kennzahlen in einem Hintergrund-Thread.
+# @param port TCP-Port
+# @param host Adresse (Standard: nur lokal erreichbar)
+# @return Laufender ThreadingHTTPServer
+#
+# http.server und json werden erst hier importiert; sie kosten beim Start von
+# CLI und GUI sonst spürbar Zeit, obwohl nur der Discovery-Dienst sie braucht.
+def serve_http(port, host="127.0.0.1"):
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    # Beantwortet GET /stats mit den Kennzahlen als JSON.
+    class StatsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/stats"):
+                self.send_error(404)
+                return
+            body = json.dumps(registry.snapshot()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keine Zeile pro Abfrage
+
+    server = ThreadingHTTPServer((host, port), StatsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -6,23 +6,21 @@
 # Laden der Konfiguration und Hilfsfunktionen bereit.
 ##
 
+import os
 import socket
+import struct
 import threading
-import toml
-import os
+import time
+import random
+import metrics
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 
 ## 
 # @var debug_mode
 # @brief Schaltet zusätzliche Debug-Ausgaben im Netzwerkmodul ein/aus.
 debug_mode = False
 
-##
-# @brief Lädt die Konfiguration aus einer TOML-Datei.
-# @param path Pfad zur TOML-Datei (Default: "config.toml").
-# @return Dictionary mit Konfigurationsdaten.
-def load_config(path="config.toml"):
-    return toml.load(os.path.abspath(path))
-
 ##
 # @brief Startet einen UDP-Listener, der eingehende Nachrichten verarbeitet.
 #
@@ -41,7 +39,7 @@ def udp_listener(port, callback=None):
         print(f"[DEBUG] UDP-Listener auf Port {port}")
    
     while True:
-        data, addr = sock.recvfrom(1024)
+        data, addr = sock.recvfrom(65535)
         message = data.decode().strip()
         if debug_mode:
             print(f"[DEBUG] UDP empfangen von {addr}: {message}")
@@ -69,16 +67,480 @@ def udp_send(message, ip, port):
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
     try:
         sock.sendto(message.encode(), (ip, port))
+        metrics.inc("udp.datagrams_sent")
     except Exception as e:
         print(f"[FEHLER] UDP-Senden: {e}")
     finally:
         sock.close()
 
+##
+# @var FRAME_HEADER
+# @brief Längenpräfix eines TCP-Frames (4 Byte, Network Byte Order).
+#
+# Da Frames nie größer als MAX_FRAME_SIZE sind, ist das erste Byte eines
+# gerahmten Streams immer 0x00 – alte Textnachrichten beginnen dagegen mit
+# einem druckbaren Zeichen ("MSG", "IMG", ...). So erkennt der Empfänger beide Formate.
+FRAME_HEADER = struct.Struct("!I")
+
+##
+# @var MAX_FRAME_SIZE
+# @brief Maximale Nutzlast eines Frames in Bytes.
+MAX_FRAME_SIZE = 64 * 1024
+
+##
+# @var POOL_MAX_CONNECTIONS
+# @brief Maximale Anzahl gleichzeitig offener Verbindungen im Pool.
+POOL_MAX_CONNECTIONS = 64
+
+##
+# @var POOL_IDLE_TIMEOUT
+# @brief Sekunden, nach denen eine unbenutzte Pool-Verbindung geschlossen wird.
+POOL_IDLE_TIMEOUT = 60.0
+
+##
+# @var CONNECTION_IDLE_TIMEOUT
+# @brief Sekunden, nach denen der Empfänger eine stille Verbindung schließt.
+#
+# Größer als POOL_IDLE_TIMEOUT, damit normalerweise der Sender zuerst schließt.
+CONNECTION_IDLE_TIMEOUT = 2 * POOL_IDLE_TIMEOUT
+
+##
+# @brief Sendet einen Frame (Längenpräfix + Nutzlast) über einen TCP-Socket.
+# @param sock Verbundener TCP-Socket
+# @param payload Nutzlast (bytes)
+def send_frame(sock, payload):
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame zu groß ({len(payload)} > {MAX_FRAME_SIZE} Bytes)")
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+##
+# @brief Liest genau n Bytes von einem Socket.
+# @param sock Verbundener TCP-Socket
+# @param n Anzahl Bytes
+# @return Gelesene Bytes oder None, falls die Verbindung vorher endet
+def recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    received = 0
+    while received < n:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            return None
+        received += count
+    return bytes(buf)
+
+##
+# @brief Liest Frames von einer Verbindung, bis diese geschlossen wird.
+# @param sock Verbundener TCP-Socket
+# @return Generator über die Nutzlasten (bytes)
+def recv_frames(sock):
+    while True:
+        header = recv_exact(sock, FRAME_HEADER.size)
+        if header is None:
+            return
+        (length,) = FRAME_HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise ValueError(f"Frame zu groß ({length} > {MAX_FRAME_SIZE} Bytes)")
+        payload = recv_exact(sock, length)
+        if payload is None:
+            return
+        metrics.inc("tcp.frames_received")
+        metrics.inc("tcp.bytes_received", length)
+        yield payload
+
+##
+# @brief Prüft, ob eine eingehende Verbindung gerahmte Nachrichten sendet.
+# @param conn Angenommene TCP-Verbindung
+# @return True bei Frames, False bei alter Einmal-Nachricht (oder leerer Verbindung)
+def is_framed(conn):
+    return conn.recv(1, socket.MSG_PEEK) == b"\x00"
+
+##
+# @brief Liest alle Nachrichten einer eingehenden Verbindung (Frames oder alt).
+# @param conn Angenommene TCP-Verbindung
+# @param idle_timeout Sekunden ohne Daten, nach denen aufgehört wird
+# @return Generator über die Nachrichten (bytes)
+#
+# Gerahmte Verbindungen liefern beliebig viele Nachrichten, alte Clients genau eine.
+def read_messages(conn, idle_timeout=CONNECTION_IDLE_TIMEOUT):
+    conn.settimeout(idle_timeout)
+    try:
+        if is_framed(conn):
+            yield from recv_frames(conn)
+        else:
+            data = conn.recv(1024)
+            if data:
+                yield data
+    except socket.timeout:
+        return
+
+##
+# @class PooledConnection
+# @brief Eintrag im ConnectionPool: Socket, letzter Zugriff und eigenes Lock.
+#
+# evicted wird gesetzt, sobald der Eintrag aus dem Pool entfernt ist; wer ihn
+# gerade benutzt, schließt den Socket danach selbst.
+class PooledConnection:
+    def __init__(self):
+        self.sock = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self.evicted = False
+
+    ##
+    # @brief Schließt den Socket des Eintrags (falls offen).
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+##
+# @brief Prüft ohne zu blockieren, ob die Gegenseite eine Verbindung geschlossen hat.
+# @param sock TCP-Socket
+# @return False, wenn die Verbindung beendet oder fehlerhaft ist
+def connection_alive(sock):
+    timeout = sock.gettimeout()
+    try:
+        sock.setblocking(False)
+        return sock.recv(1, socket.MSG_PEEK) != b""
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+##
+# @var UNIX_SOCKET_CAPABILITY
+# @brief Token im JOIN: Der Client nimmt Verbindungen zusätzlich über einen Unix-Domain-Socket an.
+UNIX_SOCKET_CAPABILITY = "uds"
+
+##
+# @var UNIX_SOCKETS
+# @brief True, wenn das Betriebssystem Unix-Domain-Sockets unterstützt.
+UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+# IP → True/False, ob die Adresse zu diesem Rechner gehört
+_local_addresses = {}
+
+##
+# @brief Pfad des Unix-Domain-Sockets, unter dem ein Client mit diesem TCP-Port lauscht.
+# @param port TCP-Port des Clients
+# @return Pfad unter <tmp>/slcp-<uid>/
+#
+# Der Pfad folgt aus dem TCP-Port, der auf einem Rechner nur einmal vergeben
+# sein kann; Roster-Einträge brauchen daher kein zusätzliches Feld.
+def unix_socket_path(port):
+    import tempfile
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"slcp-{uid}", f"{port}.sock")
+
+##
+# @brief Prüft, ob eine IP-Adresse zu diesem Rechner gehört (Ergebnis wird gemerkt).
+# @param ip IPv4-Adresse
+# @return True für Loopback und eigene Schnittstellen-Adressen
+#
+# bind() auf eine Adresse gelingt nur, wenn sie einer eigenen Schnittstelle gehört.
+def is_local_address(ip):
+    local = _local_addresses.get(ip)
+    if local is None:
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.bind((ip, 0))
+            local = True
+        except OSError:
+            local = False
+        _local_addresses[ip] = local
+    return local
+
+##
+# @brief Liefert den Unix-Domain-Socket eines Peers, falls er auf diesem Rechner lauscht.
+# @param ip IP-Adresse des Peers
+# @param port TCP-Port des Peers
+# @return Pfad oder None (Peer nicht lokal, Socket nicht vorhanden oder nicht unterstützt)
+def unix_endpoint(ip, port):
+    if not UNIX_SOCKETS or not is_local_address(ip):
+        return None
+    path = unix_socket_path(port)
+    return path if os.path.exists(path) else None
+
+##
+# @brief Baut eine Verbindung zu einem Peer auf, lokal bevorzugt über Unix-Domain-Socket.
+# @param ip IP-Adresse des Peers
+# @param port TCP-Port des Peers
+# @param timeout Timeout für den Verbindungsaufbau
+# @return Verbundener Socket (AF_UNIX oder TCP)
+#
+# Liegt der Peer auf demselben Rechner und lauscht unter unix_socket_path(port),
+# entfallen TCP-Handshake und Loopback-Stack. Schlägt das fehl (z. B. verwaister
+# Socket nach Absturz), wird normal per TCP verbunden.
+def open_connection(ip, port, timeout):
+    path = unix_endpoint(ip, port)
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            metrics.inc("uds.connects")
+            return sock
+        except OSError:
+            sock.close()
+            metrics.inc("uds.fallbacks")
+    sock = socket.create_connection((ip, port), timeout=timeout)
+    metrics.inc("tcp.connects")
+    return sock
+
+##
+# @brief Lauscht zusätzlich zum TCP-Port auf einem Unix-Domain-Socket.
+# @param port TCP-Port dieses Clients (bestimmt den Pfad)
+# @param handler Funktion(conn, addr) für jede angenommene Verbindung; addr ist ("127.0.0.1", 0)
+# @return Pfad des Sockets oder None, falls nicht unterstützt oder nicht anlegbar
+#
+# Ein verwaister Socket eines früheren Prozesses wird ersetzt; beim Beenden
+# wird der Socket wieder entfernt.
+def unix_server(port, handler):
+    if not UNIX_SOCKETS:
+        return None
+    import atexit
+    path = unix_socket_path(port)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(path)
+        sock.bind(path)
+        sock.listen()
+    except OSError:
+        sock.close()
+        return None
+
+    def remove():
+        sock.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+    atexit.register(remove)
+
+    def accept_loop():
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=handler, args=(conn, ("127.0.0.1", 0)), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return path
+
+##
+# @class ConnectionPool
+# @brief Hält langlebige TCP-Verbindungen pro Peer (IP, Port) offen.
+#
+# Statt für jede Nachricht eine neue Verbindung aufzubauen, werden Nachrichten
+# als Frames über eine bestehende Verbindung geschickt. Peers auf demselben
+# Rechner werden über ihren Unix-Domain-Socket erreicht (siehe open_connection()).
+# Unbenutzte Verbindungen werden nach idle_timeout geschlossen; bei mehr als
+# max_connections wird die am längsten unbenutzte Verbindung verdrängt.
+#
+class ConnectionPool:
+    ##
+    # @brief Konstruktor.
+    # @param max_connections Maximale Anzahl offener Verbindungen
+    # @param idle_timeout Sekunden bis eine unbenutzte Verbindung geschlossen wird
+    # @param connect_timeout Timeout für Verbindungsaufbau und Senden
+    def __init__(self, max_connections=POOL_MAX_CONNECTIONS, idle_timeout=POOL_IDLE_TIMEOUT,
+                 connect_timeout=2.0):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.connections = OrderedDict()  # (ip, port) → PooledConnection, älteste zuerst
+        self.lock = threading.Lock()
+
+    ##
+    # @brief Holt (oder erzeugt) den Pool-Eintrag für einen Peer.
+    # @param key (IP, Port)
+    # @return PooledConnection
+    def entry(self, key):
+        now = time.monotonic()
+        stale = []
+        with self.lock:
+            entry = self.connections.pop(key, None) or PooledConnection()
+            # Unbenutzte Verbindungen vom alten Ende her schließen
+            for other_key, other in list(self.connections.items()):
+                if now - other.last_used < self.idle_timeout and len(self.connections) < self.max_connections:
+                    break
+                del self.connections[other_key]
+                other.evicted = True
+                stale.append(other)
+            self.connections[key] = entry
+        self.close_evicted(stale)
+        return entry
+
+    ##
+    # @brief Schließt Verbindungen, die länger als idle_timeout unbenutzt sind.
+    # @return Anzahl geschlossener Verbindungen
+    #
+    # Wird regelmäßig aus den Empfangsschleifen von CLI und GUI aufgerufen, damit
+    # ein ruhiger Client keine Verbindungen offen hält, bis ein neues entry() sie verdrängt.
+    def sweep(self):
+        now = time.monotonic()
+        stale = []
+        with self.lock:
+            for key, entry in list(self.connections.items()):
+                if now - entry.last_used < self.idle_timeout:
+                    break  # älteste zuerst: alle weiteren sind jünger
+                del self.connections[key]
+                entry.evicted = True
+                stale.append(entry)
+        self.close_evicted(stale)
+        return len(stale)
+
+    ##
+    # @brief Schließt aus dem Pool entfernte Einträge (Aufruf ohne self.lock).
+    # @param entries PooledConnection-Objekte mit evicted = True
+    def close_evicted(self, entries):
+        for entry in entries:
+            # Belegte Einträge schließt send() nach dem Senden (evicted)
+            if entry.lock.acquire(blocking=False):
+                entry.close()
+                entry.lock.release()
+
+    ##
+    # @brief Sendet eine Nachricht als Frame an einen Peer.
+    # @param ip Ziel-IP-Adresse
+    # @param port Ziel-Port
+    # @param payload Nachricht (bytes)
+    # @param timeout Optionaler Timeout (sonst connect_timeout)
+    #
+    # Ist eine wiederverwendete Verbindung inzwischen tot, wird einmal mit einer
+    # neuen Verbindung wiederholt. Fehler werden als OSError weitergereicht.
+    def send(self, ip, port, payload, timeout=None):
+        key = (ip, port)
+        timeout = self.connect_timeout if timeout is None else timeout
+        start = metrics.now()
+        while True:
+            entry = self.entry(key)
+            with entry.lock:
+                if entry.evicted:
+                    continue  # verdrängt, während wir auf das Lock gewartet haben
+                reused = entry.sock is not None and connection_alive(entry.sock)
+                try:
+                    if not reused:
+                        entry.close()
+                        entry.sock = open_connection(ip, port, timeout)
+                    entry.sock.settimeout(timeout)
+                    send_frame(entry.sock, payload)
+                    entry.last_used = time.monotonic()
+                    metrics.inc("tcp.frames_sent")
+                    metrics.inc("tcp.bytes_sent", len(payload))
+                    metrics.since("tcp.send_seconds", start)
+                    return
+                except OSError:
+                    entry.close()
+                    if not reused:
+                        metrics.inc("tcp.send_errors")
+                        raise
+                finally:
+                    if entry.evicted:
+                        entry.close()  # während des Sendens verdrängt
+
+    ##
+    # @brief Schließt alle Verbindungen des Pools.
+    def close_all(self):
+        with self.lock:
+            entries = list(self.connections.values())
+            self.connections.clear()
+        for entry in entries:
+            entry.evicted = True
+            with entry.lock:
+                entry.close()
+
+##
+# @var connection_pool
+# @brief Gemeinsamer Verbindungspool für CLI, GUI und tcp_send().
+connection_pool = ConnectionPool()
+
+##
+# @var FANOUT_WORKERS
+# @brief Maximale Anzahl paralleler Sendevorgänge beim Verteilen an mehrere Peers.
+FANOUT_WORKERS = 16
+
+##
+# @var FANOUT_DEADLINE
+# @brief Gesamtfrist in Sekunden für das Verteilen einer Nachricht an alle Empfänger.
+FANOUT_DEADLINE = 3.0
+
+##
+# @class FanoutDispatcher
+# @brief Verschickt eine Nachricht im Hintergrund parallel an viele Peers.
+#
+# Alle Sendevorgänge laufen in einem Thread-Pool und teilen sich eine
+# gemeinsame Frist. Nicht erreichbare Peers verzögern die übrigen nicht;
+# das Ergebnis (Fehler pro Empfänger) wird über einen Callback gemeldet.
+#
+class FanoutDispatcher:
+    ##
+    # @brief Konstruktor.
+    # @param pool ConnectionPool für die Verbindungen
+    # @param max_workers Maximale Anzahl paralleler Sendevorgänge
+    def __init__(self, pool=None, max_workers=FANOUT_WORKERS):
+        self.pool = pool or connection_pool
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+
+    ##
+    # @brief Startet das Verteilen und kehrt sofort zurück.
+    # @param targets Dictionary Name → (IP, Port)
+    # @param payload Nachricht (bytes) oder Funktion Name → bytes (z. B. je nach Protokollversion)
+    # @param deadline Gesamtfrist in Sekunden
+    # @param on_done Callback mit Dictionary Name → Fehlertext (leer bei Erfolg)
+    def submit(self, targets, payload, deadline=FANOUT_DEADLINE, on_done=None):
+        threading.Thread(target=self.run, args=(dict(targets), payload, deadline, on_done),
+                         daemon=True).start()
+
+    ##
+    # @brief Verteilt synchron (läuft im Hintergrund-Thread von submit()).
+    # @return Dictionary Name → Fehlertext für alle fehlgeschlagenen Empfänger
+    def run(self, targets, payload, deadline=FANOUT_DEADLINE, on_done=None):
+        end = time.monotonic() + deadline
+        start = metrics.now()
+
+        def send(name, address):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Frist abgelaufen")
+            data = payload(name) if callable(payload) else payload
+            self.pool.send(address[0], address[1], data, timeout=remaining)
+
+        futures = {self.executor.submit(send, name, address): name for name, address in targets.items()}
+        done, not_done = wait(futures, timeout=max(0.0, end - time.monotonic()))
+        failures = {}
+        for future in done:
+            if future.exception() is not None:
+                failures[futures[future]] = str(future.exception()) or type(future.exception()).__name__
+        for future in not_done:
+            future.cancel()
+            failures[futures[future]] = "Zeitüberschreitung"
+        metrics.since("fanout.seconds", start)
+        metrics.inc("fanout.targets", len(targets))
+        metrics.inc("fanout.failures", len(failures))
+        if on_done:
+            on_done(failures)
+        return failures
+
+    ##
+    # @brief Beendet den Thread-Pool, ohne auf laufende Sendevorgänge zu warten.
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 ##
 # @brief Startet einen TCP-Server, der auf eingehende Verbindungen wartet.
 #
 # Lauscht auf dem gegebenen Port, nimmt eingehende TCP-Verbindungen entgegen und 
-# ruft optional ein Callback mit den empfangenen Daten auf.
+# ruft optional ein Callback für jede empfangene Nachricht auf. Jede Verbindung
+# wird in einem eigenen Thread gelesen, da über eine Verbindung viele Frames kommen können.
 #
 # @param port Port für den TCP-Server.
 # @param callback Funktion, die für jede Nachricht aufgerufen wird (data).
@@ -87,15 +549,170 @@ def tcp_server(port, callback=None):
     sock.bind(("0.0.0.0", port))
     sock.listen()
     print(f"[TCP] Server auf Port {port}")
-   
+
+    def handle(conn, addr):
+        with conn:
+            for raw in read_messages(conn):
+                data = raw.decode("utf-8")
+                if debug_mode:
+                    print(f"[DEBUG] TCP empfangen von {addr}: {data}")
+                if callback:
+                    callback(data)
+
     while True:
         conn, addr = sock.accept()
-        data = conn.recv(1024).decode("utf-8")
-        if debug_mode:
-            print(f"[DEBUG] TCP empfangen von {addr}: {data}")
-        if callback:
-            callback(data)
-        conn.close()
+        threading.Thread(target=handle, args=(conn, addr), daemon=True).start()
+
+##
+# @var IMAGE_CHUNK_SIZE
+# @brief Blockgröße beim Streamen von Bilddaten auf die Platte (Bytes).
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+##
+# @var MAX_HEADER_LENGTH
+# @brief Maximale Länge einer Kopfzeile wie "IMG <Absender> <Größe> <Name>".
+MAX_HEADER_LENGTH = 1024
+
+##
+# @brief Liest eine Kopfzeile bis zum ersten Zeilenumbruch.
+# @param sock Verbundener TCP-Socket
+# @param initial Bereits empfangene Bytes
+# @param limit Maximale Länge der Kopfzeile
+# @return Tupel (Kopfzeile ohne "\n", bereits mitgelesene Nutzdaten)
+def recv_line(sock, initial=b"", limit=MAX_HEADER_LENGTH):
+    data = bytes(initial)
+    while b"\n" not in data:
+        if len(data) > limit:
+            raise ValueError("Kopfzeile zu lang")
+        chunk = sock.recv(limit)
+        if not chunk:
+            raise ConnectionError("Verbindung vor Ende der Kopfzeile geschlossen")
+        data += chunk
+    line, rest = data.split(b"\n", 1)
+    return line, rest
+
+##
+# @brief Schreibt genau size Bytes von einem Socket in eine Datei.
+# @param sock Verbundener TCP-Socket
+# @param fileobj Binär geöffnete Zieldatei
+# @param size Anzahl erwarteter Bytes
+# @param initial Bereits empfangene Nutzdaten (z. B. nach der Kopfzeile)
+#
+# Verwendet einen festen Puffer von IMAGE_CHUNK_SIZE Bytes, der Speicherbedarf
+# hängt also nicht von der Bildgröße ab.
+def recv_to_file(sock, fileobj, size, initial=b""):
+    head = initial[:size]
+    fileobj.write(head)
+    remaining = size - len(head)
+    buf = bytearray(IMAGE_CHUNK_SIZE)
+    view = memoryview(buf)
+    while remaining > 0:
+        count = sock.recv_into(view[:min(remaining, IMAGE_CHUNK_SIZE)])
+        if count == 0:
+            raise ConnectionError(f"Verbindung abgebrochen, {remaining} Bytes fehlen")
+        fileobj.write(view[:count])
+        remaining -= count
+
+##
+# @brief Sendet eine Kopfzeile und anschließend eine Datei über eine neue TCP-Verbindung.
+# @param ip Ziel-IP-Adresse
+# @param port Ziel-Port
+# @param header Kopfzeile ohne Zeilenumbruch (String)
+# @param path Pfad der zu sendenden Datei
+# @param timeout Timeout für Verbindungsaufbau und jeden Sendeschritt
+#
+# Nutzt socket.sendfile(), d. h. os.sendfile() ohne Kopie in den Userspace,
+# wo das Betriebssystem es unterstützt.
+def send_file(ip, port, header, path, timeout=2.0):
+    with open_connection(ip, port, timeout) as sock, open(path, "rb") as f:
+        sock.sendall(header.encode() + b"\n")
+        sent = sock.sendfile(f)
+    metrics.inc("tcp.files_sent")
+    metrics.inc("tcp.file_bytes_sent", sent)
+
+##
+# @brief Sendet eine Kopfzeile und anschließend Daten aus dem Speicher über eine neue Verbindung.
+# @param ip Ziel-IP-Adresse
+# @param port Ziel-Port
+# @param header Kopfzeile ohne Zeilenumbruch (String)
+# @param data Nutzdaten (bytes), z. B. ein verkleinertes oder komprimiertes Bild
+# @param timeout Timeout für Verbindungsaufbau und jeden Sendeschritt
+def send_data(ip, port, header, data, timeout=2.0):
+    with open_connection(ip, port, timeout) as sock:
+        sock.sendall(header.encode() + b"\n")
+        sock.sendall(data)
+    metrics.inc("tcp.files_sent")
+    metrics.inc("tcp.file_bytes_sent", len(data))
+
+##
+# @var IMAGE_ZLIB_CAPABILITY
+# @brief Token im JOIN: Der Client nimmt zlib-komprimierte Bilder an ("IMGZ").
+IMAGE_ZLIB_CAPABILITY = "zimg"
+
+##
+# @var IMAGE_SCALED_CAPABILITY
+# @brief Token im JOIN: Der Client nimmt verkleinerte Bilder an (sonst immer das Original).
+IMAGE_SCALED_CAPABILITY = "scaled"
+
+##
+# @var IMAGE_COMPRESS_LEVEL
+# @brief zlib-Stufe für Bildübertragungen.
+IMAGE_COMPRESS_LEVEL = 6
+
+##
+# @var IMAGE_COMPRESS_MIN_SAVING
+# @brief Mindestens eingesparter Anteil, ab dem komprimiert gesendet wird.
+#
+# JPEG und PNG sind bereits komprimiert und werden kaum kleiner; dann lohnt
+# das Entpacken beim Empfänger nicht und es geht ein normales IMG raus.
+IMAGE_COMPRESS_MIN_SAVING = 0.05
+
+##
+# @brief Komprimiert Bilddaten verlustfrei, falls es sich lohnt.
+# @param data Bilddaten (bytes)
+# @param level zlib-Stufe
+# @return Komprimierte Daten oder None (Ersparnis unter IMAGE_COMPRESS_MIN_SAVING)
+def compress_image(data, level=IMAGE_COMPRESS_LEVEL):
+    import zlib
+    packed = zlib.compress(data, level)
+    if len(packed) > len(data) * (1 - IMAGE_COMPRESS_MIN_SAVING):
+        return None
+    return packed
+
+##
+# @class InflatingWriter
+# @brief Dateiobjekt-Ersatz für recv_to_file(), das zlib-Daten entpackt in eine Datei schreibt.
+#
+# Schreibt höchstens limit entpackte Bytes (die im Kopf angekündigte Größe), damit
+# ein manipulierter Datenstrom nicht beliebig viel Platz belegt.
+class InflatingWriter:
+    ##
+    # @brief Konstruktor.
+    # @param fileobj Binär geöffnete Zieldatei
+    # @param limit Erwartete Anzahl entpackter Bytes
+    def __init__(self, fileobj, limit):
+        import zlib
+        self.fileobj = fileobj
+        self.remaining = limit
+        self.inflater = zlib.decompressobj()
+
+    ##
+    # @brief Entpackt einen Block komprimierter Daten.
+    # @param data Komprimierte Bytes
+    def write(self, data):
+        while data:
+            chunk = self.inflater.decompress(data, max(1, self.remaining + 1))
+            if len(chunk) > self.remaining:
+                raise ValueError("Entpackte Daten größer als angekündigt")
+            self.fileobj.write(chunk)
+            self.remaining -= len(chunk)
+            data = self.inflater.unconsumed_tail
+
+    ##
+    # @brief Prüft, ob der Datenstrom vollständig war.
+    def finish(self):
+        if not self.inflater.eof or self.remaining:
+            raise ValueError("Komprimierte Bilddaten unvollständig")
 
 ##
 # @var MAX_MSG_LENGTH
@@ -105,8 +722,8 @@ MAX_MSG_LENGTH = 512  # Oberes Limit für Nachrichtenlänge
 ##
 # @brief Sendet eine Nachricht via TCP (Text oder Binärdaten).
 #
-# Baut eine TCP-Verbindung auf, prüft die Nachrichtenlänge (für Text), 
-# sendet die Nachricht (Text oder Binärdaten) und schließt die Verbindung.
+# Prüft die Nachrichtenlänge (für Text) und sendet die Nachricht als Frame
+# über eine (wiederverwendete) Verbindung aus dem connection_pool.
 #
 # @param message Die zu sendende Nachricht (String oder bytes)
 # @param ip Ziel-IP-Adresse (Empfänger)
@@ -116,20 +733,12 @@ def tcp_send(message, ip, port, binary=False):
     # Prüft für Textnachrichten die maximale Länge (Protokoll-Anforderung)
     if not binary and len(message) > MAX_MSG_LENGTH:
         raise ValueError(f"Nachricht zu lang ({len(message)} > {MAX_MSG_LENGTH} Zeichen)")
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(2.0)  # Timeout für Verbindung
     try:
-        sock.connect((ip, port))
-        if binary:
-            sock.sendall(message)
-        else:
-            sock.sendall(message.encode())
+        connection_pool.send(ip, port, message if binary else message.encode())
         if debug_mode:
             print(f"[DEBUG] TCP gesendet an {ip}:{port} → {message[:50] if not binary else '[BINÄRDATEN]'}")
     except Exception as e:
         print(f"[FEHLER] TCP: {e}")
-    finally:
-        sock.close()
 
 ##
 # @brief Ermittelt die eigene (lokale) IP-Adresse.
@@ -145,3 +754,171 @@ def get_own_ip():
             return s.getsockname()[0]
     except:
         return "127.0.0.1"
+
+##
+# @var MULTICAST_GROUP
+# @brief Standard-Multicast-Gruppe für Nachrichten an alle (organisationslokaler Bereich).
+MULTICAST_GROUP = "239.255.42.99"
+
+##
+# @var MULTICAST_PORT
+# @brief Standard-UDP-Port der Multicast-Gruppe.
+MULTICAST_PORT = 5007
+
+##
+# @var MULTICAST_HISTORY
+# @brief Anzahl zuletzt gesendeter Multicast-Nachrichten, die für Nachforderungen vorgehalten werden.
+MULTICAST_HISTORY = 256
+
+##
+# @var MULTICAST_NACK_INTERVAL
+# @brief Sekunden, bevor eine fehlende Sequenznummer erneut nachgefordert wird.
+MULTICAST_NACK_INTERVAL = 0.5
+
+##
+# @var MULTICAST_NACK_RETRIES
+# @brief Anzahl Nachforderungen pro fehlender Sequenznummer, danach gilt sie als verloren.
+MULTICAST_NACK_RETRIES = 3
+
+##
+# @class MulticastChannel
+# @brief Gruppenkanal über UDP-Multicast für Nachrichten an alle.
+#
+# Eine Nachricht an alle ist ein einziges Datagramm an die Multicast-Gruppe:
+# "MCAST <Sitzung> <Seq> <Absender> <Text>". Empfänger erkennen fehlende
+# Sequenznummern und fordern sie per Unicast mit "MNACK <Sitzung> <Seq>,<Seq>,..."
+# beim Absender an, der sie aus seinem Verlauf erneut per Unicast schickt.
+# Die Sitzungskennung unterscheidet Neustarts eines Absenders.
+#
+# Jede Lücke wird beim Erkennen sofort nachgefordert, danach höchstens alle
+# MULTICAST_NACK_INTERVAL Sekunden und insgesamt MULTICAST_NACK_RETRIES Mal;
+# so löst eine anhaltende Lücke nicht bei jeder neuen Nachricht ein MNACK
+# jedes Empfängers aus.
+#
+class MulticastChannel:
+    ##
+    # @brief Konstruktor: tritt der Gruppe bei und startet die Empfangs-Threads.
+    # @param group Multicast-Gruppe (z. B. "239.255.42.99")
+    # @param port UDP-Port der Gruppe
+    # @param handle Eigener Handle
+    # @param callback Funktion (Absender, Text) für jede empfangene Nachricht
+    # @param ttl Multicast-TTL (1 = nur lokales Netz)
+    def __init__(self, group, port, handle, callback=None, ttl=1):
+        self.group = group
+        self.port = port
+        self.handle = handle
+        self.callback = callback
+        self.session = random.getrandbits(32)
+        self.seq = 0
+        self.history = OrderedDict()  # Seq → Datagramm
+        self.peers = {}  # (Absender, Sitzung) → {"next": Seq, "missing": {Seq: (letztes MNACK, Anzahl)}}
+        self.lock = threading.Lock()
+        self.running = True
+
+        self.recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            self.recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.recv_sock.bind(("", port))
+        membership = struct.pack("4sl", socket.inet_aton(group), socket.INADDR_ANY)
+        self.recv_sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+        # Unicast-Socket: sendet an die Gruppe, empfängt MNACKs und Wiederholungen
+        self.send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self.send_sock.bind(("", 0))
+
+        threading.Thread(target=self.listen, args=(self.recv_sock,), daemon=True).start()
+        threading.Thread(target=self.listen, args=(self.send_sock,), daemon=True).start()
+
+    ##
+    # @brief Schickt eine Nachricht als ein Datagramm an die ganze Gruppe.
+    # @param text Nachrichtentext
+    def send(self, text):
+        with self.lock:
+            self.seq += 1
+            data = f"MCAST {self.session} {self.seq} {self.handle} {text}".encode()
+            self.history[self.seq] = data
+            if len(self.history) > MULTICAST_HISTORY:
+                self.history.popitem(last=False)
+        self.send_sock.sendto(data, (self.group, self.port))
+        metrics.inc("mcast.sent")
+        if debug_mode:
+            print(f"[DEBUG] Multicast gesendet an {self.group}:{self.port} → {text[:50]}")
+
+    ##
+    # @brief Empfangsschleife für einen der beiden Sockets.
+    # @param sock Multicast- oder Unicast-Socket
+    def listen(self, sock):
+        while self.running:
+            try:
+                data, addr = sock.recvfrom(65535)
+                if data.startswith(b"MCAST "):
+                    self.handle_mcast(data, addr)
+                elif data.startswith(b"MNACK "):
+                    self.handle_nack(data, addr)
+            except OSError:
+                if not self.running:
+                    return
+            except ValueError:
+                pass  # ungültiges Datagramm
+
+    ##
+    # @brief Verarbeitet eine (ggf. wiederholte) Gruppen-Nachricht.
+    # @param data Datagramm "MCAST <Sitzung> <Seq> <Absender> <Text>"
+    # @param addr Unicast-Adresse des Absenders (für Nachforderungen)
+    def handle_mcast(self, data, addr):
+        _, session, seq, sender, text = data.decode().split(" ", 4)
+        seq = int(seq)
+        if sender == self.handle and int(session) == self.session:
+            return
+        now = time.monotonic()
+        with self.lock:
+            state = self.peers.setdefault((sender, session), {"next": seq, "missing": {}})
+            missing = state["missing"]
+            if seq >= state["next"]:
+                # Höchstens so viele Lücken, wie der Absender vorhält (schützt vor riesigen Sprüngen)
+                for gap in range(max(state["next"], seq - MULTICAST_HISTORY + 1), seq):
+                    missing[gap] = (0.0, 0)
+                state["next"] = seq + 1
+            elif missing.pop(seq, None) is None:
+                return  # Duplikat
+            # Ältere Lücken als der Verlauf des Absenders können nicht mehr gefüllt werden
+            oldest = state["next"] - MULTICAST_HISTORY
+            due = []
+            for gap, (last, tries) in list(missing.items()):
+                if gap < oldest or (tries >= MULTICAST_NACK_RETRIES and now - last >= MULTICAST_NACK_INTERVAL):
+                    del missing[gap]
+                elif now - last >= MULTICAST_NACK_INTERVAL and len(due) < 64:
+                    missing[gap] = (now, tries + 1)
+                    due.append(gap)
+        metrics.inc("mcast.received")
+        if due:
+            nack = f"MNACK {session} " + ",".join(str(s) for s in sorted(due))
+            self.send_sock.sendto(nack.encode(), addr)
+            metrics.inc("mcast.nacks_sent")
+        if self.callback:
+            self.callback(sender, text)
+
+    ##
+    # @brief Beantwortet eine Nachforderung aus dem eigenen Verlauf (Unicast).
+    # @param data Datagramm "MNACK <Sitzung> <Seq>,<Seq>,..."
+    # @param addr Adresse des anfragenden Peers
+    def handle_nack(self, data, addr):
+        _, session, seqs = data.decode().split(" ", 2)
+        if int(session) != self.session:
+            return
+        for seq in seqs.split(","):
+            with self.lock:
+                datagram = self.history.get(int(seq))
+            if datagram is not None:
+                self.send_sock.sendto(datagram, addr)
+                metrics.inc("mcast.retransmits")
+
+    ##
+    # @brief Verlässt die Gruppe und schließt beide Sockets.
+    def close(self):
+        self.running = False
+        self.recv_sock.close()
+        self.send_sock.close()
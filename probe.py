@@ -0,0 +1,82 @@
+##
+# @file probe.py
+# @brief Sucht Discovery-Dienste im Broadcast-Netz per PING/PONG.
+#
+# Ersetzt die frühere Prüfung "ist der Discovery-Port lokal belegt?", die nur
+# auf demselben Rechner funktionierte und nichts darüber aussagte, ob der
+# Dienst tatsächlich antwortet. probe() schickt ein PING mit Zufalls-Nonce per
+# Broadcast (oder an eine feste Adresse) und sammelt die PONG-Antworten samt
+# Round-Trip-Zeit. Der Aufrufer nimmt die schnellste Instanz; antwortet
+# niemand, kehrt probe() nach PROBE_TIMEOUT mit einer leeren Liste zurück.
+##
+
+import random
+import socket
+import time
+from collections import namedtuple
+import protocol
+
+##
+# @var PROBE_TIMEOUT
+# @brief Sekunden, nach denen ohne Antwort aufgegeben wird.
+PROBE_TIMEOUT = 0.5
+
+##
+# @var PROBE_ATTEMPTS
+# @brief Anzahl der PINGs innerhalb von PROBE_TIMEOUT (gegen einzelne verlorene Datagramme).
+PROBE_ATTEMPTS = 2
+
+##
+# @var PROBE_GRACE
+# @brief Sekunden, die nach der ersten Antwort noch auf weitere Instanzen gewartet wird.
+PROBE_GRACE = 0.05
+
+##
+# @var DiscoveryInstance
+# @brief Antwortender Discovery-Dienst: IP, Port, Round-Trip-Zeit (s), Teilnehmer, Roster-Version.
+DiscoveryInstance = namedtuple("DiscoveryInstance", "ip port rtt participants version")
+
+##
+# @brief Sucht antwortende Discovery-Dienste.
+# @param port UDP-Port des Discovery-Dienstes (whoisport)
+# @param address Ziel des PING (Standard: Broadcast im lokalen Netz)
+# @param timeout Sekunden bis zum Aufgeben, wenn niemand antwortet
+# @param attempts Anzahl der PINGs, gleichmäßig über timeout verteilt
+# @param grace Sekunden, die nach der ersten Antwort auf weitere gewartet wird
+# @return Liste von DiscoveryInstance, schnellste zuerst (leer, falls niemand antwortet)
+def probe(port, address="255.255.255.255", timeout=PROBE_TIMEOUT, attempts=PROBE_ATTEMPTS, grace=PROBE_GRACE):
+    found = {}
+    sent = {}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        start = time.perf_counter()
+        deadline = start + timeout
+        next_ping = start
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            retry = len(sent) < attempts and not found
+            if retry and now >= next_ping:
+                nonce = random.getrandbits(32)
+                sent[nonce] = now
+                sock.sendto(protocol.encode_ping(nonce), (address, port))
+                next_ping = now + timeout / attempts
+                retry = len(sent) < attempts
+            sock.settimeout(max(0.001, (min(deadline, next_ping) if retry else deadline) - now))
+            try:
+                data, addr = sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            arrived = time.perf_counter()
+            try:
+                message = protocol.parse(data)
+            except ValueError:
+                continue
+            if not message or message[0] != "PONG" or message[1] not in sent or addr[0] in found:
+                continue
+            _, nonce, participants, version = message
+            # Absenderport nicht übernehmen: die Thread-Engine antwortet von einem eigenen Socket
+            found[addr[0]] = DiscoveryInstance(addr[0], port, arrived - sent[nonce], participants, version)
+            deadline = min(deadline, arrived + grace)
+    return sorted(found.values(), key=lambda instance: instance.rtt)
@@ -0,0 +1,476 @@
+##
+# @file protocol.py
+# @brief Gemeinsamer SLCP-Codec: Text (v1) und binäres SLCP v2.
+#
+# Discovery-Service, CLI und GUI kodieren und zerlegen alle Discovery- und
+# Chatnachrichten über dieses Modul. parse() liefert für beide Formate dieselben
+# Tupel (Befehl, Felder ...). Dabei wird nie die ganze Nachricht dekodiert:
+# v2 wird per struct.unpack_from direkt aus einem memoryview gelesen, Text wird
+# als Bytes zerlegt und nur die benötigten Felder werden zu str bzw. int.
+# Listeneinträge (KNOWNUSERS, SNAPSHOT) werden als Generator geliefert und erst
+# beim Durchlaufen erzeugt.
+#
+# SLCP v1 besteht aus Textzeilen, die jeder Empfänger mit split()/int() zerlegt.
+# SLCP v2 kodiert dieselben Nachrichten mit festen Kopffeldern und
+# längenpräfixierten Zeichenketten:
+#
+#   Magic 0xB2 (1) | Typ (1) | Felder ...
+#
+# Das Magic-Byte ist kein ASCII-Zeichen; Text-Nachrichten (v1) und gerahmte
+# TCP-Verbindungen (erstes Byte 0x00) sind daher eindeutig unterscheidbar.
+#
+# Aushandlung: Ein Client hängt im (Text-)JOIN die Fähigkeit "v2" an. Der
+# Discovery-Service schickt ihm daraufhin SNAPSHOT/JOINED/LEFT/KNOWNUSERS/REJOIN
+# binär und meldet in jedem Listeneintrag die Fähigkeiten des Teilnehmers mit.
+# Chatnachrichten (MSG) gehen nur an Peers binär, die "v2" angemeldet haben;
+# alle anderen erhalten weiterhin Text.
+#
+# Feldtypen (Network Byte Order):
+# - Name: Länge (1 Byte) + UTF-8
+# - IP: 4 Byte (IPv4), Port: 2 Byte, Version: 4 Byte, Seite/Anzahl: 2 Byte
+# - Listeneintrag: Name | IP | Port | Fähigkeiten-Bits (1 Byte)
+##
+
+import socket
+import struct
+
+##
+# @var PROTOCOL_V2_CAPABILITY
+# @brief Token im JOIN, mit dem ein Client SLCP v2 anmeldet.
+PROTOCOL_V2_CAPABILITY = "v2"
+
+##
+# @var MAGIC
+# @brief Erstes Byte jeder v2-Nachricht.
+MAGIC = 0xB2
+
+JOIN = 1
+LEAVE = 2
+WHO = 3
+ALIVE = 4
+REJOIN = 5
+SYNC = 6
+KNOWNUSERS = 7
+SNAPSHOT = 8
+JOINED = 9
+LEFT = 10
+MSG = 11
+PING = 12
+PONG = 13
+
+##
+# @var COMMANDS
+# @brief Typ-Byte → Befehlsname (wie im Textprotokoll).
+COMMANDS = {
+    JOIN: "JOIN", LEAVE: "LEAVE", WHO: "WHO", ALIVE: "ALIVE", REJOIN: "REJOIN", SYNC: "SYNC",
+    KNOWNUSERS: "KNOWNUSERS", SNAPSHOT: "SNAPSHOT", JOINED: "JOINED", LEFT: "LEFT", MSG: "MSG",
+    PING: "PING", PONG: "PONG",
+}
+
+##
+# @var CAPABILITY_FLAGS
+# @brief Fähigkeiten, die in Listeneinträgen als Bits übertragen werden.
+CAPABILITY_FLAGS = {"delta": 0x01, PROTOCOL_V2_CAPABILITY: 0x02, "uds": 0x04, "zimg": 0x08, "scaled": 0x10, "imgx": 0x20}
+
+HEADER = struct.Struct("!BB")
+ENTRY_ADDRESS = struct.Struct("!4sHB")
+VERSION = struct.Struct("!I")
+PAGE_HEADER = struct.Struct("!IHHH")
+COUNT = struct.Struct("!H")
+JOIN_PORTS = struct.Struct("!HHB")
+SYNC_HEADER = struct.Struct("!IH")
+PONG_FIELDS = struct.Struct("!III")
+
+##
+# @var IP_CACHE_SIZE
+# @brief Maximale Anzahl zwischengespeicherter IP-Zeichenketten (4 Byte → "a.b.c.d").
+IP_CACHE_SIZE = 4096
+
+# inet_ntoa() ist der teuerste Schritt je Listeneintrag; im LAN wiederholen sich die Adressen
+_ip_names = {}
+
+def _ip_name(raw):
+    name = _ip_names.get(raw)
+    if name is None:
+        if len(_ip_names) >= IP_CACHE_SIZE:
+            _ip_names.clear()
+        name = _ip_names[raw] = socket.inet_ntoa(raw)
+    return name
+
+##
+# @brief Prüft, ob Daten eine v2-Nachricht sind.
+# @param data Empfangene Bytes
+# @return True bei Magic-Byte 0xB2
+def is_v2(data):
+    return len(data) >= HEADER.size and data[0] == MAGIC
+
+##
+# @brief Wandelt Fähigkeiten (Tokens) in Bits um.
+# @param caps Iterierbare Fähigkeiten, z. B. {"delta", "v2"}
+# @return Bitmaske
+def capability_flags(caps):
+    flags = 0
+    for cap in caps:
+        flags |= CAPABILITY_FLAGS.get(cap, 0)
+    return flags
+
+##
+# @brief Wandelt Bits wieder in Fähigkeiten um.
+# @param flags Bitmaske
+# @return Menge von Fähigkeiten
+def capabilities(flags):
+    return {cap for cap, bit in CAPABILITY_FLAGS.items() if flags & bit}
+
+def _name(value):
+    raw = value.encode("utf-8")
+    if len(raw) > 255:
+        raise ValueError(f"Name zu lang: {value!r}")
+    return bytes((len(raw),)) + raw
+
+def _read_name(data, offset):
+    end = offset + 1 + data[offset]
+    if end > len(data):
+        raise ValueError("Nachricht abgeschnitten")
+    return str(data[offset + 1:end], "utf-8"), end
+
+##
+# @brief Kodiert einen Listeneintrag.
+# @param name Handle
+# @param ip IPv4-Adresse (String)
+# @param port TCP-Port
+# @param flags Fähigkeiten-Bits
+# @return Bytes
+def encode_entry(name, ip, port, flags=0):
+    return _name(name) + ENTRY_ADDRESS.pack(socket.inet_aton(ip), port, flags)
+
+def _read_entry(data, offset):
+    name, offset = _read_name(data, offset)
+    ip, port, flags = ENTRY_ADDRESS.unpack_from(data, offset)
+    return (name, _ip_name(ip), port, flags), offset + ENTRY_ADDRESS.size
+
+##
+# @brief Liest Listeneinträge einer v2-Nachricht erst beim Durchlaufen.
+# @param data Nachricht (bytes oder memoryview)
+# @param offset Position des ersten Eintrags
+# @param count Anzahl der Einträge
+# @return Generator über (Name, IP, Port, Fähigkeiten-Bits)
+# @throws ValueError beim Durchlaufen, falls die Nachricht abgeschnitten ist
+def iter_entries(data, offset, count):
+    unpack, size, ip_names = ENTRY_ADDRESS.unpack_from, ENTRY_ADDRESS.size, _ip_names
+    try:
+        for _ in range(count):
+            end = offset + 1 + data[offset]
+            ip, port, flags = unpack(data, end)
+            yield str(data[offset + 1:end], "utf-8"), ip_names.get(ip) or _ip_name(ip), port, flags
+            offset = end + size
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"ungültige SLCP-v2-Nachricht: {e}") from None
+
+##
+# @brief Liest Listeneinträge "<Name> <IP> <Port> ..." einer Textnachricht erst beim Durchlaufen.
+# @param tokens Felder der Nachricht (Bytes)
+# @param start Index des ersten Eintrags
+# @return Generator über (Name, IP, Port, 0); ein unvollständiger Rest wird ignoriert
+def iter_text_entries(tokens, start):
+    fields = iter(tokens[start:])
+    for name, ip, port in zip(fields, fields, fields):
+        yield name.decode(), ip.decode("ascii"), int(port), 0
+
+##
+# @brief JOIN <Handle> <TCP-Port> <UDP-Port> [Fähigkeiten ...]
+def encode_join(handle, tcp_port, udp_port, caps=()):
+    caps = list(caps)
+    return (HEADER.pack(MAGIC, JOIN) + _name(handle) + JOIN_PORTS.pack(tcp_port, udp_port, len(caps))
+            + b"".join(_name(c) for c in caps))
+
+##
+# @brief Nachricht nur mit Handle (LEAVE, ALIVE).
+# @param kind LEAVE oder ALIVE
+# @param handle Handle
+def encode_handle(kind, handle):
+    return HEADER.pack(MAGIC, kind) + _name(handle)
+
+##
+# @brief Nachricht ohne Felder (WHO, REJOIN).
+# @param kind WHO oder REJOIN
+def encode_empty(kind):
+    return HEADER.pack(MAGIC, kind)
+
+##
+# @brief SYNC [<Version> <Seite>,<Seite>,...]
+# @param version Version, zu der Seiten fehlen (None = kompletter Snapshot)
+# @param pages Fehlende Seitennummern
+def encode_sync(version=None, pages=()):
+    if version is None:
+        return HEADER.pack(MAGIC, SYNC)
+    pages = list(pages)
+    return (HEADER.pack(MAGIC, SYNC) + SYNC_HEADER.pack(version, len(pages))
+            + struct.pack(f"!{len(pages)}H", *pages))
+
+##
+# @brief JOINED <Version> <Eintrag>
+# @param binary False: als Text "JOINED <Version> <Name> <IP> <Port>" (ohne Fähigkeiten)
+def encode_joined(version, name, ip, port, flags=0, binary=True):
+    if not binary:
+        return f"JOINED {version} {name} {ip} {port}".encode("utf-8")
+    return HEADER.pack(MAGIC, JOINED) + VERSION.pack(version) + encode_entry(name, ip, port, flags)
+
+##
+# @brief LEFT <Version> <Handle>
+# @param binary False: als Text
+def encode_left(version, name, binary=True):
+    if not binary:
+        return f"LEFT {version} {name}".encode("utf-8")
+    return HEADER.pack(MAGIC, LEFT) + VERSION.pack(version) + _name(name)
+
+##
+# @brief MSG <Absender> <Text>; der Text reicht bis zum Ende der Nachricht.
+# @param binary False: als Text
+def encode_msg(sender, text, binary=True):
+    if not binary:
+        return f"MSG {sender} {text}".encode("utf-8")
+    return HEADER.pack(MAGIC, MSG) + _name(sender) + text.encode("utf-8")
+
+##
+# @brief PING <Nonce>: Erreichbarkeitsprobe an den Discovery-Service.
+# @param nonce Zufallszahl (32 Bit), die im PONG zurückkommt
+# @param binary False: als Text
+def encode_ping(nonce, binary=True):
+    if not binary:
+        return f"PING {nonce}".encode()
+    return HEADER.pack(MAGIC, PING) + VERSION.pack(nonce)
+
+##
+# @brief PONG <Nonce> <Teilnehmer> <Version>: Antwort des Discovery-Service auf PING.
+# @param nonce Nonce aus dem PING
+# @param participants Anzahl angemeldeter Teilnehmer
+# @param version Aktuelle Roster-Version
+# @param binary False: als Text
+def encode_pong(nonce, participants, version, binary=True):
+    if not binary:
+        return f"PONG {nonce} {participants} {version}".encode()
+    return HEADER.pack(MAGIC, PONG) + PONG_FIELDS.pack(nonce, participants, version)
+
+##
+# @brief Verteilt Listeneinträge auf SNAPSHOT- bzw. KNOWNUSERS-Datagramme.
+# @param kind SNAPSHOT oder KNOWNUSERS
+# @param entries Liste von (Name, IP, Port, Fähigkeiten-Bits)
+# @param budget Maximale Größe eines Datagramms in Bytes
+# @param version Roster-Version (nur SNAPSHOT)
+# @param binary False: als Text "KNOWNUSERS <Name> <IP> <Port> ..." bzw.
+#        "SNAPSHOT <Version> <Seite>/<Gesamt> <Name> <IP> <Port> ..."
+# @return Liste von Datagrammen (Bytes), mindestens eines
+def encode_pages(kind, entries, budget, version=0, binary=True):
+    if not binary:
+        return _encode_text_pages(kind, entries, budget, version)
+    header_size = HEADER.size + (PAGE_HEADER.size if kind == SNAPSHOT else COUNT.size)
+    pages, current, size = [], [], header_size
+    for entry in entries:
+        raw = encode_entry(*entry)
+        if current and size + len(raw) > budget:
+            pages.append(current)
+            current, size = [], header_size
+        current.append(raw)
+        size += len(raw)
+    pages.append(current)
+    total = len(pages)
+    result = []
+    for number, page in enumerate(pages, start=1):
+        if kind == SNAPSHOT:
+            head = HEADER.pack(MAGIC, SNAPSHOT) + PAGE_HEADER.pack(version, number, total, len(page))
+        else:
+            head = HEADER.pack(MAGIC, KNOWNUSERS) + COUNT.pack(len(page))
+        result.append(head + b"".join(page))
+    return result
+
+def _encode_text_pages(kind, entries, budget, version):
+    if kind == SNAPSHOT:
+        # Platz für " <Seite>/<Gesamt>" freihalten
+        header_size = len(f"SNAPSHOT {version}") + 16
+    else:
+        header_size = len("KNOWNUSERS")
+    pages, current, size = [], [], header_size
+    for name, ip, port, *_ in entries:
+        raw = f"{name} {ip} {port}".encode("utf-8")
+        if current and size + len(raw) + 1 > budget:
+            pages.append(current)
+            current, size = [], header_size
+        current.append(raw)
+        size += len(raw) + 1
+    pages.append(current)
+    total = len(pages)
+    result = []
+    for number, page in enumerate(pages, start=1):
+        if kind == SNAPSHOT:
+            head = f"SNAPSHOT {version} {number}/{total}".encode()
+        else:
+            head = b"KNOWNUSERS"
+        result.append(b" ".join([head, *page]))
+    return result
+
+def _decode_join(data):
+    handle, offset = _read_name(data, HEADER.size)
+    tcp_port, udp_port, count = JOIN_PORTS.unpack_from(data, offset)
+    offset += JOIN_PORTS.size
+    caps = []
+    for _ in range(count):
+        cap, offset = _read_name(data, offset)
+        caps.append(cap)
+    return "JOIN", handle, tcp_port, udp_port, caps
+
+def _decode_sync(data):
+    if len(data) == HEADER.size:
+        return "SYNC", None, []
+    version, count = SYNC_HEADER.unpack_from(data, HEADER.size)
+    return "SYNC", version, list(struct.unpack_from(f"!{count}H", data, HEADER.size + SYNC_HEADER.size))
+
+def _decode_msg(data):
+    sender, offset = _read_name(data, HEADER.size)
+    return "MSG", sender, str(data[offset:], "utf-8")
+
+def _decode_joined(data):
+    (version,) = VERSION.unpack_from(data, HEADER.size)
+    return "JOINED", version, _read_entry(data, HEADER.size + VERSION.size)[0]
+
+def _decode_left(data):
+    (version,) = VERSION.unpack_from(data, HEADER.size)
+    return "LEFT", version, _read_name(data, HEADER.size + VERSION.size)[0]
+
+def _decode_snapshot(data):
+    version, page, total, count = PAGE_HEADER.unpack_from(data, HEADER.size)
+    return "SNAPSHOT", version, page, total, iter_entries(data, HEADER.size + PAGE_HEADER.size, count)
+
+def _decode_knownusers(data):
+    (count,) = COUNT.unpack_from(data, HEADER.size)
+    return "KNOWNUSERS", iter_entries(data, HEADER.size + COUNT.size, count)
+
+_DECODERS = {
+    JOIN: _decode_join,
+    LEAVE: lambda data: ("LEAVE", _read_name(data, HEADER.size)[0]),
+    ALIVE: lambda data: ("ALIVE", _read_name(data, HEADER.size)[0]),
+    WHO: lambda data: ("WHO",),
+    REJOIN: lambda data: ("REJOIN",),
+    SYNC: _decode_sync,
+    MSG: _decode_msg,
+    JOINED: _decode_joined,
+    LEFT: _decode_left,
+    SNAPSHOT: _decode_snapshot,
+    KNOWNUSERS: _decode_knownusers,
+    PING: lambda data: ("PING", VERSION.unpack_from(data, HEADER.size)[0]),
+    PONG: lambda data: ("PONG", *PONG_FIELDS.unpack_from(data, HEADER.size)),
+}
+
+##
+# @brief Dekodiert eine v2-Nachricht.
+# @param data Empfangene Bytes (bytes oder memoryview)
+# @return Tupel (Befehl, Felder ...), Befehl wie im Textprotokoll:
+#   ("JOIN", Handle, TCP-Port, UDP-Port, [Fähigkeiten]), ("LEAVE", Handle), ("ALIVE", Handle),
+#   ("WHO",), ("REJOIN",), ("SYNC", Version oder None, [Seiten]),
+#   ("KNOWNUSERS", [Einträge]), ("SNAPSHOT", Version, Seite, Gesamt, [Einträge]),
+#   ("JOINED", Version, Eintrag), ("LEFT", Version, Handle), ("MSG", Absender, Text),
+#   ("PING", Nonce), ("PONG", Nonce, Teilnehmer, Version)
+#   mit Eintrag = (Name, IP, Port, Fähigkeiten-Bits); [Einträge] ist ein Generator
+# @throws ValueError bei unbekanntem Typ oder abgeschnittener Nachricht
+#
+# Felder werden per unpack_from an ihrer Position gelesen; es entstehen nur die
+# Zeichenketten der Felder selbst, keine Kopie der Nachricht.
+def decode(data):
+    decoder = _DECODERS.get(data[1]) if len(data) >= HEADER.size and data[0] == MAGIC else None
+    if decoder is None:
+        raise ValueError("keine SLCP-v2-Nachricht")
+    try:
+        return decoder(data)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"ungültige SLCP-v2-Nachricht: {e}") from None
+
+def _parse_text_join(tokens):
+    # JOIN <Handle> <TCP-Port> [<UDP-Port> [Fähigkeiten ...]]
+    if len(tokens) < 3:
+        return None
+    return ("JOIN", tokens[1].decode(), int(tokens[2]), int(tokens[3]) if len(tokens) >= 4 else None,
+            [t.decode() for t in tokens[4:]])
+
+def _parse_text_sync(tokens):
+    # SYNC [<Version> <Seite>,<Seite>,...]
+    if len(tokens) == 3:
+        return "SYNC", int(tokens[1]), [int(p) for p in tokens[2].split(b",") if p]
+    return "SYNC", None, []
+
+def _parse_text_handle(tokens):
+    if len(tokens) < 2:
+        return None
+    return tokens[0].decode(), tokens[1].decode()
+
+def _parse_text_snapshot(tokens):
+    # SNAPSHOT <Version> <Seite>/<Gesamt> <Einträge ...>
+    if len(tokens) < 3:
+        return None
+    page, _, total = tokens[2].partition(b"/")
+    return "SNAPSHOT", int(tokens[1]), int(page), int(total), iter_text_entries(tokens, 3)
+
+def _parse_text_joined(tokens):
+    if len(tokens) < 5:
+        return None
+    return "JOINED", int(tokens[1]), (tokens[2].decode(), tokens[3].decode("ascii"), int(tokens[4]), 0)
+
+def _parse_text_left(tokens):
+    if len(tokens) < 3:
+        return None
+    return "LEFT", int(tokens[1]), tokens[2].decode()
+
+def _parse_text_ping(tokens):
+    if len(tokens) < 2:
+        return None
+    return "PING", int(tokens[1])
+
+def _parse_text_pong(tokens):
+    if len(tokens) < 4:
+        return None
+    return "PONG", int(tokens[1]), int(tokens[2]), int(tokens[3])
+
+_TEXT_PARSERS = {
+    b"JOIN": _parse_text_join,
+    b"LEAVE": _parse_text_handle,
+    b"ALIVE": _parse_text_handle,
+    b"WHO": lambda tokens: ("WHO",),
+    b"REJOIN": lambda tokens: ("REJOIN",),
+    b"SYNC": _parse_text_sync,
+    b"KNOWNUSERS": lambda tokens: ("KNOWNUSERS", iter_text_entries(tokens, 1)),
+    b"SNAPSHOT": _parse_text_snapshot,
+    b"JOINED": _parse_text_joined,
+    b"LEFT": _parse_text_left,
+    b"PING": _parse_text_ping,
+    b"PONG": _parse_text_pong,
+}
+
+##
+# @brief Zerlegt eine Textnachricht (SLCP v1) in dieselbe Form wie decode().
+# @param data Empfangene Bytes
+# @return Tupel (Befehl, Felder ...) oder None bei unbekannter/unvollständiger Nachricht.
+#   Abweichend von v2 ist bei JOIN der UDP-Port None, falls er fehlt (alte Clients
+#   senden nur "JOIN <Handle> <TCP-Port>"), und Einträge tragen Fähigkeiten-Bits 0.
+# @throws ValueError bei nicht numerischen Zahlenfeldern oder ungültigem UTF-8
+#
+# Die Nachricht wird als Bytes zerlegt (kein decode() der ganzen Nachricht);
+# MSG wird höchstens zweimal geteilt, damit der Text unverändert bleibt.
+def parse_text(data):
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if data.startswith(b"MSG"):
+        parts = data.split(None, 2)
+        if len(parts) < 3 or parts[0] != b"MSG":
+            return None
+        return "MSG", parts[1].decode(), parts[2].decode()
+    tokens = data.split()
+    parser = _TEXT_PARSERS.get(tokens[0]) if tokens else None
+    return parser(tokens) if parser else None
+
+##
+# @brief Zerlegt eine empfangene Nachricht, egal ob Text oder SLCP v2.
+# @param data Empfangene Bytes (bytes oder memoryview)
+# @return Wie decode() bzw. parse_text(); None bei unbekannter Textnachricht
+# @throws ValueError bei fehlerhafter Nachricht
+def parse(data):
+    if data and data[0] == MAGIC:
+        return decode(data)
+    return parse_text(data)
@@ -0,0 +1,361 @@
+##
+# @file roster.py
+# @brief Client-seitige Nutzerliste mit versionierten Delta-Updates.
+#
+# Der Discovery-Service nummeriert jede Änderung der Teilnehmerliste und
+# verschickt an Delta-fähige Clients nur noch JOINED-/LEFT-Meldungen.
+# Die Klasse Roster wendet diese Deltas an und erkennt Versionslücken,
+# bei denen der Client mit SYNC einen vollständigen SNAPSHOT anfordern muss.
+#
+# Nachrichten (Discovery → Client):
+# - SNAPSHOT <Version> <Seite>/<Gesamt> <Name1> <IP1> <Port1> ...
+# - JOINED <Version> <Name> <IP> <Port>
+# - LEFT <Version> <Name>
+# - KNOWNUSERS <Name1> <IP1> <Port1> ... (alt, ohne Version)
+#
+# Große Snapshots werden auf mehrere Datagramme (Seiten) verteilt, die jeweils
+# unter MAX_DATAGRAM_PAYLOAD bleiben. Fehlende Seiten fordert der Client gezielt
+# mit "SYNC <Version> <Seite>,<Seite>,..." nach.
+#
+# Clients mit der Fähigkeit "v2" erhalten dieselben Nachrichten binär (siehe
+# protocol.py); handle_datagram() nimmt beide Formate an.
+#
+# Anmeldung: Der Discovery-Service beantwortet JOIN direkt mit der Nutzerliste
+# (SNAPSHOT bzw. KNOWNUSERS). JoinHandshake wiederholt das JOIN mit wachsender
+# Wartezeit, bis diese Bestätigung eintrifft.
+##
+
+import random
+import threading
+import time
+import metrics
+import protocol
+
+##
+# @var DELTA_CAPABILITY
+# @brief Token, das ein Client im JOIN anhängt, um Delta-Updates zu erhalten.
+DELTA_CAPABILITY = "delta"
+
+##
+# @var MAX_DATAGRAM_PAYLOAD
+# @brief Maximale Nutzlast eines Roster-Datagramms in Bytes.
+#
+# Bleibt unter der minimalen IPv6-MTU (1280) bzw. typischer Ethernet-MTU,
+# damit kein Datagramm IP-fragmentiert wird.
+MAX_DATAGRAM_PAYLOAD = 1200
+
+##
+# @var RECV_BUFSIZE
+# @brief Puffergröße für recvfrom(); groß genug für jedes UDP-Datagramm.
+RECV_BUFSIZE = 65535
+
+##
+# @var HEARTBEAT_INTERVAL
+# @brief Sekunden zwischen zwei ALIVE-Lebenszeichen eines Clients an den Discovery-Service.
+#
+# Muss deutlich kleiner sein als die Ablaufzeit (participant_ttl) des Discovery-Service.
+HEARTBEAT_INTERVAL = 10.0
+
+##
+# @var PAGE_TIMEOUT
+# @brief Sekunden ohne neue Seite, bevor fehlende Seiten nachgefordert werden.
+PAGE_TIMEOUT = 0.5
+
+##
+# @var PAGE_RETRIES
+# @brief Anzahl gezielter Nachforderungen, bevor ein kompletter SYNC gesendet wird.
+PAGE_RETRIES = 3
+
+##
+# @var JOIN_TIMEOUT
+# @brief Sekunden bis zur ersten Wiederholung eines unbestätigten JOIN.
+JOIN_TIMEOUT = 0.25
+
+##
+# @var JOIN_MAX_TIMEOUT
+# @brief Obergrenze der Wartezeit zwischen zwei JOIN-Versuchen in Sekunden.
+JOIN_MAX_TIMEOUT = 4.0
+
+##
+# @var JOIN_ACK_EVENTS
+# @brief Roster-Ereignisse, die ein JOIN bestätigen (die Nutzerliste ist unterwegs).
+JOIN_ACK_EVENTS = ("snapshot", "knownusers", "partial")
+
+##
+# @class JoinHandshake
+# @brief Bestätigte Anmeldung beim Discovery-Service.
+#
+# Statt JOIN zu senden und eine feste Zeit auf die Nutzerliste zu warten, sendet
+# der Empfangs-Thread das JOIN selbst und wiederholt es, bis ein Ereignis aus
+# JOIN_ACK_EVENTS eintrifft. Die Wartezeit beginnt bei JOIN_TIMEOUT und
+# verdoppelt sich bis JOIN_MAX_TIMEOUT; jede Wartezeit wird zufällig auf
+# 50–100 % verkürzt (Jitter), damit nach einem Ausfall nicht alle Clients im
+# selben Takt wiederholen. Im LAN ist die Liste nach einer Round-Trip-Zeit da.
+#
+# Nicht threadsicher: due(), wait_time() und acknowledge() gehören in den
+# Empfangs-Thread; andere Threads warten höchstens auf acknowledged.
+#
+class JoinHandshake:
+    ##
+    # @brief Konstruktor.
+    # @param message JOIN-Nachricht (String)
+    # @param timeout Erste Wartezeit in Sekunden
+    # @param max_timeout Obergrenze der Wartezeit in Sekunden
+    def __init__(self, message, timeout=JOIN_TIMEOUT, max_timeout=JOIN_MAX_TIMEOUT):
+        self.message = message
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        ##
+        # @var acknowledged
+        # @brief Wird gesetzt, sobald die Nutzerliste eingetroffen ist
+        self.acknowledged = threading.Event()
+        self.restart()
+
+    ##
+    # @brief Beginnt eine neue Anmeldung (beim Start und nach REJOIN).
+    def restart(self):
+        self.acknowledged.clear()
+        self.attempts = 0
+        self.started = time.monotonic()
+        self.timer = metrics.now()
+        self.deadline = self.started
+
+    ##
+    # @brief Liefert das JOIN, falls (erneut) gesendet werden muss.
+    # @return JOIN-Nachricht oder None
+    def due(self):
+        if self.acknowledged.is_set():
+            return None
+        now = time.monotonic()
+        if now < self.deadline:
+            return None
+        wait = min(self.timeout * 2 ** self.attempts, self.max_timeout)
+        self.attempts += 1
+        self.deadline = now + random.uniform(wait / 2, wait)
+        return self.message
+
+    ##
+    # @brief Sekunden bis zur nächsten fälligen Wiederholung, höchstens limit.
+    # @param limit Obergrenze (z. B. Socket-Timeout für Seiten und Lebenszeichen)
+    # @return Wartezeit für recvfrom() (immer > 0)
+    def wait_time(self, limit):
+        if self.acknowledged.is_set():
+            return limit
+        return max(0.01, min(limit, self.deadline - time.monotonic()))
+
+    ##
+    # @brief Wertet ein Roster-Ereignis aus und schließt die Anmeldung ggf. ab.
+    # @param event Ereignis aus Roster.handle_message()
+    # @return Sekunden seit Beginn der Anmeldung, falls dieses Ereignis sie bestätigt, sonst None
+    def acknowledge(self, event):
+        if event not in JOIN_ACK_EVENTS or self.acknowledged.is_set():
+            return None
+        self.acknowledged.set()
+        metrics.since("client.join_seconds", self.timer)
+        metrics.inc("client.join_attempts", self.attempts)
+        return time.monotonic() - self.started
+
+##
+# @class Roster
+# @brief Versionierte Nutzerliste eines Clients.
+#
+# Arbeitet direkt auf einem übergebenen Dictionary (Name → (IP, Port)),
+# damit bestehender Code (z. B. bekannte_nutzer, known_users) weiter funktioniert.
+# Der eigene Handle wird nie eingetragen oder entfernt.
+#
+class Roster:
+    ##
+    # @brief Konstruktor.
+    # @param handle Eigener Handle
+    # @param users Dictionary, das aktualisiert werden soll (Name → (IP, Port))
+    # @param caps Dictionary, das die Fähigkeiten-Bits der Nutzer aufnimmt (Name → Bits, nur SLCP v2)
+    def __init__(self, handle, users=None, caps=None):
+        self.handle = handle
+        self.users = users if users is not None else {}
+        self.caps = caps if caps is not None else {}
+        ##
+        # @var version
+        # @brief Zuletzt angewendete Roster-Version (None = noch kein SNAPSHOT)
+        self.version = None
+        ##
+        # @var pending
+        # @brief Unvollständiger Snapshot: Version, Gesamtzahl, Seiten, letzte Seite, Versuche
+        self.pending = None
+        ##
+        # @var deferred
+        # @brief Deltas, die während eines unvollständigen Snapshots eintreffen
+        self.deferred = []
+        ##
+        # @var resync
+        # @brief SYNC-Anfrage nach einer Lücke in den zurückgestellten Deltas (liefert poll())
+        self.resync = None
+        self.lock = threading.Lock()
+
+    ##
+    # @brief Wertet ein empfangenes Discovery-Datagramm aus (Text oder SLCP v2).
+    # @param data Empfangene Bytes
+    # @return Tupel (Ereignis, Namen) oder None, falls keine Roster-Nachricht.
+    # @throws ValueError bei fehlerhafter Nachricht
+    #
+    # Ereignisse: "snapshot", "knownusers", "joined", "left", "partial" (Seite eines
+    # noch unvollständigen Snapshots), "stale" (veraltet, ignoriert),
+    # "gap" (Lücke erkannt → SYNC senden) und "rejoin" (Discovery kennt uns nicht → JOIN senden).
+    def handle_datagram(self, data):
+        return self.handle_message(protocol.parse(data))
+
+    ##
+    # @brief Wertet eine bereits zerlegte Discovery-Nachricht aus.
+    # @param message Ergebnis von protocol.parse() (oder None)
+    # @return Wie handle_datagram()
+    def handle_message(self, message):
+        if message is None:
+            return None
+        kind = message[0]
+        if kind == "REJOIN":
+            return "rejoin", []
+        if kind == "KNOWNUSERS":
+            return "knownusers", self.merge(message[1])
+        if kind == "SNAPSHOT":
+            version, page, total, entries = message[1:]
+            return self.add_page(version, page, total, list(entries))
+        if kind == "JOINED":
+            name, ip, port, flags = message[2]
+            return self.apply_delta(message[1], name, (ip, port), flags)
+        if kind == "LEFT":
+            return self.apply_delta(message[1], message[2], None)
+        return None
+
+    ##
+    # @brief Prüft, ob ein Nutzer eine Fähigkeit angemeldet hat (nur über SLCP v2 bekannt).
+    # @param name Nutzer
+    # @param cap Fähigkeit, z. B. "v2"
+    # @return True, falls bekannt und angemeldet
+    def supports(self, name, cap):
+        return bool(self.caps.get(name, 0) & protocol.CAPABILITY_FLAGS.get(cap, 0))
+
+    ##
+    # @brief Übernimmt eine alte KNOWNUSERS-Liste (ohne Version) additiv.
+    # @param entries Iterierbare (Name, IP, Port[, Fähigkeiten-Bits])
+    # @return Namen der übernommenen Nutzer
+    def merge(self, entries):
+        names = []
+        with self.lock:
+            for name, ip, port, *flags in entries:
+                if name != self.handle:
+                    self.users[name] = (ip, port)
+                    self.caps[name] = flags[0] if flags else 0
+                    names.append(name)
+        return names
+
+    ##
+    # @brief Nimmt eine Seite eines Snapshots entgegen und setzt ihn ggf. zusammen.
+    # @param version Roster-Version des Snapshots
+    # @param page Seitennummer (1-basiert)
+    # @param total Gesamtzahl der Seiten
+    # @param entries Einträge dieser Seite
+    # @return Tupel (Ereignis, Namen)
+    def add_page(self, version, page, total, entries):
+        with self.lock:
+            if self.version is not None and version < self.version:
+                return "stale", []
+            if self.pending is None or self.pending["version"] < version:
+                self.pending = {"version": version, "total": total, "pages": {},
+                                "last": 0.0, "retries": 0}
+            elif self.pending["version"] > version:
+                return "stale", []
+            self.pending["pages"][page] = entries
+            self.pending["last"] = time.monotonic()
+            if len(self.pending["pages"]) < self.pending["total"]:
+                return "partial", []
+            pages = self.pending["pages"]
+            self.pending = None
+        combined = [e for i in sorted(pages) for e in pages[i]]
+        names = self.apply_snapshot(version, combined)
+        request = self.replay_deferred()
+        if request:
+            with self.lock:
+                self.resync = request
+        return "snapshot", names
+
+    ##
+    # @brief Prüft, ob Seiten eines Snapshots nachgefordert werden müssen.
+    # @return SYNC-Anfrage (String) oder None
+    #
+    # Wird regelmäßig vom Empfangs-Thread aufgerufen (z. B. bei recvfrom-Timeout).
+    # Nach PAGE_RETRIES gezielten Anfragen wird ein kompletter Snapshot angefordert.
+    # Hatten die nach einem Snapshot nachgeholten Deltas eine Lücke, kommt die
+    # SYNC-Anfrage dafür sofort beim nächsten Aufruf.
+    def poll(self):
+        with self.lock:
+            if self.resync is not None:
+                request, self.resync = self.resync, None
+                return request
+            if self.pending is None or time.monotonic() - self.pending["last"] < PAGE_TIMEOUT:
+                return None
+            self.pending["last"] = time.monotonic()
+            self.pending["retries"] += 1
+            if self.pending["retries"] > PAGE_RETRIES:
+                self.pending = None
+                return "SYNC"
+            missing = [str(i) for i in range(1, self.pending["total"] + 1)
+                       if i not in self.pending["pages"]]
+            return f"SYNC {self.pending['version']} {','.join(missing)}"
+
+    ##
+    # @brief Wendet zurückgestellte Deltas nach einem Snapshot in Versionsreihenfolge an.
+    # @return "SYNC", falls dabei eine Versionslücke auftrat, sonst None
+    def replay_deferred(self):
+        with self.lock:
+            deferred, self.deferred = sorted(self.deferred, key=lambda d: d[0]), []
+        events = [self.apply_delta(version, name, address, flags)[0]
+                  for version, name, address, flags in deferred]
+        return "SYNC" if "gap" in events else None
+
+    ##
+    # @brief Ersetzt die Liste durch einen vollständigen SNAPSHOT.
+    # @param version Roster-Version des Snapshots
+    # @param entries Liste von (Name, IP, Port[, Fähigkeiten-Bits])
+    # @return Namen aller Nutzer im Snapshot (ohne eigenen Handle)
+    def apply_snapshot(self, version, entries):
+        with self.lock:
+            if self.version is not None and version < self.version:
+                return []
+            fresh = {}
+            for name, ip, port, *flags in entries:
+                if name != self.handle:
+                    fresh[name] = (ip, port)
+                    self.caps[name] = flags[0] if flags else 0
+            for name in list(self.users):
+                if name != self.handle and name not in fresh:
+                    del self.users[name]
+                    self.caps.pop(name, None)
+            self.users.update(fresh)
+            self.version = version
+            return list(fresh)
+
+    ##
+    # @brief Wendet ein JOINED-/LEFT-Delta an, falls es genau die nächste Version ist.
+    # @param version Version nach diesem Delta
+    # @param name Betroffener Nutzer
+    # @param address (IP, Port) bei JOINED, None bei LEFT
+    # @param flags Fähigkeiten-Bits des Nutzers (nur SLCP v2)
+    # @return Tupel (Ereignis, [Name])
+    def apply_delta(self, version, name, address, flags=0):
+        with self.lock:
+            if self.version is not None and version <= self.version:
+                return "stale", [name]
+            if self.pending is not None:
+                # Snapshot wird gerade zusammengesetzt: Delta danach anwenden
+                self.deferred.append((version, name, address, flags))
+                return "partial", [name]
+            if self.version is None or version != self.version + 1:
+                return "gap", [name]
+            self.version = version
+            if name != self.handle:
+                if address is None:
+                    self.users.pop(name, None)
+                    self.caps.pop(name, None)
+                else:
+                    self.users[name] = address
+                    self.caps[name] = flags
+        return ("joined" if address is not None else "left"), [name]
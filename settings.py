@@ -0,0 +1,82 @@
+##
+# @file settings.py
+# @brief Laden der Konfiguration (config.toml) mit Zwischenspeicher.
+#
+# Die TOML-Datei wird pro Prozess nur einmal gelesen. Zusätzlich legt
+# load_config() das Ergebnis als marshal-Datei unter __pycache__/ neben der
+# Konfiguration ab. Solange sich config.toml nicht ändert (mtime und Größe),
+# liest der nächste Start nur diese Datei und importiert keinen TOML-Parser.
+#
+# Bewusst ohne Abhängigkeiten zu den Netzwerk-Modulen, damit main.py die
+# Konfiguration lesen kann, bevor feststeht, ob CLI oder GUI startet.
+##
+
+import marshal
+import os
+
+##
+# @var CACHE_DIR
+# @brief Unterverzeichnis (neben config.toml) für die zwischengespeicherte Konfiguration.
+CACHE_DIR = "__pycache__"
+
+_loaded = {}
+
+##
+# @brief Liest eine TOML-Datei mit tomllib (ab Python 3.11) oder dem Paket toml.
+# @param path Absoluter Pfad
+# @return Dictionary
+def parse_toml(path):
+    try:
+        import tomllib
+    except ImportError:
+        import toml
+        return toml.load(path)
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+##
+# @brief Pfad der zwischengespeicherten Fassung einer Konfigurationsdatei.
+# @param path Absoluter Pfad der TOML-Datei
+def cache_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, CACHE_DIR, name + ".marshal")
+
+def _read_cache(path, key):
+    try:
+        with open(cache_path(path), "rb") as f:
+            cached_key, config = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return config if cached_key == key else None
+
+def _write_cache(path, key, config):
+    target = cache_path(path)
+    try:
+        data = marshal.dumps((key, config))
+    except ValueError:
+        return  # z. B. TOML-Datumswerte, die marshal nicht kennt: nur im Speicher halten
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        part = f"{target}.{os.getpid()}.part"
+        with open(part, "wb") as f:
+            f.write(data)
+        os.replace(part, target)
+    except OSError:
+        pass  # schreibgeschütztes Verzeichnis: Cache ist optional
+
+##
+# @brief Lädt die Konfiguration aus einer TOML-Datei.
+# @param path Pfad zur TOML-Datei (Default: "config.toml").
+# @return Dictionary mit Konfigurationsdaten (flache Kopie; Schlüssel dürfen überschrieben werden).
+def load_config(path="config.toml"):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    known = _loaded.get(path)
+    if known is None or known[0] != key:
+        config = _read_cache(path, key)
+        if config is None:
+            config = parse_toml(path)
+            _write_cache(path, key, config)
+        known = _loaded[path] = (key, config)
+    return dict(known[1])
@@ -0,0 +1,206 @@
+##
+# @file thumbnails.py
+# @brief Vorschaubilder im Hintergrund erzeugen und nach Inhalt zwischenspeichern.
+#
+# Das Dekodieren großer Fotos dauert spürbar und darf nicht im Tk-Hauptthread
+# laufen. ThumbnailCache erzeugt die Vorschaubilder in einem Thread-Pool und
+# merkt sie sich zweistufig:
+# - im Speicher (LRU, fertige PIL-Bilder)
+# - auf der Platte als PNG unter <cache_dir>/<xx>/<sha256>.png
+#
+# Schlüssel ist der SHA-256 des Dateiinhalts, daher treffen auch umbenannte oder
+# doppelt empfangene Bilder den Cache. JPEGs werden per draft() bereits beim
+# Dekodieren verkleinert (DCT-Skalierung), statt sie in voller Auflösung zu laden.
+# PIL wird erst beim ersten Bild importiert, nicht schon beim Start der GUI.
+##
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+##
+# @var THUMBNAIL_SIZE
+# @brief Maximale Breite und Höhe eines Vorschaubildes in Pixeln.
+THUMBNAIL_SIZE = (300, 300)
+
+##
+# @var THUMBNAIL_WORKERS
+# @brief Anzahl der Threads, die parallel Bilder dekodieren.
+THUMBNAIL_WORKERS = 2
+
+##
+# @var MEMORY_CACHE_SIZE
+# @brief Anzahl der Vorschaubilder, die im Speicher gehalten werden.
+MEMORY_CACHE_SIZE = 64
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+##
+# @brief Berechnet den SHA-256 einer Datei, ohne sie komplett in den Speicher zu laden.
+# @param path Pfad der Datei
+# @return Hexadezimaler Hashwert
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+##
+# @brief Dekodiert ein Bild und verkleinert es auf höchstens size.
+# @param path Pfad des Bildes
+# @param size (Breite, Höhe)
+# @return PIL-Bild (RGB oder RGBA)
+def make_thumbnail(path, size=THUMBNAIL_SIZE):
+    from PIL import Image
+    with Image.open(path) as img:
+        if img.format == "JPEG":
+            # JPEG-Decoder direkt in reduzierter Auflösung arbeiten lassen
+            img.draft("RGB", size)
+        img.thumbnail(size)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        img.load()
+        return img
+
+##
+# @brief Verkleinert ein Bild zum Versenden und kodiert es neu.
+# @param path Pfad des Bildes
+# @param max_size Maximale Breite und Höhe in Pixeln
+# @param quality JPEG-Qualität (1–95)
+# @return Kodierte Bilddaten (bytes) oder None, falls das Original bereits passt
+#         oder die neue Fassung nicht kleiner wäre
+#
+# Bilder ohne Transparenz werden als JPEG kodiert, sonst als PNG.
+def shrink_image(path, max_size, quality=85):
+    import io
+    from PIL import Image
+    with Image.open(path) as img:
+        if max(img.size) <= max_size:
+            return None
+        if img.format == "JPEG":
+            img.draft("RGB", (max_size, max_size))
+        img.thumbnail((max_size, max_size), Image.LANCZOS)
+        out = io.BytesIO()
+        if img.mode in ("RGBA", "LA") or "transparency" in img.info:
+            img.save(out, "PNG", optimize=True)
+        else:
+            img.convert("RGB").save(out, "JPEG", quality=quality, optimize=True)
+    data = out.getvalue()
+    return data if len(data) < os.path.getsize(path) else None
+
+##
+# @class ThumbnailCache
+# @brief Thread-Pool für Vorschaubilder mit Speicher- und Platten-Cache.
+#
+class ThumbnailCache:
+    ##
+    # @brief Konstruktor.
+    # @param cache_dir Verzeichnis für die PNG-Vorschaubilder
+    # @param size Maximale Größe eines Vorschaubildes
+    # @param workers Anzahl der Dekodier-Threads
+    # @param memory_size Anzahl der Vorschaubilder im Speicher-Cache
+    def __init__(self, cache_dir, size=THUMBNAIL_SIZE, workers=THUMBNAIL_WORKERS, memory_size=MEMORY_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        # Pfad → (mtime, Größe, Hash), damit bekannte Dateien nicht erneut gehasht werden
+        self.digests = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    ##
+    # @brief Liefert den Inhalts-Hash einer Datei (zwischengespeichert nach mtime und Größe).
+    # @param path Pfad des Bildes
+    # @return Hexadezimaler SHA-256
+    def digest(self, path):
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            known = self.digests.get(path)
+        if known and known[0] == key:
+            return known[1]
+        digest = content_hash(path)
+        with self.lock:
+            self.digests[path] = (key, digest)
+        return digest
+
+    ##
+    # @brief Pfad des Vorschaubildes auf der Platte.
+    # @param digest Inhalts-Hash
+    def disk_path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest + ".png")
+
+    ##
+    # @brief Holt ein Vorschaubild aus dem Speicher-Cache.
+    # @param path Pfad des Bildes
+    # @return PIL-Bild oder None (nicht im Speicher oder Datei seit dem Hashen verändert)
+    #
+    # Führt keine Datei-I/O außer stat() aus und darf im Tk-Hauptthread laufen.
+    def cached(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            known = self.digests.get(path)
+            if not known or known[0] != (stat.st_mtime_ns, stat.st_size):
+                return None
+            img = self.memory.get(known[1])
+            if img is not None:
+                self.memory.move_to_end(known[1])
+            return img
+
+    ##
+    # @brief Erzeugt bzw. lädt ein Vorschaubild (blockierend, läuft im Worker).
+    # @param path Pfad des Bildes
+    # @return PIL-Bild
+    def load(self, path):
+        digest = self.digest(path)
+        with self.lock:
+            img = self.memory.get(digest)
+            if img is not None:
+                self.memory.move_to_end(digest)
+                return img
+        thumb_path = self.disk_path(digest)
+        from PIL import Image
+        try:
+            with Image.open(thumb_path) as cached:
+                cached.load()
+                img = cached.copy()
+        except (OSError, ValueError):
+            img = make_thumbnail(path, self.size)
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            part = thumb_path + ".part"
+            img.save(part, "PNG")
+            os.replace(part, thumb_path)
+        with self.lock:
+            self.memory[digest] = img
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+        return img
+
+    ##
+    # @brief Fordert ein Vorschaubild im Hintergrund an.
+    # @param path Pfad des Bildes
+    # @param callback Funktion(path, Bild, Fehler); wird im Worker-Thread aufgerufen,
+    #        bei Erfolg ist Fehler None, sonst Bild None
+    # @return Future der Anfrage
+    def request(self, path, callback):
+        def run():
+            try:
+                img = self.load(path)
+            except Exception as e:
+                callback(path, None, e)
+                return
+            callback(path, img, None)
+        return self.executor.submit(run)
+
+    ##
+    # @brief Beendet den Thread-Pool (laufende Aufträge werden verworfen).
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)